@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+
+BENCHMARK_ENV = {
+    'NAS_LIMIT': '30',
+    'NAS_GACHA_COST': '10',
+    'GACHA_WIN_RATE': '0.1',
+    'GACHA_REVEAL_DELAY': '0',
+    'PUBLIC_NAS_CHANNEL_ID': 'bench_channel',
+    'SLACK_BOT_USER_ACCESS_TOKEN': 'bench_bot_token',
+    'SLACK_OAUTH_ACCESS_TOKEN': 'bench_oauth_token',
+    'SLACK_USER_DIRECTORY_PATH': os.path.join(tempfile.gettempdir(), 'bench_slack_user_directory.json'),
+    'STAMP_CONFIG_PATH': os.path.join(ROOT_DIR, 'stamp_config.ini'),
+    'PRIZE_CONFIG_PATH': os.path.join(ROOT_DIR, 'prize_config.ini'),
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+    'AWS_ACCESS_KEY_ID': 'bench',
+    'AWS_SECRET_ACCESS_KEY': 'bench'
+}
+
+# (name, command, text). The text is formatted with the name of the other user.
+BENCHMARK_COMMANDS = [
+    ('/nas_st', '/nas_st', ''),
+    ('/nas_rank', '/nas_rank', ''),
+    ('/nas_gacha_status', '/nas_gacha_status', ''),
+    ('/nas_gacha_tickets', '/nas_gacha_tickets', ''),
+    ('/nas', '/nas', '@{0} thanks'),
+    ('reaction', '/nas_stamp', ''),
+    ('/nas_gacha', '/nas_gacha', ''),
+    ('/use_nas_gacha_ticket', '/use_nas_gacha_ticket', 'prize_1')
+]
+
+TABLE_DEFINITIONS = [
+    {
+        'TableName': 'NAS',
+        'KeySchema': [('tip_user_id', 'S', 'HASH'), ('time_stamp', 'N', 'RANGE')],
+        'GlobalSecondaryIndexes': [('week_id-index', [('week_id', 'S', 'HASH'), ('time_stamp', 'N', 'RANGE')])]
+    },
+    {'TableName': 'NAS_GACHA', 'KeySchema': [('user_id', 'S', 'HASH')]},
+    {'TableName': 'NAS_GACHA_HISTORY', 'KeySchema': [('user_id', 'S', 'HASH'), ('time_stamp', 'N', 'RANGE')]},
+    {'TableName': 'NAS_WEEKLY_COUNTER', 'KeySchema': [('user_id', 'S', 'HASH'), ('week_id', 'S', 'RANGE')]},
+    {
+        'TableName': 'NAS_LEADERBOARD',
+        'KeySchema': [('team_week', 'S', 'HASH'), ('receive_user_id', 'S', 'RANGE')],
+        'LocalSecondaryIndexes': [('receive_nas_num-index', [('team_week', 'S', 'HASH'), ('receive_nas_num', 'N', 'RANGE')])]
+    },
+    {'TableName': 'NAS_EVENT_DEDUP', 'KeySchema': [('event_key', 'S', 'HASH')]}
+]
+
+
+def configure_environment(endpoint_url=None):
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    if endpoint_url is None:
+        # moto ignores Segment, so a parallel scan would read every item once per segment
+        os.environ.setdefault('NAS_SCAN_SEGMENTS', '1')
+    else:
+        os.environ.setdefault('DYNAMODB_ENDPOINT_URL', endpoint_url)
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+def create_tables(dynamodb):
+    for definition in TABLE_DEFINITIONS:
+        attributes = {}
+        for name, attribute_type, _ in definition['KeySchema']:
+            attributes[name] = attribute_type
+        create_kwargs = {
+            'TableName': definition['TableName'],
+            'KeySchema': [{'AttributeName': name, 'KeyType': key_type} for name, _, key_type in definition['KeySchema']],
+            'BillingMode': 'PAY_PER_REQUEST'
+        }
+        for index_kind in ['GlobalSecondaryIndexes', 'LocalSecondaryIndexes']:
+            if index_kind not in definition:
+                continue
+            create_kwargs[index_kind] = []
+            for index_name, key_schema in definition[index_kind]:
+                for name, attribute_type, _ in key_schema:
+                    attributes[name] = attribute_type
+                create_kwargs[index_kind].append({
+                    'IndexName': index_name,
+                    'KeySchema': [{'AttributeName': name, 'KeyType': key_type} for name, _, key_type in key_schema],
+                    'Projection': {'ProjectionType': 'ALL'}
+                })
+        create_kwargs['AttributeDefinitions'] = [{'AttributeName': name, 'AttributeType': attribute_type}
+                                                 for name, attribute_type in attributes.items()]
+        dynamodb.create_table(**create_kwargs).wait_until_exists()
+
+
+def delete_tables(dynamodb):
+    existing_table_names = [table.name for table in dynamodb.tables.all()]
+    for definition in TABLE_DEFINITIONS:
+        if definition['TableName'] in existing_table_names:
+            dynamodb.Table(definition['TableName']).delete()
+            dynamodb.Table(definition['TableName']).wait_until_not_exists()
+
+
+def get_user_ids(user_num):
+    return ['bench_user_{0}'.format(i) for i in range(user_num)]
+
+
+def seed_tables(dynamodb, record_num, user_num, week_num, skew, seed):
+    from db import rebuild_leaderboard, rebuild_weekly_counters
+    from week_calendar import get_week_id
+
+    rng = random.Random(seed)
+    user_ids = get_user_ids(user_num)
+    # a few heavy users send and receive most of the NAS. zipf like weights by the rank of the user
+    weights = [1 / (rank + 1) ** skew for rank in range(user_num)]
+    senders = rng.choices(range(user_num), weights, k=record_num)
+    receivers = rng.choices(range(user_num), weights, k=record_num)
+    now = time.time()
+
+    receive_nas_nums = [0] * user_num
+    with dynamodb.Table('NAS').batch_writer() as batch:
+        for sender, receiver in zip(senders, receivers):
+            if receiver == sender:
+                receiver = (receiver + 1) % user_num
+            time_stamp = Decimal(repr(now - rng.random() * week_num * 7 * 24 * 60 * 60))
+            batch.put_item(Item={
+                'tip_user_id': user_ids[sender],
+                'time_stamp': time_stamp,
+                'tip_user_name': user_ids[sender],
+                'receive_user_id': user_ids[receiver],
+                'receive_user_name': user_ids[receiver],
+                'tip_type': 'stamp',
+                'team_id': 'bench_team_id',
+                'week_id': get_week_id(time_stamp)
+            })
+            receive_nas_nums[receiver] += 1
+
+    with dynamodb.Table('NAS_GACHA').batch_writer() as batch:
+        for user_id, receive_nas_num in zip(user_ids, receive_nas_nums):
+            batch.put_item(Item={
+                'user_id': user_id,
+                'time_stamp': Decimal(repr(now)),
+                'has_nas_num': receive_nas_num,
+                'used_nas_num': receive_nas_num // 2,
+                'has_tickets': {'prize_1': 3, 'prize_2': 1},
+                'version': 1
+            })
+
+    # the aggregates are built the way an existing installation builds them
+    rebuild_weekly_counters()
+    rebuild_leaderboard()
+
+
+def create_event(command, user_id, other_user_id, text, event_num):
+    if command == '/nas_stamp':
+        body = {
+            'type': 'event_callback',
+            'team_id': 'bench_team_id',
+            'event_id': 'BenchEv{0}'.format(event_num),
+            'event': {
+                'type': 'reaction_added',
+                'user': user_id,
+                'reaction': 'eggplant',
+                'item_user': other_user_id,
+                'item': {'type': 'message', 'channel': 'bench_channel'}
+            }
+        }
+    else:
+        body = urlencode({
+            'team_id': 'bench_team_id',
+            'channel_id': 'bench_channel',
+            'user_id': user_id,
+            'user_name': user_id,
+            'command': command,
+            'text': text.format(other_user_id),
+            'trigger_id': 'bench_trigger_{0}'.format(event_num),
+            'response_url': 'https://hooks.slack.com/commands/bench'
+        })
+    return {'body': body, 'params': {'header': {}}}
+
+
+class StubSlackResponse:
+    status_code = 200
+    text = '{"ok": true}'
+
+    def json(self):
+        return {'ok': True, 'members': []}
+
+
+def stub_slack(user_num):
+    from user_directory import USER_DIRECTORY
+
+    user_ids = get_user_ids(user_num)
+    USER_DIRECTORY.set_members([{'id': user_id, 'name': user_id} for user_id in user_ids], time.time())
+    USER_DIRECTORY.refreshed_at = time.time()
+    return mock.patch('requests.Session.request', return_value=StubSlackResponse())
+
+
+def measure_command(main_func, metric_lines, capacity_lines, event):
+    from capacity import CAPACITY
+
+    del metric_lines[:]
+    del capacity_lines[:]
+    start = time.perf_counter()
+    main_func(event, None)
+    wall_time = time.perf_counter() - start
+
+    measurement = {'wall_time_ms': wall_time * 1000, 'dynamodb_calls': 0, 'items_read': 0, 'slack_calls': 0,
+                   'read_units': CAPACITY.usage.read_units, 'write_units': CAPACITY.usage.write_units,
+                   'over_budget': sum(1 for line in capacity_lines if line.startswith('WARNING'))}
+    for metric in map(json.loads, metric_lines):
+        if metric['span'].startswith('dynamodb.'):
+            measurement['dynamodb_calls'] += metric['count']
+            measurement['items_read'] += metric['items_read']
+        elif metric['span'].startswith('slack.'):
+            measurement['slack_calls'] += metric['count']
+    return measurement
+
+
+def summarize_measurements(measurements):
+    return {key: round(statistics.median(measurement[key] for measurement in measurements), 3) for key in measurements[0]}
+
+
+def run_commands(user_num, repeat):
+    from capacity import CAPACITY
+    from dynamo import reset_dynamodb
+    from main import main_func
+    from metrics import METRICS
+
+    user_ids = get_user_ids(user_num)
+    # the heaviest user and a user in the middle of the distribution
+    profiles = [('heavy', user_ids[0], user_ids[1]), ('typical', user_ids[user_num // 2], user_ids[0])]
+
+    metric_lines = []
+    capacity_lines = []
+    results = {}
+    event_num = 0
+    with mock.patch.object(METRICS, 'enabled', True), mock.patch.object(METRICS, 'sink', metric_lines.append), \
+            mock.patch.object(CAPACITY, 'enabled', True), mock.patch.object(CAPACITY, 'sink', capacity_lines.append), stub_slack(user_num):
+        # the DynamoDB handles are created again with the metrics and capacity hooks
+        reset_dynamodb()
+        for name, command, text in BENCHMARK_COMMANDS:
+            for profile, user_id, other_user_id in profiles:
+                measurements = []
+                for _ in range(repeat):
+                    event_num += 1
+                    event = create_event(command, user_id, other_user_id, text, event_num)
+                    measurements.append(measure_command(main_func, metric_lines, capacity_lines, event))
+                results['{0}:{1}'.format(name, profile)] = summarize_measurements(measurements)
+    return results
+
+
+def run_size(dynamodb, record_num, user_num, week_num, skew, repeat, seed):
+    from dynamo import reset_dynamodb
+
+    reset_dynamodb()
+    create_tables(dynamodb)
+    seed_start = time.perf_counter()
+    seed_tables(dynamodb, record_num, user_num, week_num, skew, seed)
+    print('seeded {0} records in {1:.1f}s'.format(record_num, time.perf_counter() - seed_start), file=sys.stderr)
+
+    # the gacha draws the same prizes in every run
+    random.seed(seed)
+    return run_commands(user_num, repeat)
+
+
+def run_benchmark(sizes=(10000,), user_num=500, week_num=8, skew=1.1, repeat=3, seed=0, endpoint_url=None):
+    configure_environment(endpoint_url)
+    import boto3
+
+    results = {}
+    for record_num in sizes:
+        if endpoint_url is None:
+            from moto import mock_dynamodb2
+
+            with mock_dynamodb2():
+                results[str(record_num)] = run_size(boto3.resource('dynamodb'), record_num, user_num, week_num, skew, repeat, seed)
+        else:
+            dynamodb = boto3.resource('dynamodb', endpoint_url=endpoint_url)
+            delete_tables(dynamodb)
+            results[str(record_num)] = run_size(dynamodb, record_num, user_num, week_num, skew, repeat, seed)
+            delete_tables(dynamodb)
+
+    return {
+        'meta': {
+            'backend': 'moto' if endpoint_url is None else endpoint_url,
+            'users': user_num,
+            'weeks': week_num,
+            'skew': skew,
+            'repeat': repeat,
+            'seed': seed,
+            'python': platform.python_version(),
+            'created_at': datetime.now().isoformat()
+        },
+        'results': results
+    }
+
+
+def compare_results(baseline, current, tolerance=1.5):
+    # the calls and the items read are deterministic for the same seed. the wall time is allowed some noise.
+    regressions = []
+    for size, commands in current['results'].items():
+        for name, measurement in commands.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            for key in ['dynamodb_calls', 'items_read', 'slack_calls', 'read_units', 'write_units', 'over_budget']:
+                # the baselines of older runs do not have the newer keys
+                if key in base and measurement[key] > base[key]:
+                    regressions.append('{0} {1} {2}: {3} -> {4}'.format(size, name, key, base[key], measurement[key]))
+            if measurement['wall_time_ms'] > base['wall_time_ms'] * tolerance:
+                regressions.append('{0} {1} wall_time_ms: {2} -> {3}'.format(size, name, base['wall_time_ms'], measurement['wall_time_ms']))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='benchmark the commands of main_func against seeded DynamoDB tables')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], help='NAS records to seed. ex) 10000 100000 1000000')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--weeks', type=int, default=8, help='the records are spread over these weeks')
+    parser.add_argument('--skew', type=float, default=1.1, help='zipf exponent of the heavy users')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--endpoint-url', default=None, help='DynamoDB Local. moto is used when omitted')
+    parser.add_argument('--output', default=os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json'))
+    parser.add_argument('--compare', default=None, help='baseline json to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed ratio of the wall time to the baseline')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    benchmark = run_benchmark(args.sizes, args.users, args.weeks, args.skew, args.repeat, args.seed, args.endpoint_url)
+
+    with open(args.output, 'w') as f:
+        json.dump(benchmark, f, indent=2, sort_keys=True)
+    print('wrote {0}'.format(args.output))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), benchmark, args.tolerance)
+        for regression in regressions:
+            print('regression: {0}'.format(regression))
+        sys.exit(1 if regressions else 0)
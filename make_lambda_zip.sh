@@ -4,6 +4,7 @@ rm -rf dist
 mkdir dist  
 cp -r src/* dist
 cp stamp_config.ini dist  
+cp prize_config.ini dist  
 pipenv lock -r > requirements.txt  
 pip install -r requirements.txt -t dist  
 cd dist  
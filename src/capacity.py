@@ -0,0 +1,142 @@
+import os
+import threading
+from typing import NamedTuple, Optional
+
+NAS_CAPACITY_TRACKING = os.environ.get('NAS_CAPACITY_TRACKING', '1') == '1'
+
+# the operations charged in read units. the others are charged in write units.
+READ_OPERATIONS = frozenset(['GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'])
+
+
+class CapacityUsage:
+    __slots__ = ('calls', 'read_units', 'write_units', 'scanned_items', 'returned_items')
+
+    def __init__(self, calls=0, read_units=0.0, write_units=0.0, scanned_items=0, returned_items=0):
+        self.calls = calls
+        self.read_units = read_units
+        self.write_units = write_units
+        self.scanned_items = scanned_items
+        self.returned_items = returned_items
+
+    def add(self, read_units, write_units, scanned_items, returned_items):
+        self.calls += 1
+        self.read_units += read_units
+        self.write_units += write_units
+        self.scanned_items += scanned_items
+        self.returned_items += returned_items
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class CapacityBudget(NamedTuple):
+    # None is no limit
+    calls: Optional[int] = None
+    read_units: Optional[float] = None
+    write_units: Optional[float] = None
+    scanned_items: Optional[int] = None
+
+    def exceeded(self, usage):
+        over_budget = []
+        for name, limit in zip(self._fields, self):
+            if limit is not None and getattr(usage, name) > limit:
+                over_budget.append('{0} {1} > {2}'.format(name, getattr(usage, name), limit))
+        return over_budget
+
+
+def parse_consumed_units(operation, parsed):
+    # a single ConsumedCapacity for the item operations, a list for the batches and the transactions
+    consumed_capacities = parsed.get('ConsumedCapacity', [])
+    if isinstance(consumed_capacities, dict):
+        consumed_capacities = [consumed_capacities]
+
+    read_units = 0.0
+    write_units = 0.0
+    for consumed_capacity in consumed_capacities:
+        if 'ReadCapacityUnits' in consumed_capacity or 'WriteCapacityUnits' in consumed_capacity:
+            read_units += consumed_capacity.get('ReadCapacityUnits', 0.0)
+            write_units += consumed_capacity.get('WriteCapacityUnits', 0.0)
+        elif operation in READ_OPERATIONS:
+            read_units += consumed_capacity.get('CapacityUnits', 0.0)
+        else:
+            write_units += consumed_capacity.get('CapacityUnits', 0.0)
+    return float(read_units), float(write_units)
+
+
+def count_scanned_items(parsed):
+    # (items read, items returned). the filter of a query or a scan drops items after they are read and charged
+    if 'ScannedCount' in parsed:
+        return parsed['ScannedCount'], parsed.get('Count', 0)
+    if 'Item' in parsed:
+        return 1, 1
+    if 'Responses' in parsed:
+        item_num = sum(len(items) for items in parsed['Responses'].values()) if isinstance(parsed['Responses'], dict) else 0
+        return item_num, item_num
+    return 0, 0
+
+
+class CapacityTracker:
+    def __init__(self, enabled=NAS_CAPACITY_TRACKING, sink=print):
+        self.enabled = enabled
+        self.sink = sink
+        self.command = ''
+        self.usage = CapacityUsage()
+        # {table name: CapacityUsage}
+        self.tables = {}
+        # the parallel scan records from its worker threads
+        self.lock = threading.Lock()
+
+    def start(self, command):
+        with self.lock:
+            self.command = command
+            self.usage = CapacityUsage()
+            self.tables = {}
+
+    def record(self, operation, table_name, parsed):
+        read_units, write_units = parse_consumed_units(operation, parsed)
+        scanned_items, returned_items = count_scanned_items(parsed)
+        with self.lock:
+            self.usage.add(read_units, write_units, scanned_items, returned_items)
+            if table_name not in self.tables:
+                self.tables[table_name] = CapacityUsage()
+            self.tables[table_name].add(read_units, write_units, scanned_items, returned_items)
+
+    def finish(self, budget=None):
+        if self.enabled is False:
+            return []
+
+        with self.lock:
+            usage = self.usage
+            tables = sorted(self.tables.items())
+
+        self.sink('capacity {0}: {1} calls, {2:.1f} RCU, {3:.1f} WCU, {4} scanned, {5} returned'.format(
+            self.command, usage.calls, usage.read_units, usage.write_units, usage.scanned_items, usage.returned_items))
+        over_budget = budget.exceeded(usage) if budget is not None else []
+        if len(over_budget) > 0:
+            # the tables show which part of the command went over
+            self.sink('WARNING capacity budget of {0} exceeded: {1} ({2})'.format(
+                self.command, ', '.join(over_budget),
+                ', '.join('{0} {1:.1f} RCU {2:.1f} WCU'.format(table_name, table_usage.read_units, table_usage.write_units)
+                          for table_name, table_usage in tables)))
+        return over_budget
+
+
+CAPACITY = CapacityTracker()
+
+
+def request_consumed_capacity(params, model, context, **kwargs):
+    # every call that can report its consumed capacity does, without changing the calls in db.py
+    if CAPACITY.enabled is True and 'ReturnConsumedCapacity' in model.input_shape.members:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+        # the batches have no TableName, their usage is attributed to the first table in the request
+        context['capacity_table'] = params.get('TableName') or next(iter(params.get('RequestItems', {})), '')
+
+
+def record_consumed_capacity(http_response, parsed, model, context, **kwargs):
+    if 'capacity_table' in context and http_response.status_code < 300:
+        CAPACITY.record(model.name, context['capacity_table'], parsed)
+
+
+def register_capacity_tracking(client):
+    client.meta.events.register('before-parameter-build.dynamodb', request_consumed_capacity)
+    client.meta.events.register('after-call.dynamodb', record_consumed_capacity)
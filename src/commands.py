@@ -0,0 +1,355 @@
+import os
+import time
+from importlib import import_module
+
+from capacity import CapacityBudget
+
+PUBLIC_NAS_CHANNEL_ID = os.environ['PUBLIC_NAS_CHANNEL_ID']
+GACHA_REVEAL_DELAY = int(os.environ.get('GACHA_REVEAL_DELAY', 3))
+# the number of users shown by /nas_rank
+NAS_RANK_SIZE = int(os.environ.get('NAS_RANK_SIZE', 10))
+
+COMMANDS = {}
+
+
+def register(command_class):
+    COMMANDS[command_class.name] = command_class()
+    return command_class
+
+
+def get_command(name):
+    return COMMANDS.get(name)
+
+
+class Command:
+    name = ''
+    # modules imported on the first run of the command, so the other commands do not pay for them
+    dependencies = ()
+    # the DynamoDB usage of one run, checked after every run
+    budget = CapacityBudget()
+
+    def __init__(self):
+        self.loaded = False
+
+    def load(self):
+        if self.loaded is True:
+            return
+
+        start = time.perf_counter()
+        for module_name in self.dependencies:
+            import_module(module_name)
+        self.loaded = True
+        print('cold start {0}: loaded {1} in {2:.3f}s'.format(self.name, ', '.join(self.dependencies), time.perf_counter() - start))
+
+    def run(self, request, reply_channel):
+        self.load()
+        self.handle(request, reply_channel)
+
+    def handle(self, request, reply_channel):
+        raise NotImplementedError
+
+
+def format_nas_status(nas_obj):
+    from nas import NAS_LIMIT
+
+    sended_nas_num = nas_obj.sended_nas_num()
+    remain_nas = NAS_LIMIT - sended_nas_num
+    nas_bonus = nas_obj.nas_bonus()
+    nas_status = nas_obj.nas_status()
+    return "今週の残りnas数: {0}\n先週からのボーナス: {1}\nあなたの残りnasは{2}です.".format(remain_nas, nas_bonus, nas_status)
+
+
+def send_delayed_reply(reply_channel, send_message, delay_seconds):
+    from work_queue import get_work_queue
+
+    # the messages held for the inline response must arrive before the pause, not together with the delayed one
+    reply_channel.flush()
+
+    work_queue = get_work_queue()
+    if work_queue is None:
+        time.sleep(delay_seconds)
+        return reply_channel.send(send_message)
+
+    return work_queue.enqueue({
+        'type': 'reply',
+        'slack_channel_name': reply_channel.slack_channel_name,
+        'dist_user_id': reply_channel.dist_user_id,
+        'response_url': reply_channel.response_url,
+        'text': send_message
+    }, delay_seconds)
+
+
+@register
+class NasMessageCommand(Command):
+    name = '/nas'
+    dependencies = ('nas', 'utils')
+    # the counters, the record, the weekly counter and the leaderboard. the event key is two more writes in every command.
+    budget = CapacityBudget(calls=9, read_units=4, write_units=7, scanned_items=200)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+        from send_message import post_public_message_to_slack
+        from utils import bring_slack_id_from_slack_name
+
+        if len(request.args) == 0:
+            reply_channel.send('使い方: /nas @receive_user_name message')  # for send user
+            return
+
+        receive_user_name = request.args[0].lstrip('@')
+        receive_user_id = bring_slack_id_from_slack_name(receive_user_name)
+
+        # check can send nas message
+        nas_obj = Nas(request.user_id, request.user_name, request.team_id)
+        if nas_obj.chack_self_portrait(receive_user_id) is True:
+            print('self portrait')
+            reply_channel.send('自画自賛乙')  # for send user
+            return
+
+        if nas_obj.check_can_send_nas() is False:
+            print('nas send limit')
+            reply_channel.send('今週はもうnasを送れないよ！')  # for send user
+            return
+
+        if receive_user_id == '':
+            print('the user not exist.')
+            reply_channel.send('そのユーザは存在しないよ！')  # for send user
+            return
+
+        # forming message
+        message = " ".join(request.args[1:])
+
+        # setup slack text
+        send_user_slack_text = "コマンドからnasを送れたよ!\n" + format_nas_status(nas_obj)
+        receive_user_slack_text = "<@{0}> {1}さんからのメッセージです。\n {2}".format(receive_user_name, request.user_name, message)
+
+        # send nas message
+        post_public_message_to_slack(receive_user_slack_text, PUBLIC_NAS_CHANNEL_ID)  # for receive user
+        reply_channel.send(send_user_slack_text)  # for send user
+
+        # create nas record
+        nas_obj.nas_message(receive_user_id, receive_user_name)
+
+
+@register
+class NasStampCommand(Command):
+    name = '/nas_stamp'
+    dependencies = ('stamp_registry', 'nas', 'utils')
+    budget = CapacityBudget(calls=9, read_units=4, write_units=7, scanned_items=200)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+        from send_message import post_private_message_to_slack
+        from stamp_registry import get_stamp
+        from utils import bring_slack_name_from_slack_id
+
+        # most reactions are not nas stamps, so they are dropped before any lookup
+        stamp = get_stamp(request.stamp)
+        if stamp is None:
+            print('this is not nas stamp')
+            return
+
+        nas_user_id = request.user_id
+        nas_user_name = bring_slack_name_from_slack_id(nas_user_id)
+        receive_user_id = request.receive_user_id
+        receive_user_name = bring_slack_name_from_slack_id(receive_user_id)
+
+        nas_obj = Nas(nas_user_id, nas_user_name, request.team_id)
+        if nas_obj.chack_self_portrait(receive_user_id) is True:
+            print('self portrait')
+            reply_channel.send('自画自賛乙')  # for send user
+            return
+
+        if nas_obj.check_can_send_nas() is False:
+            print('nas send limit')
+            reply_channel.send('今週はもうnasを送れないよ！')  # for send user
+            return
+
+        if nas_obj.nas_stamp(receive_user_id, receive_user_name, stamp.name) is False:
+            return
+
+        # setup slack text
+        user_info = {
+            'nas_user_id': nas_user_id,
+            'nas_user_name': nas_user_name,
+            'receive_user_id': receive_user_id,
+            'receive_user_name': receive_user_name
+        }
+        send_user_slack_text = stamp.confirm_message.render(user_info) + "\n" + format_nas_status(nas_obj)
+        receive_user_slack_text = stamp.send_message.render(user_info)
+
+        # send nas message
+        post_private_message_to_slack(receive_user_slack_text, PUBLIC_NAS_CHANNEL_ID, receive_user_id)  # for receive user
+        reply_channel.send(send_user_slack_text)  # for send user
+
+
+@register
+class NasRankCommand(Command):
+    name = '/nas_rank'
+    dependencies = ('utils',)
+    # one page of the leaderboard, or the records of the week without it
+    budget = CapacityBudget(calls=5, read_units=10, write_units=2, scanned_items=1000)
+
+    def handle(self, request, reply_channel):
+        from utils import bring_slack_names_from_slack_ids, count_receive_nas_this_week, find_user_rank, select_top_ranking
+
+        receive_nas_nums = count_receive_nas_this_week(request.team_id)
+        top_ranking = select_top_ranking(receive_nas_nums, NAS_RANK_SIZE)
+        # only the displayed users are looked up
+        user_names = bring_slack_names_from_slack_ids([user_id for _, user_id, _ in top_ranking])
+
+        # setup slack text for send user
+        rank_lines = ["今週のnasランキング\n順位 ユーザ名 貰ったnas数\n"]
+        for rank, user_id, receive_nas in top_ranking:
+            rank_lines.append("{0}. {1}\t{2}\n".format(rank, user_names.get(user_id) or user_id, receive_nas))
+
+        user_rank, user_receive_nas = find_user_rank(receive_nas_nums, request.user_id)
+        if user_rank is None:
+            rank_lines.append("あなたは今週まだnasを貰っていません\n")
+        else:
+            rank_lines.append("あなたは{0}人中{1}位、貰ったnas数は{2}です\n".format(len(receive_nas_nums), user_rank, user_receive_nas))
+
+        reply_channel.send("".join(rank_lines))  # for send user
+
+
+@register
+class NasStatusCommand(Command):
+    name = '/nas_st'
+    dependencies = ('nas',)
+    budget = CapacityBudget(calls=6, read_units=4, write_units=2, scanned_items=200)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+
+        nas_obj = Nas(request.user_id, request.user_name, request.team_id)
+        reply_channel.send(format_nas_status(nas_obj))  # for send user
+
+
+@register
+class NasGachaCommand(Command):
+    name = '/nas_gacha'
+    dependencies = ('nas', 'gacha', 'work_queue')
+    # the received nas are counted with a scan of the NAS table, so only its read units are limited
+    budget = CapacityBudget(read_units=50, write_units=5)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+
+        nas_obj = Nas(request.user_id, request.user_name, request.team_id)
+        if nas_obj.check_can_run_gacha() is False:
+            print("can't run nas gacha")
+            reply_channel.send('ガチャの残り回数がもう無いよ！もっとnasを貰ってきてね。')  # for send user
+            return
+
+        # /nas_gacha, /nas_gacha 5 or /nas_gacha all
+        available_roll_num = nas_obj.count_nas_gacha_rolls()
+        roll_num = parse_roll_num(request.text, available_roll_num)
+        if roll_num is None:
+            reply_channel.send('回す回数は数字かallで指定してね！')  # for send user
+            return
+        if roll_num > available_roll_num:
+            reply_channel.send('ガチャの残り回数が足りないよ！残りのガチャ回数は{0}回です'.format(available_roll_num))  # for send user
+            return
+
+        reply_channel.send("デュルデュルデュルデュル...")  # for send user
+
+        gacha_results = nas_obj.nas_gacha_rolls(roll_num)
+        if gacha_results is None:
+            reply_channel.send('ガチャに失敗しました。もう一度回してね。')  # for send user
+            return
+
+        # setup slack text for send user
+        remain_nas_gacha = nas_obj.nas_gacha_status()
+        if roll_num > 1:
+            send_user_slack_text = format_gacha_results(gacha_results, remain_nas_gacha)
+        elif gacha_results[0] != '':
+            send_user_slack_text = "ドン！今回の結果はあたりでした！\n当たった景品 {0}\n残りのガチャ回数は{1}回です".format(gacha_results[0], remain_nas_gacha)
+        else:
+            send_user_slack_text = "ドン！今回の結果ははずれでした！\n残りのガチャ回数は{0}回です".format(remain_nas_gacha)
+
+        # the result is already saved, so the pause before the reveal does not need to keep this worker busy
+        send_delayed_reply(reply_channel, send_user_slack_text, GACHA_REVEAL_DELAY)  # for send user
+
+
+def parse_roll_num(text, available_roll_num):
+    words = text.split()
+    if len(words) == 0:
+        return 1
+    if words[0] == 'all':
+        return available_roll_num
+    if words[0].isdigit() is False or int(words[0]) <= 0:
+        return None
+    return int(words[0])
+
+
+def format_gacha_results(gacha_results, remain_nas_gacha):
+    prize_counts = {}
+    for gacha_result in gacha_results:
+        if gacha_result != '':
+            prize_counts[gacha_result] = prize_counts.get(gacha_result, 0) + 1
+
+    hit_num = sum(prize_counts.values())
+    if hit_num == 0:
+        return "ドン！{0}回の結果は全部はずれでした！\n残りのガチャ回数は{1}回です".format(len(gacha_results), remain_nas_gacha)
+
+    prize_lines = ["{0} x{1}\n".format(prize_name, prize_num) for prize_name, prize_num in sorted(prize_counts.items())]
+    return "ドン！{0}回の結果は{1}回あたりでした！\n当たった景品\n{2}残りのガチャ回数は{3}回です".format(
+        len(gacha_results), hit_num, "".join(prize_lines), remain_nas_gacha)
+
+
+@register
+class NasGachaStatusCommand(Command):
+    name = '/nas_gacha_status'
+    dependencies = ('nas',)
+    budget = CapacityBudget(read_units=50, write_units=2)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+
+        nas_obj = Nas(request.user_id, request.user_name, request.team_id)
+        remain_nas_gacha = nas_obj.nas_gacha_status()
+        until_next_time_nas_num = nas_obj.calc_until_next_time_nas_num()
+
+        send_user_slack_text = "残りのガチャ回数は{0}回です\n回せるようになるまで{1}個のnasを受け取る必要があります".format(remain_nas_gacha, until_next_time_nas_num)
+        reply_channel.send(send_user_slack_text)  # for send user
+
+
+@register
+class NasGachaTicketsCommand(Command):
+    name = '/nas_gacha_tickets'
+    dependencies = ('nas',)
+    budget = CapacityBudget(calls=4, read_units=2, write_units=2, scanned_items=1)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+
+        nas_obj = Nas(request.user_id, request.user_name, request.team_id)
+        has_tickets = nas_obj.check_nas_gacha_tickets()
+
+        ticket_lines = ["持っているチケットリスト\n"]
+        for prize_name, has_num in has_tickets.items():
+            ticket_lines.append("{0} : {1} \n".format(prize_name, has_num))
+
+        reply_channel.send("".join(ticket_lines))  # for send user
+
+
+@register
+class UseNasGachaTicketCommand(Command):
+    name = '/use_nas_gacha_ticket'
+    dependencies = ('nas',)
+    budget = CapacityBudget(read_units=50, write_units=5)
+
+    def handle(self, request, reply_channel):
+        from nas import Nas
+
+        if len(request.args) == 0:
+            reply_channel.send('使い方: /use_nas_gacha_ticket prize_name')  # for send user
+            return
+
+        use_ticket = request.args[0]
+        nas_obj = Nas(request.user_id, request.user_name, request.team_id)
+
+        if nas_obj.use_nas_gacha_tickets(use_ticket) is False:
+            reply_channel.send("チケットの消費に失敗しました。")  # for send user
+            return
+
+        reply_channel.send("{0}のチケットを消費しました！".format(use_ticket))  # for send user
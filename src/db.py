@@ -1,61 +1,292 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from decimal import Decimal
+from queue import Queue
 
-import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
+from dynamo import get_table
+from metrics import timed
+from week_calendar import get_week_id
 
-def load_send_nas_num(user_id, ref_timestamp):
+NAS_SCAN_SEGMENTS = int(os.environ.get('NAS_SCAN_SEGMENTS', 4))
+# kept at module level so that warm invocations reuse the worker threads and their DynamoDB handles
+SCAN_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('NAS_SCAN_MAX_WORKERS', 8)))
+
+
+@timed('db.load_send_nas_num')
+def load_send_nas_num(user_id, start_timestamp, end_timestamp=None):
     try:
-        dynamoDB = boto3.resource('dynamodb')
-        table = dynamoDB.Table('NAS')
+        table = get_table('NAS')
 
-        send_nas_data_this_week = table.query(
-            KeyConditionExpression=Key('tip_user_id').eq(user_id) & Key('time_stamp').gt(ref_timestamp)
-        )
-        send_nas_num = send_nas_data_this_week['Count']
+        if end_timestamp is None:
+            key_condition = Key('tip_user_id').eq(user_id) & Key('time_stamp').gte(start_timestamp)
+        else:
+            # between is inclusive, so step back one microsecond to keep the window [start, end)
+            key_condition = Key('tip_user_id').eq(user_id) & \
+                Key('time_stamp').between(start_timestamp, end_timestamp - Decimal('0.000001'))
+
+        response = table.query(KeyConditionExpression=key_condition, Select='COUNT')
+        send_nas_num = response['Count']
+
+        while 'LastEvaluatedKey' in response:
+            response = table.query(
+                KeyConditionExpression=key_condition,
+                Select='COUNT',
+                ExclusiveStartKey=response['LastEvaluatedKey']
+            )
+            send_nas_num += response['Count']
         return send_nas_num
     except Exception as e:
         print(e)
         return 0
 
 
-def scan_nas_records(ref_timestamp):
+@timed('db.scan_nas_records')
+def scan_nas_records(ref_timestamp, total_segments=NAS_SCAN_SEGMENTS):
     try:
-        dynamoDB = boto3.resource('dynamodb')
-        table = dynamoDB.Table('NAS')
+        return list(iter_nas_records(ref_timestamp, total_segments))
+    except Exception as e:
+        print(e)
+        return []
 
-        response = table.scan(
-            FilterExpression=Key('time_stamp').gt(ref_timestamp)
-        )
+
+def iter_nas_records(ref_timestamp, total_segments=NAS_SCAN_SEGMENTS):
+    pages = iter_scan_pages('NAS', total_segments, FilterExpression=Key('time_stamp').gt(ref_timestamp))
+    for response in pages:
+        for nas_record in response['Items']:
+            yield nas_record
+
+
+@timed('db.load_week_nas_records')
+def load_week_nas_records(week_id):
+    try:
+        table = get_table('NAS')
+
+        # the records of a week are one partition of week_id-index, so they are read without a scan
+        query_kwargs = {
+            'IndexName': 'week_id-index',
+            'KeyConditionExpression': Key('week_id').eq(week_id)
+        }
+        response = table.query(**query_kwargs)
         nas_records = response['Items']
 
         while 'LastEvaluatedKey' in response:
-            response = table.scan(
-                FilterExpression=Key('time_stamp').gt(ref_timestamp),
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
+            response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query_kwargs)
             nas_records.extend(response['Items'])
+
         return nas_records
     except Exception as e:
         print(e)
-        return []
+        return None
 
 
-def create_nas_record(nas_user_id, nas_user_name, receive_user_id, receive_user_name, nas_type, team_id):
+@timed('db.backfill_week_ids')
+def backfill_week_ids(total_segments=NAS_SCAN_SEGMENTS):
     try:
-        dynamoDB = boto3.resource('dynamodb')
-        nas_table = dynamoDB.Table('NAS')
+        table = get_table('NAS')
 
-        nas_table.put_item(
-            Item={
+        # the records created before week_id was added are not in week_id-index
+        backfilled_num = 0
+        for response in iter_scan_pages('NAS', total_segments, FilterExpression=Attr('week_id').not_exists()):
+            for nas_record in response['Items']:
+                table.update_item(
+                    Key={
+                        'tip_user_id': nas_record['tip_user_id'],
+                        'time_stamp': nas_record['time_stamp']
+                    },
+                    UpdateExpression='SET week_id = :week_id',
+                    ExpressionAttributeValues={':week_id': get_week_id(nas_record['time_stamp'])}
+                )
+                backfilled_num += 1
+        return backfilled_num
+    except Exception as e:
+        print(e)
+        return 0
+
+
+def iter_scan_pages(table_name, total_segments, **scan_kwargs):
+    if total_segments <= 1:
+        yield from _scan_segment_pages(table_name, scan_kwargs)
+        return
+
+    # each segment is scanned by a worker thread, and the pages are yielded as soon as they arrive
+    page_queue = Queue()
+    futures = []
+    for segment in range(total_segments):
+        segment_scan_kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+        futures.append(SCAN_EXECUTOR.submit(_put_scan_segment_pages, page_queue, table_name, segment_scan_kwargs))
+
+    finished_segments = 0
+    while finished_segments < total_segments:
+        response = page_queue.get()
+        if response is None:
+            finished_segments += 1
+            continue
+        yield response
+
+    for future in futures:
+        future.result()
+
+
+def _put_scan_segment_pages(page_queue, table_name, scan_kwargs):
+    try:
+        for response in _scan_segment_pages(table_name, scan_kwargs):
+            page_queue.put(response)
+    finally:
+        page_queue.put(None)
+
+
+def _scan_segment_pages(table_name, scan_kwargs):
+    table = get_table(table_name)
+
+    response = table.scan(**scan_kwargs)
+    yield response
+
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_kwargs)
+        yield response
+
+
+@timed('db.create_nas_record')
+def create_nas_record(nas_user_id, nas_user_name, receive_user_id, receive_user_name, nas_type, team_id, nas_num=1):
+    try:
+        nas_table = get_table('NAS')
+
+        time_stamp = Decimal(datetime.now().timestamp())
+        week_id = get_week_id(time_stamp)
+        # every unit needs its own sort key, otherwise the records overwrite each other
+        nas_records = [
+            {
                 'tip_user_id': nas_user_id,
-                'time_stamp': Decimal(datetime.now().timestamp()),
+                'time_stamp': time_stamp + Decimal('0.000001') * i,
                 'tip_user_name': nas_user_name,
                 'receive_user_id': receive_user_id,
                 'receive_user_name': receive_user_name,
                 'tip_type': nas_type,
-                'team_id': team_id
+                'team_id': team_id,
+                'week_id': week_id
+            }
+            for i in range(nas_num)
+        ]
+
+        if nas_num == 1:
+            nas_table.put_item(Item=nas_records[0])
+        else:
+            with nas_table.batch_writer() as batch:
+                for nas_record in nas_records:
+                    batch.put_item(Item=nas_record)
+    except Exception as e:
+        print(e)
+        return False
+
+    # the NAS record is the source of truth, so a failed aggregate update must not fail the send
+    if add_weekly_send_nas_num(nas_user_id, week_id, nas_num) is False:
+        # the counter missed this send, so the week is counted from the records until the counter is rebuilt
+        mark_weekly_send_nas_num_stale(nas_user_id, week_id)
+    add_leaderboard_nas_num(team_id, week_id, receive_user_id, receive_user_name, nas_num)
+    return True
+
+
+@timed('db.add_weekly_send_nas_num')
+def add_weekly_send_nas_num(user_id, week_id, nas_num=1):
+    try:
+        counter_table = get_table('NAS_WEEKLY_COUNTER')
+
+        counter_table.update_item(
+            Key={
+                'user_id': user_id,
+                'week_id': week_id
+            },
+            UpdateExpression='ADD sent_nas_num :nas_num',
+            ExpressionAttributeValues={':nas_num': nas_num}
+        )
+        return True
+    except Exception as e:
+        print(e)
+        return False
+
+
+@timed('db.mark_weekly_send_nas_num_stale')
+def mark_weekly_send_nas_num_stale(user_id, week_id):
+    try:
+        counter_table = get_table('NAS_WEEKLY_COUNTER')
+
+        # the ADD of the next sends keeps the flag, only rebuild_weekly_counters overwrites it
+        counter_table.update_item(
+            Key={
+                'user_id': user_id,
+                'week_id': week_id
+            },
+            UpdateExpression='SET stale = :stale',
+            ExpressionAttributeValues={':stale': True}
+        )
+        return True
+    except Exception as e:
+        print(e)
+        return False
+
+
+@timed('db.load_weekly_send_nas_num')
+def load_weekly_send_nas_num(user_id, week_id):
+    try:
+        counter_table = get_table('NAS_WEEKLY_COUNTER')
+
+        response = counter_table.get_item(
+            Key={
+                'user_id': user_id,
+                'week_id': week_id
+            }
+        )
+        # no counter, or a counter that missed a send
+        if 'Item' not in response or response['Item'].get('stale', False) is True or 'sent_nas_num' not in response['Item']:
+            return None
+        return int(response['Item']['sent_nas_num'])
+    except Exception as e:
+        print(e)
+        return None
+
+
+@timed('db.rebuild_weekly_counters')
+def rebuild_weekly_counters(ref_timestamp=Decimal(0)):
+    try:
+        weekly_send_nas_nums = Counter()
+        for nas_record in scan_nas_records(ref_timestamp):
+            weekly_send_nas_nums[(nas_record['tip_user_id'], get_week_id(nas_record['time_stamp']))] += 1
+
+        counter_table = get_table('NAS_WEEKLY_COUNTER')
+        with counter_table.batch_writer() as batch:
+            for (user_id, week_id), sent_nas_num in weekly_send_nas_nums.items():
+                batch.put_item(
+                    Item={
+                        'user_id': user_id,
+                        'week_id': week_id,
+                        'sent_nas_num': sent_nas_num
+                    }
+                )
+        return len(weekly_send_nas_nums)
+    except Exception as e:
+        print(e)
+        return 0
+
+
+@timed('db.add_leaderboard_nas_num')
+def add_leaderboard_nas_num(team_id, week_id, receive_user_id, receive_user_name, nas_num=1):
+    try:
+        leaderboard_table = get_table('NAS_LEADERBOARD')
+
+        leaderboard_table.update_item(
+            Key={
+                'team_week': '{0}#{1}'.format(team_id, week_id),
+                'receive_user_id': receive_user_id
+            },
+            UpdateExpression='ADD receive_nas_num :nas_num SET receive_user_name = :receive_user_name',
+            ExpressionAttributeValues={
+                ':nas_num': nas_num,
+                ':receive_user_name': receive_user_name
             }
         )
         return True
@@ -64,10 +295,59 @@ def create_nas_record(nas_user_id, nas_user_name, receive_user_id, receive_user_
         return False
 
 
+@timed('db.load_leaderboard')
+def load_leaderboard(team_id, week_id):
+    try:
+        leaderboard_table = get_table('NAS_LEADERBOARD')
+
+        # the local secondary index keeps the receivers of the week sorted by receive_nas_num
+        query_kwargs = {
+            'IndexName': 'receive_nas_num-index',
+            'KeyConditionExpression': Key('team_week').eq('{0}#{1}'.format(team_id, week_id)),
+            'ScanIndexForward': False
+        }
+        response = leaderboard_table.query(**query_kwargs)
+        leaderboard = response['Items']
+
+        while 'LastEvaluatedKey' in response:
+            response = leaderboard_table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query_kwargs)
+            leaderboard.extend(response['Items'])
+        return leaderboard
+    except Exception as e:
+        print(e)
+        return None
+
+
+@timed('db.rebuild_leaderboard')
+def rebuild_leaderboard(ref_timestamp=Decimal(0)):
+    try:
+        leaderboard = {}
+        for nas_record in scan_nas_records(ref_timestamp):
+            team_week = '{0}#{1}'.format(nas_record['team_id'], get_week_id(nas_record['time_stamp']))
+            leaderboard_key = (team_week, nas_record['receive_user_id'])
+            if leaderboard_key not in leaderboard:
+                leaderboard[leaderboard_key] = {
+                    'team_week': team_week,
+                    'receive_user_id': nas_record['receive_user_id'],
+                    'receive_user_name': nas_record['receive_user_name'],
+                    'receive_nas_num': 0
+                }
+            leaderboard[leaderboard_key]['receive_nas_num'] += 1
+
+        leaderboard_table = get_table('NAS_LEADERBOARD')
+        with leaderboard_table.batch_writer() as batch:
+            for leaderboard_item in leaderboard.values():
+                batch.put_item(Item=leaderboard_item)
+        return len(leaderboard)
+    except Exception as e:
+        print(e)
+        return 0
+
+
+@timed('db.scan_user_receive_nas_num')
 def scan_user_receive_nas_num(scan_user_id):
     try:
-        dynamoDB = boto3.resource('dynamodb')
-        table = dynamoDB.Table('NAS')
+        table = get_table('NAS')
 
         response = table.scan(
             FilterExpression=Key('receive_user_id').eq(scan_user_id)
@@ -87,40 +367,141 @@ def scan_user_receive_nas_num(scan_user_id):
         return 0
 
 
+@timed('db.load_latest_nas_gacha_record')
 def load_latest_nas_gacha_record(gacha_user_id):
     try:
-        dynamoDB = boto3.resource('dynamodb')
-        table = dynamoDB.Table('NAS_GACHA')
+        table = get_table('NAS_GACHA')
 
-        nas_gacha_records = table.query(
-            KeyConditionExpression=Key('user_id').eq(gacha_user_id)
-        )
+        # NAS_GACHA keeps only the current state of each user. The past states are in NAS_GACHA_HISTORY.
+        response = table.get_item(Key={'user_id': gacha_user_id})
+        return response.get('Item', {})
+    except Exception as e:
+        print(e)
+        return {}
 
-        latest_nas_record = max(nas_gacha_records["Items"], key=(lambda x: x["time_stamp"]))
-        print(latest_nas_record)
-        print(type(latest_nas_record))
 
-        return latest_nas_record
+@timed('db.create_nas_gacha_record')
+def create_nas_gacha_record(gacha_user_id, time_stamp, has_nas_num, used_nas_num, has_tickets, expected_version=None):
+    try:
+        nas_gacha_table = get_table('NAS_GACHA')
+
+        update_kwargs = {
+            'Key': {'user_id': gacha_user_id},
+            'UpdateExpression': 'SET time_stamp = :time_stamp, has_nas_num = :has_nas_num, used_nas_num = :used_nas_num, '
+                                'has_tickets = :has_tickets ADD version :one',
+            'ExpressionAttributeValues': {
+                ':time_stamp': time_stamp,
+                ':has_nas_num': has_nas_num,
+                ':used_nas_num': used_nas_num,
+                ':has_tickets': has_tickets,
+                ':one': 1
+            },
+            'ReturnValues': 'UPDATED_NEW'
+        }
+        # the write fails if another request has updated the state since it was read
+        if expected_version == 0:
+            update_kwargs['ConditionExpression'] = 'attribute_not_exists(version)'
+        elif expected_version is not None:
+            update_kwargs['ConditionExpression'] = 'version = :expected_version'
+            update_kwargs['ExpressionAttributeValues'][':expected_version'] = expected_version
+
+        response = nas_gacha_table.update_item(**update_kwargs)
+        version = response['Attributes']['version']
     except Exception as e:
         print(e)
-        return {}
+        return False
 
+    create_nas_gacha_history_record(gacha_user_id, time_stamp, has_nas_num, used_nas_num, has_tickets, version)
+    return True
 
-def create_nas_gacha_record(gacha_user_id, time_stamp, has_nas_num, used_nas_num, has_tickets):
+
+@timed('db.create_nas_gacha_history_record')
+def create_nas_gacha_history_record(gacha_user_id, time_stamp, has_nas_num, used_nas_num, has_tickets, version):
     try:
-        dynamoDB = boto3.resource('dynamodb')
-        nas_gacha_table = dynamoDB.Table('NAS_GACHA')
+        history_table = get_table('NAS_GACHA_HISTORY')
 
-        nas_gacha_table.put_item(
+        history_table.put_item(
             Item={
                 'user_id': gacha_user_id,
                 'time_stamp': time_stamp,
                 'has_nas_num': has_nas_num,
                 'used_nas_num': used_nas_num,
-                'has_tickets': has_tickets
+                'has_tickets': has_tickets,
+                'version': version
             }
         )
         return True
     except Exception as e:
         print(e)
         return False
+
+
+@timed('db.load_nas_gacha_history')
+def load_nas_gacha_history(gacha_user_id, limit=10):
+    try:
+        history_table = get_table('NAS_GACHA_HISTORY')
+
+        response = history_table.query(
+            KeyConditionExpression=Key('user_id').eq(gacha_user_id),
+            ScanIndexForward=False,
+            Limit=limit
+        )
+        return response['Items']
+    except Exception as e:
+        print(e)
+        return []
+
+
+@timed('db.create_event_key_record')
+def create_event_key_record(event_key, expire_at, now):
+    try:
+        dedup_table = get_table('NAS_EVENT_DEDUP')
+
+        # expire_at is the TTL attribute. DynamoDB deletes the expired items late, so they are overwritten here.
+        # the key is pending until the command has run
+        dedup_table.put_item(
+            Item={
+                'event_key': event_key,
+                'expire_at': int(expire_at),
+                'event_status': 'pending'
+            },
+            ConditionExpression='attribute_not_exists(event_key) OR expire_at < :now',
+            ExpressionAttributeValues={':now': int(now)}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        print(e)
+        return None
+    except Exception as e:
+        print(e)
+        return None
+
+
+@timed('db.complete_event_key_record')
+def complete_event_key_record(event_key, expire_at):
+    try:
+        dedup_table = get_table('NAS_EVENT_DEDUP')
+
+        dedup_table.update_item(
+            Key={'event_key': event_key},
+            UpdateExpression='SET event_status = :done, expire_at = :expire_at',
+            ExpressionAttributeValues={':done': 'done', ':expire_at': int(expire_at)}
+        )
+        return True
+    except Exception as e:
+        print(e)
+        return False
+
+
+@timed('db.delete_event_key_record')
+def delete_event_key_record(event_key):
+    try:
+        dedup_table = get_table('NAS_EVENT_DEDUP')
+
+        dedup_table.delete_item(Key={'event_key': event_key})
+        return True
+    except Exception as e:
+        print(e)
+        return False
@@ -0,0 +1,73 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from capacity import CAPACITY, register_capacity_tracking
+from metrics import METRICS, register_dynamodb_metrics
+
+DYNAMODB_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', 10)),
+    connect_timeout=float(os.environ.get('DYNAMODB_CONNECT_TIMEOUT', 1)),
+    read_timeout=float(os.environ.get('DYNAMODB_READ_TIMEOUT', 2)),
+    retries={'max_attempts': 3, 'mode': 'standard'},
+    tcp_keepalive=True
+)
+# ex) http://localhost:8000 for DynamoDB Local
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL') or None
+
+# boto3 resources are not thread safe, so each thread keeps its own handles.
+# They live at module level so that warm Lambda invocations reuse them.
+_local = threading.local()
+_override_lock = threading.Lock()
+_override_resource = None
+_override_tables = {}
+_generation = 0
+
+
+def get_dynamodb_resource():
+    if _override_resource is not None:
+        return _override_resource
+
+    resource = getattr(_local, 'resource', None)
+    if resource is None or _local.generation != _generation:
+        resource = boto3.session.Session().resource('dynamodb', config=DYNAMODB_CONFIG, endpoint_url=DYNAMODB_ENDPOINT_URL)
+        if METRICS.enabled is True:
+            register_dynamodb_metrics(resource.meta.client)
+        if CAPACITY.enabled is True:
+            register_capacity_tracking(resource.meta.client)
+        _local.resource = resource
+        _local.tables = {}
+        _local.generation = _generation
+    return resource
+
+
+def get_table(table_name):
+    if table_name in _override_tables:
+        return _override_tables[table_name]
+
+    resource = get_dynamodb_resource()
+    if _override_resource is not None:
+        return resource.Table(table_name)
+
+    table = _local.tables.get(table_name)
+    if table is None:
+        table = resource.Table(table_name)
+        _local.tables[table_name] = table
+    return table
+
+
+def override_dynamodb(resource=None, tables=None):
+    global _override_resource
+    with _override_lock:
+        _override_resource = resource
+        _override_tables.clear()
+        _override_tables.update(tables or {})
+
+
+def reset_dynamodb():
+    global _generation
+    override_dynamodb()
+    with _override_lock:
+        _generation += 1
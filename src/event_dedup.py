@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from db import complete_event_key_record, create_event_key_record, delete_event_key_record
+
+NAS_EVENT_DEDUP_TTL = int(os.environ.get('NAS_EVENT_DEDUP_TTL', 3600))
+# a pending key of a worker that died expires after this, so the redelivery of the event can run
+NAS_EVENT_DEDUP_PENDING_TTL = int(os.environ.get('NAS_EVENT_DEDUP_PENDING_TTL', 300))
+NAS_EVENT_DEDUP_CACHE_SIZE = int(os.environ.get('NAS_EVENT_DEDUP_CACHE_SIZE', 1024))
+
+
+def get_event_key(event):
+    body = event['body']
+    if type(body) is dict:
+        if 'event_id' in body:
+            return 'event:{0}'.format(body['event_id'])
+        body = json.dumps(body, sort_keys=True)
+
+    # a slash command has no id, but its body has a unique trigger_id and response_url, and a retry sends the same body
+    return 'command:{0}'.format(hashlib.sha256(body.encode('utf-8')).hexdigest())
+
+
+class EventDeduplicator:
+    def __init__(self, ttl=NAS_EVENT_DEDUP_TTL, cache_size=NAS_EVENT_DEDUP_CACHE_SIZE, pending_ttl=NAS_EVENT_DEDUP_PENDING_TTL):
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.cache_size = cache_size
+        # the events seen by this container, so that their duplicates do not reach DynamoDB
+        self.recent_event_keys = OrderedDict()
+
+    def claim(self, event_key):
+        now = time.time()
+        expire_at = self.recent_event_keys.get(event_key)
+        if expire_at is not None and expire_at > now:
+            return False
+
+        expire_at = now + self.pending_ttl
+        claimed = create_event_key_record(event_key, expire_at, now)
+        if claimed is None:
+            # the dedup table can not be reached, so process the event rather than lose it
+            return True
+
+        if claimed is True:
+            self.remember(event_key, expire_at)
+        return claimed
+
+    def complete(self, event_key):
+        expire_at = time.time() + self.ttl
+        self.remember(event_key, expire_at)
+        return complete_event_key_record(event_key, expire_at)
+
+    def release(self, event_key):
+        # the command failed, so its redelivery must run it again
+        self.recent_event_keys.pop(event_key, None)
+        return delete_event_key_record(event_key)
+
+    def remember(self, event_key, expire_at):
+        self.recent_event_keys[event_key] = expire_at
+        self.recent_event_keys.move_to_end(event_key)
+        while len(self.recent_event_keys) > self.cache_size:
+            self.recent_event_keys.popitem(last=False)
+
+    def clear(self):
+        self.recent_event_keys.clear()
+
+
+EVENT_DEDUPLICATOR = EventDeduplicator()
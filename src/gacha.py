@@ -1,19 +1,94 @@
 import os
-import numpy as np
+from configparser import ConfigParser
 from random import random
 
 GACHA_WIN_RATE = float(os.environ['GACHA_WIN_RATE'])
+PRIZE_CONFIG_PATH = os.environ.get('PRIZE_CONFIG_PATH', 'prize_config.ini')
+
+
+class Prize:
+    __slots__ = ('name', 'weight', 'rarity')
+
+    def __init__(self, name, weight, rarity):
+        self.name = name
+        self.weight = weight
+        self.rarity = rarity
+
+
+class AliasSampler:
+    # Vose's alias method: O(n) to build, O(1) for each draw
+    def __init__(self, outcomes, weights):
+        if len(outcomes) == 0 or len(outcomes) != len(weights):
+            raise ValueError('outcomes and weights must be non-empty and the same length')
+        total_weight = float(sum(weights))
+        if total_weight <= 0 or min(weights) < 0:
+            raise ValueError('weights must be non-negative and not all zero')
+
+        n = len(outcomes)
+        self.outcomes = list(outcomes)
+        self.probabilities = [0.0] * n
+        self.aliases = [0] * n
+
+        scaled_weights = [weight * n / total_weight for weight in weights]
+        small = [i for i, weight in enumerate(scaled_weights) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled_weights) if weight >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probabilities[less] = scaled_weights[less]
+            self.aliases[less] = more
+            scaled_weights[more] = scaled_weights[more] + scaled_weights[less] - 1.0
+            if scaled_weights[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # what is left is 1.0 up to the rounding error
+        for i in small + large:
+            self.probabilities[i] = 1.0
+
+    def sample(self, rand=random):
+        scaled = rand() * len(self.outcomes)
+        column = min(int(scaled), len(self.outcomes) - 1)
+        if scaled - column < self.probabilities[column]:
+            return self.outcomes[column]
+        return self.outcomes[self.aliases[column]]
+
+
+def load_prize_table(path=PRIZE_CONFIG_PATH):
+    prize_config = ConfigParser()
+    if len(prize_config.read(path)) == 0:
+        raise FileNotFoundError(path)
+
+    prizes = []
+    for prize_name in prize_config.sections():
+        prizes.append(Prize(prize_name, prize_config.getfloat(prize_name, 'weight'), prize_config.get(prize_name, 'rarity', fallback='')))
+    return prizes
+
+
+def compile_prize_sampler(prizes, win_rate):
+    # the miss is one more outcome of the table, so a roll is a single draw
+    prize_weight = sum(prize.weight for prize in prizes)
+    if win_rate <= 0 or prize_weight <= 0:
+        return AliasSampler([''], [1])
+    if win_rate >= 1:
+        return AliasSampler([prize.name for prize in prizes], [prize.weight for prize in prizes])
+
+    miss_weight = prize_weight * (1 - win_rate) / win_rate
+    return AliasSampler([prize.name for prize in prizes] + [''], [prize.weight for prize in prizes] + [miss_weight])
+
+
+PRIZES = load_prize_table()
+PRIZE_SAMPLER = AliasSampler([prize.name for prize in PRIZES], [prize.weight for prize in PRIZES])
+GACHA_SAMPLER = compile_prize_sampler(PRIZES, GACHA_WIN_RATE)
 
 
 def select_prize():
-    prizes = ['prize_1', 'prize_2', 'prize_3', 'prize_4', 'prize_5']
-    return np.random.choice(prizes)
+    return PRIZE_SAMPLER.sample()
 
 
 def roll_a_gacha():
-    roll_a_rate = random()
-    if roll_a_rate > (1-GACHA_WIN_RATE):
-        prize = select_prize()
-        return prize
+    return GACHA_SAMPLER.sample()
+
 
-    return ''
+def roll_gachas(roll_num):
+    return [GACHA_SAMPLER.sample() for _ in range(roll_num)]
@@ -0,0 +1,132 @@
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+
+from gacha import GACHA_WIN_RATE, PRIZES, compile_prize_sampler
+from nas import NAS_BONUS_RATE, NAS_GACHA_COST, NAS_LIMIT, calc_remain_nas
+
+
+def sample_outcome_indexes(sampler, rng, size):
+    # the same alias table as AliasSampler.sample, drawn for many rolls at once
+    probabilities = np.asarray(sampler.probabilities)
+    aliases = np.asarray(sampler.aliases)
+    outcome_num = len(sampler.outcomes)
+
+    scaled = rng.random(size) * outcome_num
+    columns = np.minimum(scaled.astype(np.int64), outcome_num - 1)
+    return np.where(scaled - columns < probabilities[columns], columns, aliases[columns])
+
+
+# the rules of calc_nas_bonus and calc_nas_gacha_rolls in nas.py, applied to the arrays of all the users
+def calc_nas_bonuses(last_week_send_nas, nas_bonus_rate=NAS_BONUS_RATE):
+    return np.ceil(last_week_send_nas * nas_bonus_rate).astype(np.int64)
+
+
+def calc_nas_gacha_rolls_of_users(all_receive_nas, used_nas, free_rolls, nas_gacha_cost=NAS_GACHA_COST):
+    return free_rolls + np.maximum(0, (all_receive_nas - used_nas - 1) // nas_gacha_cost)
+
+
+def simulate_economy(user_num=1000, week_num=52, nas_limit=NAS_LIMIT, nas_gacha_cost=NAS_GACHA_COST, gacha_win_rate=GACHA_WIN_RATE,
+                     prizes=PRIZES, activity_alpha=2.0, activity_beta=2.0, seed=None):
+    rng = np.random.default_rng(seed)
+    sampler = compile_prize_sampler(prizes, gacha_win_rate)
+    miss_index = sampler.outcomes.index('') if '' in sampler.outcomes else -1
+
+    # the share of the weekly allowance each user sends
+    activity = rng.beta(activity_alpha, activity_beta, user_num)
+    user_ids = np.arange(user_num)
+
+    last_week_send_nas = np.zeros(user_num, dtype=np.int64)
+    all_receive_nas = np.zeros(user_num, dtype=np.int64)
+    used_nas = np.zeros(user_num, dtype=np.int64)
+    free_rolls = np.ones(user_num, dtype=np.int64)
+    all_rolls = np.zeros(user_num, dtype=np.int64)
+    tickets = np.zeros(len(sampler.outcomes), dtype=np.int64)
+
+    weekly_report = []
+    for _ in range(week_num):
+        # every user can send up to the limit plus the bonus from last week
+        nas_bonus = calc_nas_bonuses(last_week_send_nas)
+        allowance = calc_remain_nas(0, nas_bonus, nas_limit)
+        send_nas = rng.binomial(allowance, activity)
+
+        # each nas goes to someone else
+        senders = np.repeat(user_ids, send_nas)
+        receivers = rng.integers(0, user_num - 1, senders.size)
+        receivers += receivers >= senders
+        all_receive_nas += np.bincount(receivers, minlength=user_num)
+
+        # every user rolls all the available rolls at the end of the week
+        rolls = calc_nas_gacha_rolls_of_users(all_receive_nas, used_nas, free_rolls, nas_gacha_cost)
+        used_free_rolls = free_rolls * (rolls > 0)
+        used_nas += (rolls - used_free_rolls) * nas_gacha_cost
+        free_rolls -= used_free_rolls
+        all_rolls += rolls
+
+        week_tickets = np.bincount(sample_outcome_indexes(sampler, rng, int(rolls.sum())), minlength=len(sampler.outcomes))
+        tickets += week_tickets
+
+        weekly_report.append({
+            'sent_nas': int(send_nas.sum()),
+            'mean_bonus': float(nas_bonus.mean()),
+            'bonus_inflation': float(allowance.sum() / (nas_limit * user_num)),
+            'rolls': int(rolls.sum()),
+            'tickets': int(week_tickets.sum() - (week_tickets[miss_index] if miss_index >= 0 else 0))
+        })
+        last_week_send_nas = send_nas
+
+    issued_tickets = {prize_name: int(ticket_num) for prize_name, ticket_num in zip(sampler.outcomes, tickets) if prize_name != ''}
+    return {
+        'user_num': user_num,
+        'week_num': week_num,
+        'nas_limit': nas_limit,
+        'nas_gacha_cost': nas_gacha_cost,
+        'gacha_win_rate': gacha_win_rate,
+        'issued_tickets': issued_tickets,
+        'tickets_per_user': sum(issued_tickets.values()) / user_num,
+        'rolls_per_user': {
+            'mean': float(all_rolls.mean()),
+            'p50': float(np.percentile(all_rolls, 50)),
+            'p90': float(np.percentile(all_rolls, 90)),
+            'max': int(all_rolls.max())
+        },
+        'bonus_inflation': weekly_report[-1]['bonus_inflation'] if weekly_report else 1.0,
+        'weekly': weekly_report
+    }
+
+
+def sweep_parameters(parameter_grid, **simulation_kwargs):
+    # parameter_grid: {'nas_limit': [20, 30], 'gacha_win_rate': [0.1, 0.2]}
+    names = sorted(parameter_grid)
+    reports = []
+    for values in itertools.product(*(parameter_grid[name] for name in names)):
+        parameters = dict(zip(names, values))
+        reports.append(simulate_economy(**dict(simulation_kwargs, **parameters)))
+    return reports
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='simulate the nas gacha economy')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--nas-limit', type=int, nargs='+', default=[NAS_LIMIT])
+    parser.add_argument('--nas-gacha-cost', type=int, nargs='+', default=[NAS_GACHA_COST])
+    parser.add_argument('--gacha-win-rate', type=float, nargs='+', default=[GACHA_WIN_RATE])
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    start = time.perf_counter()
+    reports = sweep_parameters(
+        {'nas_limit': args.nas_limit, 'nas_gacha_cost': args.nas_gacha_cost, 'gacha_win_rate': args.gacha_win_rate},
+        user_num=args.users, week_num=args.weeks, seed=args.seed
+    )
+    for report in reports:
+        del report['weekly']
+        print(json.dumps(report, ensure_ascii=False))
+    print('simulated {0} parameter sets in {1:.3f}s'.format(len(reports), time.perf_counter() - start))
@@ -1,228 +1,134 @@
 # coding: utf-8
-import os
-import threading
-import requests
 import time
 
-from utils import parse_lambda_event_str, bring_slack_id_from_slack_name, bring_slack_name_from_slack_id, calc_nas_ranking_this_week
-from nas import Nas
-from send_message import post_public_message_to_slack, post_private_message_to_slack
-from configparser import ConfigParser, ExtendedInterpolation
-
-STAMP_CONFIG = ConfigParser(interpolation=ExtendedInterpolation())
-STAMP_CONFIG.read('stamp_config.ini')
-
-NAS_LIMIT = int(os.environ['NAS_LIMIT'])
-PUBLIC_NAS_CHANNEL_ID = os.environ['PUBLIC_NAS_CHANNEL_ID']
+from capacity import CAPACITY
+from commands import get_command
+from event_dedup import EVENT_DEDUPLICATOR, get_event_key
+from metrics import METRICS
+from send_message import SLACK_ACK_WINDOW, ReplyChannel
+from slack_event import normalize_event
+from slack_client import get_slack_client
+from work_queue import get_work_queue, messages_from_sqs_event
 
 
 def lambda_handler(event, content):
-    threading.Thread(target=main_func(event, content))  # main process
-    # If the response is slow, Slack will throw an error, so return instantly.
-    return 0
-
+    # Slack's 3 seconds start when it sends the request, so the ack window is measured from here
+    deadline = time.monotonic() + SLACK_ACK_WINDOW
 
-def main_func(event, content):
     # Ignore the retry process from Slack
     if 'X-Slack-Retry-Num' in event['params']['header']:
         print("this is redirect requests!")
-        return 204
-
-    content_type = type(event['body'])
-
-    if content_type is str:
-        parsed_event = parse_lambda_event_str(event)
-
-        # setup all need informations
-        nas_user_id = parsed_event['user_id']
-        nas_user_name = parsed_event['user_name']
-        team_id = parsed_event['team_id']
-        sent_channel_id = parsed_event['channel_id']
-        command = parsed_event['command']
-        if command == '/nas':
-            sended_message = parsed_event['text'].split()
-            receive_user_name = sended_message[0].lstrip('@')
-            receive_user_id = bring_slack_id_from_slack_name(receive_user_name)
-        if command == '/use_nas_gacha_ticket':
-            use_ticket = parsed_event['text'].split()[0]
-
-    if content_type is dict:
-        # setup all need informations
-        nas_user_id = event['body']['event']['user']
-        nas_user_name = bring_slack_name_from_slack_id(nas_user_id)
-        receive_user_id = event['body']['event']['item_user']
-        receive_user_name = bring_slack_name_from_slack_id(receive_user_id)
-        team_id = event['body']['team_id']
-        sent_channel_id = event['body']['event']['item']['channel']
-        send_stamp = event['body']['event']['reaction']
-        command = '/nas_stamp'
-
-    if command == '/nas':
-        # check can send nas message
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-        if nas_obj.chack_self_portrait(receive_user_id) is True:
-            print('self portrait')
-            send_user_slack_text = '自画自賛乙'
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        if nas_obj.check_can_send_nas() is False:
-            print('nas send limit')
-            send_user_slack_text = '今週はもうnasを送れないよ！'
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        if receive_user_id == '':
-            print('the user not exist.')
-            send_user_slack_text = 'そのユーザは存在しないよ！'
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        # forming message
-        message = ""
-        for word in sended_message[1:]:
-            message += word
-
-        # setup slack text for send user
-        sended_nas_num = nas_obj.sended_nas_num()
-        remain_nas = NAS_LIMIT - sended_nas_num
-        nas_bonus = nas_obj.nas_bonus()
-        nas_status = nas_obj.nas_status()
-        send_user_slack_text = "コマンドからnasを送れたよ!\n今週の残りnas数: {0}\n先週からのボーナス: {1}\nあなたの残りnasは{2}です.".format(remain_nas, nas_bonus, nas_status)
-
-        # setup slack text for receive user
-        receive_user_slack_text = "<@{0}> {1}さんからのメッセージです。\n {2}".format(receive_user_name, nas_user_name, message)
-
-        # send nas message
-        post_public_message_to_slack(receive_user_slack_text, PUBLIC_NAS_CHANNEL_ID)  # for receive user
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-
-        # create nas record
-        nas_obj.nas_message(receive_user_id, receive_user_name)
-        return requests.codes.ok
-
-    if command == '/nas_stamp':
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-        if nas_obj.chack_self_portrait(receive_user_id) is True:
-            print('self portrait')
-            send_user_slack_text = '自画自賛乙'
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        if nas_obj.check_can_send_nas() is False:
-            print('nas send limit')
-            send_user_slack_text = '今週はもうnasを送れないよ！'
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        # set write user info
-        STAMP_CONFIG.set('user_info', 'nas_user_id', nas_user_id)
-        STAMP_CONFIG.set('user_info', 'nas_user_name', nas_user_name)
-        STAMP_CONFIG.set('user_info', 'receive_user_id', receive_user_id)
-        STAMP_CONFIG.set('user_info', 'receive_user_name', receive_user_name)
-
-        if nas_obj.nas_stamp(receive_user_id, receive_user_name, send_stamp) is False:
-            return requests.codes.ok
-
-        # setup slack text for send user
-        sended_nas_num = nas_obj.sended_nas_num()
-        remain_nas = NAS_LIMIT - sended_nas_num
-        nas_bonus = nas_obj.nas_bonus()
-        nas_status = nas_obj.nas_status()
-        send_user_slack_text = STAMP_CONFIG[send_stamp]['confirm_message'] + \
-            "\n今週の残りnas数: {0}\n先週からのボーナス: {1}\nあなたの残りnasは{2}です.".format(remain_nas, nas_bonus, nas_status)
-
-        # setup slack text for receive user
-        receive_user_slack_text = STAMP_CONFIG[send_stamp]['send_message']
-
-        # send nas message
-        post_private_message_to_slack(receive_user_slack_text, PUBLIC_NAS_CHANNEL_ID, receive_user_id)  # for receive user
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-        return requests.codes.ok
-
-    if command == '/nas_rank':
-        receive_all_nas_group_by_user = calc_nas_ranking_this_week()
-        rank_count = 1
-        send_user_slack_text = "今週のnasランキング\n順位 ユーザ名 貰ったnas数\n"
-
-        # setup slack text for send user
-        for user_name, receive_nas in receive_all_nas_group_by_user.items():
-            send_user_slack_text += str(rank_count) + ". " + str(user_name) + "\t" + str(receive_nas) + "\n"
-            rank_count += 1
-
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-        return requests.codes.ok
-
-    if command == '/nas_st':
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-
-        # setup slack text for send user
-        sended_nas_num = nas_obj.sended_nas_num()
-        remain_nas = NAS_LIMIT - sended_nas_num
-        nas_bonus = nas_obj.nas_bonus()
-        nas_status = nas_obj.nas_status()
-        send_user_slack_text = "今週の残りnas数: {0}\n先週からのボーナス: {1}\nあなたの残りnasは{2}です.".format(remain_nas, nas_bonus, nas_status)
-
-        # send nas message
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-        return requests.codes.ok
-
-    if command == '/nas_gacha':
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-        if nas_obj.check_can_run_gacha() is False:
-            print("can't run nas gacha")
-            send_user_slack_text = 'ガチャの残り回数がもう無いよ！もっとnasを貰ってきてね。'
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        send_user_slack_text = "デュルデュルデュルデュル..."
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-
-        gacha_result = nas_obj.nas_gacha()
-        time.sleep(3)
-
-        # setup slack text for send user
-        remain_nas_gacha = nas_obj.nas_gacha_status()
-        if gacha_result != '':
-            send_user_slack_text = "ドン！今回の結果はあたりでした！\n当たった景品 {0}\n残りのガチャ回数は{1}回です".format(gacha_result, remain_nas_gacha)
-            # send nas message
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-        else:
-            send_user_slack_text = "ドン！今回の結果ははずれでした！\n残りのガチャ回数は{0}回です".format(remain_nas_gacha)
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-
-        return requests.codes.ok
-
-    if command == '/nas_gacha_status':
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-        remain_nas_gacha = nas_obj.nas_gacha_status()
-        until_next_time_nas_num = nas_obj.calc_until_next_time_nas_num()
-
-        send_user_slack_text = "残りのガチャ回数は{0}回です\n回せるようになるまで{1}個のnasを受け取る必要があります".format(remain_nas_gacha, until_next_time_nas_num)
-        # send nas message
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-
-    if command == '/nas_gacha_tickets':
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-        has_tickets = nas_obj.check_nas_gacha_tickets()
-
-        send_user_slack_text = "持っているチケットリスト\n"
-        for prize_name, has_num in has_tickets.items():
-            send_user_slack_text += "{0} : {1} \n".format(prize_name, has_num)
-
-        # send nas message
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-        return requests.codes.ok
-
-    if command == '/use_nas_gacha_ticket':
-        nas_obj = Nas(nas_user_id, nas_user_name, team_id)
-        result = nas_obj.use_nas_gacha_tickets(use_ticket)
-
-        if result is False:
-            send_user_slack_text = "チケットの消費に失敗しました。"
-            post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-            return requests.codes.ok
-
-        send_user_slack_text = "{0}のチケットを消費しました！".format(use_ticket)
-        post_private_message_to_slack(send_user_slack_text, sent_channel_id, nas_user_id)  # for send user
-        return requests.codes.ok
+        return ''
+
+    # events no command handles are dropped before they are enqueued
+    request = normalize_event(event)
+    if request is None:
+        print('irrelevant event')
+        return ''
+
+    work_queue = get_work_queue()
+    if work_queue is None:
+        response_body = main_func(event, content, deadline=deadline, request=request)  # main process
+        print_slack_latencies()
+        # A reply that is ready within the ack window is returned as the body of the response
+        return response_body
+
+    # If the response is slow, Slack will retry the request, so only enqueue the event and ack instantly.
+    work_queue.enqueue({'type': 'event', 'event': event})
+    return ''
+
+
+def worker_handler(event, content):
+    # triggered by the work queue. The replies are sent after the ack, so they can not be inline.
+    batch_item_failures = []
+    for message_id, message in messages_from_sqs_event(event):
+        try:
+            process_message(message, content)
+        except Exception as e:
+            # only the failed messages are made visible again, the others of the batch are not run twice
+            print(e)
+            batch_item_failures.append({'itemIdentifier': message_id})
+    print_slack_latencies()
+    return {'batchItemFailures': batch_item_failures}
+
+
+def drain_work_queue(work_queue, content=None):
+    processed_num = 0
+    for receipt_handle, message in work_queue.receive():
+        try:
+            process_message(message, content)
+        except Exception as e:
+            # not acked, so the message is received again after the visibility timeout
+            print(e)
+            continue
+        work_queue.ack(receipt_handle)
+        processed_num += 1
+    print_slack_latencies()
+    return processed_num
+
+
+def process_message(message, content):
+    if message['type'] == 'event':
+        main_func(message['event'], content, inline=False)
+        return
+
+    if message['type'] == 'reply':
+        reply_channel = ReplyChannel(message['slack_channel_name'], message['dist_user_id'], message['response_url'], inline=False)
+        reply_channel.send(message['text'])
+        return
+
+    print('unknown message type: {0}'.format(message['type']))
+
+
+def print_slack_latencies():
+    for method, (count, total, max_elapsed) in get_slack_client().pop_latencies().items():
+        print('slack api {0}: {1} calls, total {2:.3f}s, max {3:.3f}s'.format(method, count, total, max_elapsed))
+
+
+def main_func(event, content, inline=True, deadline=None, request=None):
+    # Ignore the retry process from Slack
+    if 'X-Slack-Retry-Num' in event['params']['header']:
+        print("this is redirect requests!")
+        return ''
+
+    # lambda_handler has already normalized the event. the worker gets the raw event from the queue.
+    if request is None:
+        request = normalize_event(event)
+    if request is None:
+        print('irrelevant event')
+        return ''
+
+    command = get_command(request.command)
+    if command is None:
+        print('unknown command: {0}'.format(request.command))
+        return ''
+
+    # the spans of the calls below are aggregated per request and printed as metric lines
+    METRICS.start(request.command)
+    CAPACITY.start(request.command)
+    try:
+        return run_command(command, request, event, inline, deadline)
+    finally:
+        METRICS.flush()
+        # over the budget of the command is only a warning in production
+        CAPACITY.finish(command.budget)
+
+
+def run_command(command, request, event, inline, deadline):
+    # a slow first attempt, a duplicate delivery or a replayed queue message must not run the command again
+    event_key = get_event_key(event)
+    if EVENT_DEDUPLICATOR.claim(event_key) is False:
+        print('duplicate event')
+        return ''
+
+    # the response to the Events API is not shown to the user
+    reply_inline = inline and request.response_url != ''
+    reply_channel = ReplyChannel(request.channel_id, request.user_id, request.response_url, reply_inline, deadline=deadline)
+    try:
+        with METRICS.span('command'):
+            command.run(request, reply_channel)
+    except Exception:
+        EVENT_DEDUPLICATOR.release(event_key)
+        raise
+    EVENT_DEDUPLICATOR.complete(event_key)
+    return reply_channel.close()
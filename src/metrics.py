@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+NAS_METRICS = os.environ.get('NAS_METRICS', '') == '1'
+NAS_METRICS_NAMESPACE = os.environ.get('NAS_METRICS_NAMESPACE', 'nas')
+
+
+class MetricsRecorder:
+    def __init__(self, enabled=NAS_METRICS, namespace=NAS_METRICS_NAMESPACE, sink=print):
+        self.enabled = enabled
+        self.namespace = namespace
+        # where the metric lines go. CloudWatch Logs picks them up from stdout.
+        self.sink = sink
+        self.command = ''
+        # {span name: (count, total seconds, max seconds, errors, items read)}
+        self.spans = {}
+        # the parallel scan records from its worker threads
+        self.lock = threading.Lock()
+
+    def start(self, command):
+        self.command = command
+        self.spans = {}
+
+    def record(self, name, elapsed, error=False, items=0):
+        with self.lock:
+            count, total, max_elapsed, errors, items_read = self.spans.get(name, (0, 0.0, 0.0, 0, 0))
+            self.spans[name] = (count + 1, total + elapsed, max(max_elapsed, elapsed), errors + int(error), items_read + items)
+
+    @contextmanager
+    def span(self, name):
+        if self.enabled is False:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(name, time.perf_counter() - start, True)
+            raise
+        self.record(name, time.perf_counter() - start)
+
+    def flush(self):
+        if self.enabled is False:
+            return []
+
+        with self.lock:
+            spans, self.spans = self.spans, {}
+
+        # one CloudWatch embedded metric format line per span
+        timestamp = int(time.time() * 1000)
+        metric_lines = []
+        for name, (count, total, max_elapsed, errors, items_read) in sorted(spans.items()):
+            metric_lines.append(json.dumps({
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.namespace,
+                        'Dimensions': [['command', 'span']],
+                        'Metrics': [
+                            {'Name': 'count', 'Unit': 'Count'},
+                            {'Name': 'latency', 'Unit': 'Milliseconds'},
+                            {'Name': 'max_latency', 'Unit': 'Milliseconds'},
+                            {'Name': 'errors', 'Unit': 'Count'},
+                            {'Name': 'items_read', 'Unit': 'Count'}
+                        ]
+                    }]
+                },
+                'command': self.command,
+                'span': name,
+                'count': count,
+                'latency': round(total * 1000, 3),
+                'max_latency': round(max_elapsed * 1000, 3),
+                'errors': errors,
+                'items_read': items_read
+            }))
+        for metric_line in metric_lines:
+            self.sink(metric_line)
+        return metric_lines
+
+
+METRICS = MetricsRecorder()
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # disabled, it costs one attribute check
+            if METRICS.enabled is False:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                METRICS.record(name, time.perf_counter() - start, True)
+                raise
+            METRICS.record(name, time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+def before_dynamodb_call(model, context, **kwargs):
+    context['metrics_operation'] = model.name
+    context['metrics_start'] = time.perf_counter()
+
+
+def count_items_read(parsed):
+    # a scan or a query reads ScannedCount items, even when the filter returns fewer
+    if 'ScannedCount' in parsed:
+        return parsed['ScannedCount']
+    if 'Item' in parsed:
+        return 1
+    if 'Responses' in parsed:
+        return sum(len(items) for items in parsed['Responses'].values())
+    return 0
+
+
+def after_dynamodb_call(http_response, parsed, context, **kwargs):
+    if 'metrics_start' in context:
+        METRICS.record('dynamodb.' + context['metrics_operation'], time.perf_counter() - context['metrics_start'],
+                       http_response.status_code >= 300, count_items_read(parsed))
+
+
+def after_dynamodb_call_error(context, **kwargs):
+    if 'metrics_start' in context:
+        METRICS.record('dynamodb.' + context['metrics_operation'], time.perf_counter() - context['metrics_start'], True)
+
+
+def register_dynamodb_metrics(client):
+    # every API call of the client is timed by its operation, with the retries of botocore in its latency
+    client.meta.events.register('before-call.dynamodb', before_dynamodb_call)
+    client.meta.events.register('after-call.dynamodb', after_dynamodb_call)
+    client.meta.events.register('after-call-error.dynamodb', after_dynamodb_call_error)
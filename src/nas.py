@@ -3,17 +3,29 @@ import math
 import os
 from decimal import Decimal
 from datetime import datetime
-from configparser import ConfigParser, ExtendedInterpolation
 
-from db import create_nas_record, load_send_nas_num, scan_user_receive_nas_num, load_latest_nas_gacha_record, create_nas_gacha_record
+from db import create_nas_record, load_send_nas_num, scan_user_receive_nas_num, load_latest_nas_gacha_record, create_nas_gacha_record, \
+    load_weekly_send_nas_num
 from utils import get_last_week_ref_timestamp, get_ref_timestamp
-from gacha import roll_a_gacha
-
-STAMP_CONFIG = ConfigParser(interpolation=ExtendedInterpolation())
-STAMP_CONFIG.read('stamp_config.ini')
+from stamp_registry import get_stamp
+from week_calendar import get_week_id, get_last_week_id
 
 NAS_LIMIT = int(os.environ['NAS_LIMIT'])
 NAS_GACHA_COST = int(os.environ['NAS_GACHA_COST'])
+NAS_BONUS_RATE = 0.2
+
+
+def calc_nas_bonus(last_week_send_nas_num, nas_bonus_rate=NAS_BONUS_RATE):
+    return math.ceil(last_week_send_nas_num * nas_bonus_rate)
+
+
+def calc_remain_nas(sended_nas_num, nas_bonus, nas_limit=NAS_LIMIT):
+    return (nas_limit - sended_nas_num) + nas_bonus
+
+
+def calc_nas_gacha_rolls(all_receive_nas_num, used_nas_num, free_roll_num, nas_gacha_cost=NAS_GACHA_COST):
+    # the free roll is the first one, and each of the others needs the used nas plus the cost to be less than the received nas
+    return free_roll_num + max(0, (all_receive_nas_num - used_nas_num - 1) // nas_gacha_cost)
 
 
 class Nas:
@@ -21,26 +33,53 @@ class Nas:
         self.user_id = user_id
         self.user_name = user_name
         self.team_id = team_id
+        # the state of the user is loaded at most once per request, and kept up to date after each write
+        self.snapshot = {}
+
+    def refresh(self):
+        self.snapshot = {}
+
+    def load_snapshot(self, key, loader):
+        if key not in self.snapshot:
+            self.snapshot[key] = loader()
+        return self.snapshot[key]
+
+    def load_last_week_send_nas_num(self):
+        last_week_send_nas = load_weekly_send_nas_num(self.user_id, get_last_week_id())
+        if last_week_send_nas is None:
+            # no counter yet, so count the raw records of last week
+            this_week_ref_timestamp = get_ref_timestamp()
+            last_week_ref_timestamp = get_last_week_ref_timestamp()
+            last_week_send_nas = load_send_nas_num(self.user_id, last_week_ref_timestamp, this_week_ref_timestamp)
+        return last_week_send_nas
+
+    def load_this_week_send_nas_num(self):
+        sended_nas = load_weekly_send_nas_num(self.user_id, get_week_id())
+        if sended_nas is None:
+            # no counter yet, so count the raw records of this week
+            ref_timestamp = get_ref_timestamp()
+            sended_nas = load_send_nas_num(self.user_id, ref_timestamp)
+        return sended_nas
 
-    def nas_bonus(self):
-        this_week_ref_timestamp = get_ref_timestamp()
-        this_week_send_nas = load_send_nas_num(self.user_id, this_week_ref_timestamp)
+    def all_receive_nas_num(self):
+        return self.load_snapshot('all_receive_nas_num', lambda: scan_user_receive_nas_num(self.user_id))
 
-        last_week_ref_timestamp = get_last_week_ref_timestamp()
-        last_week_send_nas = load_send_nas_num(self.user_id, last_week_ref_timestamp)
+    def latest_nas_gacha_record(self):
+        return self.load_snapshot('latest_nas_gacha_record', lambda: load_latest_nas_gacha_record(self.user_id))
 
-        nas_bonus = math.ceil((last_week_send_nas - this_week_send_nas) * 0.2)
+    def nas_bonus(self):
+        last_week_send_nas = self.load_snapshot('last_week_send_nas', self.load_last_week_send_nas_num)
+
+        nas_bonus = calc_nas_bonus(last_week_send_nas)
         return nas_bonus
 
     def sended_nas_num(self):
-        ref_timestamp = get_ref_timestamp()
-        sended_nas = load_send_nas_num(self.user_id, ref_timestamp)
-        return sended_nas
+        return self.load_snapshot('sended_nas', self.load_this_week_send_nas_num)
 
     def nas_status(self):
         sended_nas = self.sended_nas_num()
         nas_bonus = self.nas_bonus()
-        remain_nas = (NAS_LIMIT - sended_nas) + nas_bonus
+        remain_nas = calc_remain_nas(sended_nas, nas_bonus)
         return remain_nas
 
     def chack_self_portrait(self, receive_user_id):
@@ -53,6 +92,14 @@ class Nas:
             return True
         return False
 
+    def send_nas(self, receive_user_id, receive_user_name, nas_type, nas_num=1):
+        if create_nas_record(self.user_id, self.user_name, receive_user_id, receive_user_name, nas_type, self.team_id, nas_num) is False:
+            return False
+
+        if 'sended_nas' in self.snapshot:
+            self.snapshot['sended_nas'] += nas_num
+        return True
+
     def nas_stamp(self, receive_user_id, receive_user_name, stamp_name):
         if self.chack_self_portrait(receive_user_id) is True:
             print('self_portrait')
@@ -62,15 +109,12 @@ class Nas:
             print('nas send limit')
             return False
 
-        if STAMP_CONFIG.has_section(stamp_name) is False:
+        stamp = get_stamp(stamp_name)
+        if stamp is None:
             print('this is not nas stamp')
             return False
 
-        send_nas_num = STAMP_CONFIG.get(stamp_name, 'nas_num')
-        for i in range(int(send_nas_num)):
-            create_nas_record(self.user_id, self.user_name, receive_user_id, receive_user_name, 'stamp', self.team_id)
-
-        return True
+        return self.send_nas(receive_user_id, receive_user_name, 'stamp', stamp.nas_num)
 
     def nas_message(self, receive_user_id, receive_user_name):
         if self.chack_self_portrait(receive_user_id) is True:
@@ -81,12 +125,12 @@ class Nas:
             print('nas send limit')
             return False
 
-        create_nas_record(self.user_id, self.user_name, receive_user_id, receive_user_name, 'message', self.team_id)
+        self.send_nas(receive_user_id, receive_user_name, 'message')
         return True
 
     def check_can_run_gacha(self):
-        all_receive_nas_num = scan_user_receive_nas_num(self.user_id)
-        latest_nas_gacha_record = load_latest_nas_gacha_record(self.user_id)
+        all_receive_nas_num = self.all_receive_nas_num()
+        latest_nas_gacha_record = self.latest_nas_gacha_record()
         if latest_nas_gacha_record == {}:
             return True
         already_used_nas_num = int(latest_nas_gacha_record['used_nas_num']) + NAS_GACHA_COST
@@ -98,49 +142,81 @@ class Nas:
         return True
 
     def nas_gacha_status(self):
-        all_receive_nas_num = scan_user_receive_nas_num(self.user_id)
-        latest_nas_gacha_record = load_latest_nas_gacha_record(self.user_id)
-        if latest_nas_gacha_record == {}:
-            remain_nas_gacha = 1
-            return remain_nas_gacha
-
-        remain_nas_gacha = int((all_receive_nas_num - int(latest_nas_gacha_record['used_nas_num']))/NAS_GACHA_COST)
-        return remain_nas_gacha
+        # the same number as the rolls /nas_gacha allows, so every message shows one number
+        return self.count_nas_gacha_rolls()
 
     def calc_until_next_time_nas_num(self):
-        all_receive_nas_num = scan_user_receive_nas_num(self.user_id)
-        latest_nas_gacha_record = load_latest_nas_gacha_record(self.user_id)
-        if latest_nas_gacha_record == {}:
-            until_next_time_nas_num = 0
-            return until_next_time_nas_num
+        if self.count_nas_gacha_rolls() > 0:
+            return 0
 
-        diff_remain_used_num = all_receive_nas_num - int(latest_nas_gacha_record['used_nas_num'])
+        # the next roll needs the used nas plus the cost to be less than the received nas
+        return int(self.latest_nas_gacha_record()['used_nas_num']) + NAS_GACHA_COST + 1 - self.all_receive_nas_num()
 
-        until_next_time_nas_num = NAS_GACHA_COST - diff_remain_used_num if diff_remain_used_num < NAS_GACHA_COST else 0
-        return until_next_time_nas_num
+    def save_nas_gacha_record(self, all_receive_nas_num, already_used_nas_num, has_tickets):
+        now = datetime.now()
+        expected_version = self.latest_nas_gacha_record().get('version', 0)
+        nas_gacha_record = {
+            'user_id': self.user_id,
+            'time_stamp': Decimal(now.timestamp()),
+            'has_nas_num': all_receive_nas_num,
+            'used_nas_num': already_used_nas_num,
+            'has_tickets': has_tickets,
+            'version': expected_version + 1
+        }
+
+        if create_nas_gacha_record(self.user_id, nas_gacha_record['time_stamp'], all_receive_nas_num, already_used_nas_num, has_tickets,
+                                   expected_version) is False:
+            # someone else may have updated the record, so read it again next time
+            self.snapshot.pop('latest_nas_gacha_record', None)
+            return False
+
+        self.snapshot['latest_nas_gacha_record'] = nas_gacha_record
+        return True
+
+    def count_nas_gacha_rolls(self):
+        # the number of rolls check_can_run_gacha allows one after another
+        all_receive_nas_num = self.all_receive_nas_num()
+        latest_nas_gacha_record = self.latest_nas_gacha_record()
+        if latest_nas_gacha_record == {}:
+            return calc_nas_gacha_rolls(all_receive_nas_num, 0, 1)
+
+        return calc_nas_gacha_rolls(all_receive_nas_num, int(latest_nas_gacha_record['used_nas_num']), 0)
 
     def nas_gacha(self):
-        now = datetime.now()
-        all_receive_nas_num = scan_user_receive_nas_num(self.user_id)
-        latest_nas_gacha_record = load_latest_nas_gacha_record(self.user_id)
+        gacha_results = self.nas_gacha_rolls(1)
+        if gacha_results is None:
+            return ''
+        return gacha_results[0]
+
+    def nas_gacha_rolls(self, roll_num):
+        # imported here so that the other commands do not load the gacha module
+        from gacha import roll_gachas
+
+        if roll_num <= 0 or roll_num > self.count_nas_gacha_rolls():
+            print("can't run nas gacha {0} times".format(roll_num))
+            return None
 
-        gacha_result = roll_a_gacha()
+        all_receive_nas_num = self.all_receive_nas_num()
+        latest_nas_gacha_record = self.latest_nas_gacha_record()
         if latest_nas_gacha_record == {}:
-            already_used_nas_num = 0
+            already_used_nas_num = (roll_num - 1) * NAS_GACHA_COST
             has_tickets = {}
-            if gacha_result != '':
-                has_tickets[gacha_result] = 1
         else:
-            already_used_nas_num = int(latest_nas_gacha_record['used_nas_num']) + NAS_GACHA_COST
-            has_tickets = latest_nas_gacha_record['has_tickets']
+            already_used_nas_num = int(latest_nas_gacha_record['used_nas_num']) + roll_num * NAS_GACHA_COST
+            has_tickets = dict(latest_nas_gacha_record['has_tickets'])
+
+        # every roll is computed in memory, and the result of all of them is saved at once
+        gacha_results = roll_gachas(roll_num)
+        for gacha_result in gacha_results:
             if gacha_result != '':
                 has_tickets[gacha_result] = has_tickets.get(gacha_result, 0) + 1
 
-        create_nas_gacha_record(self.user_id, Decimal(now.timestamp()), all_receive_nas_num, already_used_nas_num, has_tickets)
-        return gacha_result
+        if self.save_nas_gacha_record(all_receive_nas_num, already_used_nas_num, has_tickets) is False:
+            return None
+        return gacha_results
 
     def check_nas_gacha_tickets(self):
-        latest_nas_gacha_record = load_latest_nas_gacha_record(self.user_id)
+        latest_nas_gacha_record = self.latest_nas_gacha_record()
         if latest_nas_gacha_record == {}:
             ticket_dict = {}
             return ticket_dict
@@ -149,23 +225,21 @@ class Nas:
         return ticket_dict
 
     def use_nas_gacha_tickets(self, ticket_name):
-        latest_nas_gacha_record = load_latest_nas_gacha_record(self.user_id)
+        latest_nas_gacha_record = self.latest_nas_gacha_record()
         if latest_nas_gacha_record == {}:
             print('empty gacha record')
             return False
 
-        has_tickets = latest_nas_gacha_record['has_tickets']
+        has_tickets = dict(latest_nas_gacha_record['has_tickets'])
         if ticket_name not in has_tickets.keys():
             print('not exist the ticket in your has tickets')
             return False
 
-        now = datetime.now()
-        all_receive_nas_num = scan_user_receive_nas_num(self.user_id)
+        all_receive_nas_num = self.all_receive_nas_num()
         already_used_nas_num = latest_nas_gacha_record['used_nas_num']
         has_tickets[ticket_name] -= 1
 
         if has_tickets[ticket_name] <= 0:
             del has_tickets[ticket_name]
 
-        create_nas_gacha_record(self.user_id, Decimal(now.timestamp()), all_receive_nas_num, already_used_nas_num, has_tickets)
-        return True
+        return self.save_nas_gacha_record(all_receive_nas_num, already_used_nas_num, has_tickets)
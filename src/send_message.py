@@ -1,25 +1,23 @@
-import json
 import os
+import time
 
 import requests
 
+from metrics import timed
+from slack_client import get_slack_client
 
-def post_public_message_to_slack(send_message, slack_channel_name):
-    slack_bot_token = "Bearer {0}".format(os.environ['SLACK_BOT_USER_ACCESS_TOKEN'])
-    slack_oauth_token = os.environ["SLACK_OAUTH_ACCESS_TOKEN"]
+# Slack waits 3 seconds for the response of a slash command. Leave a margin for API Gateway.
+SLACK_ACK_WINDOW = float(os.environ.get('SLACK_ACK_WINDOW', 2.5))
 
-    slack_api_url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Content-Type": "application/json; charset=UTF-8",
-        "Authorization": slack_bot_token
-    }
+
+@timed('send_message.post_public_message_to_slack')
+def post_public_message_to_slack(send_message, slack_channel_name):
     data = {
-        "token": slack_oauth_token,
         "channel": slack_channel_name,
         "text": send_message
     }
     try:
-        response = requests.post(slack_api_url, data=json.dumps(data).encode("utf-8"), headers=headers)
+        response = get_slack_client().post('chat.postMessage', data)
         if response.status_code != requests.codes.ok:
             return False
     except Exception as e:
@@ -28,26 +26,83 @@ def post_public_message_to_slack(send_message, slack_channel_name):
     return True
 
 
+@timed('send_message.post_private_message_to_slack')
 def post_private_message_to_slack(send_message, slack_channel_name, dist_user_id):
-    slack_bot_token = "Bearer {0}".format(os.environ['SLACK_BOT_USER_ACCESS_TOKEN'])
-    slack_oauth_token = os.environ["SLACK_OAUTH_ACCESS_TOKEN"]
-
-    slack_api_url = "https://slack.com/api/chat.postEphemeral"
-    headers = {
-        "Content-Type": "application/json; charset=UTF-8",
-        "Authorization": slack_bot_token
-    }
     data = {
-        "token": slack_oauth_token,
         "channel": slack_channel_name,
         "text": send_message,
         "user": dist_user_id
     }
     try:
-        response = requests.post(slack_api_url, data=json.dumps(data).encode("utf-8"), headers=headers)
+        response = get_slack_client().post('chat.postEphemeral', data)
+        if response.status_code != requests.codes.ok:
+            return False
+    except Exception as e:
+        print(e)
+        return False
+    return True
+
+
+@timed('send_message.post_message_to_response_url')
+def post_message_to_response_url(send_message, response_url):
+    data = {
+        "response_type": "ephemeral",
+        "text": send_message
+    }
+    try:
+        response = get_slack_client().post_to_response_url(response_url, data)
         if response.status_code != requests.codes.ok:
             return False
     except Exception as e:
         print(e)
         return False
     return True
+
+
+class ReplyChannel:
+    def __init__(self, slack_channel_name, dist_user_id, response_url='', inline=True, ack_window=SLACK_ACK_WINDOW, deadline=None):
+        self.slack_channel_name = slack_channel_name
+        self.dist_user_id = dist_user_id
+        self.response_url = response_url
+        # the deadline of the ack window from the start of the request. without it, the window starts now.
+        if deadline is None:
+            deadline = time.monotonic() + ack_window
+        self.deadline = deadline if inline is True else 0
+        self.inline_messages = []
+
+    def can_reply_inline(self):
+        return time.monotonic() < self.deadline
+
+    def send(self, send_message):
+        if self.can_reply_inline():
+            self.inline_messages.append(send_message)
+            return True
+
+        # the ack window has passed, so the held messages must be sent before this one
+        self.flush()
+        return self.post(send_message)
+
+    def flush(self):
+        inline_messages, self.inline_messages = self.inline_messages, []
+        for send_message in inline_messages:
+            self.post(send_message)
+
+    def post(self, send_message):
+        if self.response_url != '' and post_message_to_response_url(send_message, self.response_url) is True:
+            return True
+        return post_private_message_to_slack(send_message, self.slack_channel_name, self.dist_user_id)
+
+    def close(self):
+        if self.inline_messages == []:
+            return ''
+
+        if self.can_reply_inline() is False:
+            self.flush()
+            return ''
+
+        # returned as the body of the response to the slash command
+        inline_messages, self.inline_messages = self.inline_messages, []
+        return {
+            "response_type": "ephemeral",
+            "text": "\n".join(inline_messages)
+        }
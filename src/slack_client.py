@@ -0,0 +1,74 @@
+import json
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+SLACK_API_URL = "https://slack.com/api/"
+# the response_url comes from the request body, so only the hosts of Slack are trusted
+SLACK_RESPONSE_URL_PREFIX = "https://hooks.slack.com/"
+SLACK_CONNECT_TIMEOUT = float(os.environ.get('SLACK_CONNECT_TIMEOUT', 1))
+SLACK_READ_TIMEOUT = float(os.environ.get('SLACK_READ_TIMEOUT', 3))
+
+
+class SlackClient:
+    def __init__(self, bot_token, oauth_token, timeout=(SLACK_CONNECT_TIMEOUT, SLACK_READ_TIMEOUT)):
+        self.oauth_token = oauth_token
+        self.timeout = timeout
+        self.headers = {
+            "Content-Type": "application/json; charset=UTF-8",
+            "Authorization": "Bearer {0}".format(bot_token)
+        }
+        # the response_url needs no auth, so the token is never sent to it
+        self.response_url_headers = {"Content-Type": "application/json; charset=UTF-8"}
+        # the session keeps the TCP+TLS connection to slack.com alive between messages and warm invocations
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        self.latencies = {}
+
+    def post(self, method, data):
+        data = dict(data, token=self.oauth_token)
+        return self.request('POST', method, data=json.dumps(data).encode("utf-8"), headers=self.headers)
+
+    def get(self, method, params):
+        params = dict(params, token=self.oauth_token)
+        return self.request('GET', method, params=params)
+
+    def post_to_response_url(self, response_url, data):
+        if response_url.startswith(SLACK_RESPONSE_URL_PREFIX) is False:
+            raise ValueError('response_url is not a url of slack: {0}'.format(response_url))
+        return self.request('POST', 'response_url', url=response_url, data=json.dumps(data).encode("utf-8"),
+                            headers=self.response_url_headers)
+
+    def request(self, http_method, method, url=None, **kwargs):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(http_method, url or SLACK_API_URL + method, timeout=self.timeout, **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record_latency(method, elapsed)
+            if METRICS.enabled is True:
+                METRICS.record('slack.' + method, elapsed, response is None or response.status_code >= 300)
+
+    def record_latency(self, method, elapsed):
+        count, total, max_elapsed = self.latencies.get(method, (0, 0.0, 0.0))
+        self.latencies[method] = (count + 1, total + elapsed, max(max_elapsed, elapsed))
+
+    def pop_latencies(self):
+        latencies, self.latencies = self.latencies, {}
+        return latencies
+
+
+_slack_client = None
+
+
+def get_slack_client():
+    global _slack_client
+    if _slack_client is None:
+        _slack_client = SlackClient(os.environ['SLACK_BOT_USER_ACCESS_TOKEN'], os.environ["SLACK_OAUTH_ACCESS_TOKEN"])
+    return _slack_client
@@ -0,0 +1,66 @@
+from urllib.parse import parse_qsl
+
+from stamp_registry import get_stamp
+
+
+class SlackRequest:
+    # the one shape every command sees, whether it came from a slash command or the Events API
+    __slots__ = ('user_id', 'user_name', 'receive_user_id', 'team_id', 'channel_id', 'command', 'text', 'args', 'stamp', 'response_url')
+
+    def __init__(self, user_id, team_id, channel_id, command, user_name='', receive_user_id='', text='', stamp='', response_url=''):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.receive_user_id = receive_user_id
+        self.team_id = team_id
+        self.channel_id = channel_id
+        self.command = command
+        self.text = text
+        # the words of the text, split once here so the commands do not parse it again
+        self.args = tuple(text.split())
+        self.stamp = stamp
+        self.response_url = response_url
+
+
+def normalize_event(event):
+    body = event['body']
+    if type(body) is str:
+        return normalize_slash_command(body)
+    if type(body) is dict:
+        return normalize_event_callback(body)
+    return None
+
+
+def normalize_slash_command(body):
+    # the body is form encoded and decoded only here, so the mapping template must pass it as is. ex) text=%40user+C%2B%2B
+    params = dict(parse_qsl(body, keep_blank_values=True))
+    if params.get('command', '') == '' or params.get('user_id', '') == '':
+        return None
+
+    return SlackRequest(
+        user_id=params['user_id'],
+        user_name=params.get('user_name', ''),
+        team_id=params.get('team_id', ''),
+        channel_id=params.get('channel_id', ''),
+        command=params['command'],
+        text=params.get('text', ''),
+        response_url=params.get('response_url', '')
+    )
+
+
+def normalize_event_callback(body):
+    event = body.get('event', {})
+    if body.get('type', 'event_callback') != 'event_callback' or event.get('type', 'reaction_added') != 'reaction_added':
+        return None
+
+    # most reactions are not nas stamps, and a reaction to a file has no user to send to
+    if get_stamp(event.get('reaction', '')) is None or event.get('item_user', '') == '':
+        return None
+
+    return SlackRequest(
+        user_id=event['user'],
+        receive_user_id=event['item_user'],
+        team_id=body.get('team_id', ''),
+        channel_id=event.get('item', {}).get('channel', ''),
+        command='/nas_stamp',
+        stamp=event['reaction']
+    )
@@ -0,0 +1,68 @@
+import os
+import re
+from configparser import ConfigParser
+from types import MappingProxyType
+from typing import NamedTuple
+
+STAMP_CONFIG_PATH = os.environ.get('STAMP_CONFIG_PATH', 'stamp_config.ini')
+# the section the messages refer to as ${user_info:nas_user_name}. It is filled per request, not in the config.
+USER_INFO_SECTION = 'user_info'
+REFERENCE_PATTERN = re.compile(r'\$\{(?:(\w+):)?(\w+)\}')
+
+
+class MessageTemplate(NamedTuple):
+    # literal text and user_info keys in turn. ex) ('', 'nas_user_name', 'さんがあなたにスタンプでnasを送ったよ！')
+    parts: tuple
+
+    def render(self, user_info):
+        return ''.join(part if i % 2 == 0 else user_info[part] for i, part in enumerate(self.parts))
+
+
+class Stamp(NamedTuple):
+    name: str
+    nas_num: int
+    confirm_message: MessageTemplate
+    send_message: MessageTemplate
+    reject_message: MessageTemplate
+    is_private: bool
+
+
+def compile_message_template(message):
+    parts = []
+    position = 0
+    for reference in REFERENCE_PATTERN.finditer(message):
+        section, key = reference.groups()
+        if section != USER_INFO_SECTION:
+            raise ValueError('only ${{user_info:...}} can be referred to: {0}'.format(reference.group(0)))
+        parts.append(message[position:reference.start()].replace('$$', '$'))
+        parts.append(key)
+        position = reference.end()
+    parts.append(message[position:].replace('$$', '$'))
+    return MessageTemplate(tuple(parts))
+
+
+def compile_stamp_registry(path=STAMP_CONFIG_PATH):
+    stamp_config = ConfigParser(interpolation=None)
+    stamp_config.read(path)
+
+    stamps = {}
+    for stamp_name in stamp_config.sections():
+        if stamp_name == USER_INFO_SECTION:
+            continue
+        stamps[stamp_name] = Stamp(
+            name=stamp_name,
+            nas_num=stamp_config.getint(stamp_name, 'nas_num'),
+            confirm_message=compile_message_template(stamp_config.get(stamp_name, 'confirm_message', fallback='')),
+            send_message=compile_message_template(stamp_config.get(stamp_name, 'send_message', fallback='')),
+            reject_message=compile_message_template(stamp_config.get(stamp_name, 'reject_message', fallback='')),
+            is_private=stamp_config.getboolean(stamp_name, 'is_private', fallback=True)
+        )
+    # compiled once at import and shared by every request, so it can not be changed
+    return MappingProxyType(stamps)
+
+
+STAMPS = compile_stamp_registry()
+
+
+def get_stamp(stamp_name):
+    return STAMPS.get(stamp_name)
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+
+from metrics import timed
+from slack_client import get_slack_client
+
+SLACK_USER_DIRECTORY_TTL = int(os.environ.get('SLACK_USER_DIRECTORY_TTL', 3600))
+SLACK_USER_DIRECTORY_PATH = os.environ.get('SLACK_USER_DIRECTORY_PATH', '/tmp/slack_user_directory.json')
+# a name that does not exist must not download the user list on every request
+SLACK_USER_DIRECTORY_MIN_REFRESH_INTERVAL = int(os.environ.get('SLACK_USER_DIRECTORY_MIN_REFRESH_INTERVAL', 60))
+
+
+class UserDirectory:
+    def __init__(self, ttl=SLACK_USER_DIRECTORY_TTL, snapshot_path=SLACK_USER_DIRECTORY_PATH,
+                 min_refresh_interval=SLACK_USER_DIRECTORY_MIN_REFRESH_INTERVAL):
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.min_refresh_interval = min_refresh_interval
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.loaded_at = 0
+        self.refreshed_at = 0
+
+    def get_user_id(self, user_name):
+        return self.lookup('name_to_id', user_name)
+
+    def get_user_name(self, user_id):
+        return self.lookup('id_to_name', user_id)
+
+    def get_user_names(self, user_ids):
+        # the users.list is downloaded at most once for all the ids, not once per unknown id
+        self.ensure_loaded()
+        if any(user_id not in self.id_to_name for user_id in user_ids) and self.can_refresh():
+            self.refresh()
+        return {user_id: self.id_to_name.get(user_id, '') for user_id in user_ids}
+
+    def lookup(self, index_name, key):
+        self.ensure_loaded()
+        if key not in getattr(self, index_name) and self.can_refresh():
+            self.refresh()
+        return getattr(self, index_name).get(key, '')
+
+    def ensure_loaded(self):
+        if time.time() - self.loaded_at < self.ttl:
+            return
+        if self.load_snapshot() and time.time() - self.loaded_at < self.ttl:
+            return
+        if self.can_refresh():
+            self.refresh()
+
+    def can_refresh(self):
+        return time.time() - self.refreshed_at >= self.min_refresh_interval
+
+    def refresh(self):
+        self.refreshed_at = time.time()
+        try:
+            members = fetch_slack_members()
+        except Exception as e:
+            print(e)
+            return False
+
+        self.set_members(members, time.time())
+        self.save_snapshot()
+        return True
+
+    def set_members(self, members, loaded_at):
+        self.name_to_id = {member['name']: member['id'] for member in members}
+        self.id_to_name = {member['id']: member['name'] for member in members}
+        self.loaded_at = loaded_at
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            self.set_members(snapshot['members'], snapshot['loaded_at'])
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(e)
+            return False
+
+    def save_snapshot(self):
+        try:
+            members = [{'id': user_id, 'name': user_name} for user_id, user_name in self.id_to_name.items()]
+            tmp_path = '{0}.{1}'.format(self.snapshot_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump({'loaded_at': self.loaded_at, 'members': members}, f)
+            os.replace(tmp_path, self.snapshot_path)
+            return True
+        except Exception as e:
+            print(e)
+            return False
+
+
+@timed('user_directory.fetch_slack_members')
+def fetch_slack_members():
+    members = []
+    params = {'limit': 200}
+    while True:
+        user_list = get_slack_client().get('users.list', params).json()
+        if user_list.get('ok') is not True:
+            raise Exception('users.list failed: {0}'.format(user_list.get('error')))
+
+        for member in user_list['members']:
+            members.append({'id': member['id'], 'name': member['name']})
+
+        next_cursor = user_list.get('response_metadata', {}).get('next_cursor', '')
+        if next_cursor == '':
+            return members
+        params['cursor'] = next_cursor
+
+
+USER_DIRECTORY = UserDirectory()
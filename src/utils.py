@@ -1,92 +1,72 @@
-import os
-from datetime import datetime, timedelta
-from decimal import Decimal
-from db import scan_nas_records
+from db import load_leaderboard, load_week_nas_records, scan_nas_records
+import heapq
 from collections import Counter
-import requests
 
-import pytz
+from metrics import timed
+from user_directory import USER_DIRECTORY
+from week_calendar import get_last_week_start_timestamp, get_week_id, get_week_start_timestamp
 
 
 def get_ref_timestamp():
-    timezone = pytz.timezone('Asia/Tokyo')
-    now = datetime.now(tz=timezone)
+    return get_week_start_timestamp()
 
-    diff_from_ref_day = timedelta(days=now.weekday())
-    format_ref_date = datetime(now.year, now.month, now.day, 0, 0, 0)
 
-    ref_timestamp = format_ref_date - diff_from_ref_day
-    return Decimal(ref_timestamp.timestamp())
+def get_last_week_ref_timestamp():
+    return get_last_week_start_timestamp()
 
 
-def get_last_week_ref_timestamp():
-    timezone = pytz.timezone('Asia/Tokyo')
-    now = datetime.now(tz=timezone)
-    diff_from_ref_day_plus_a_week = timedelta(days=now.weekday()+7)
+@timed('utils.count_receive_nas_this_week')
+def count_receive_nas_this_week(team_id=None):
+    # {receive_user_id: nas num}. grouped by the id, so a user who renamed keeps one total
+    if team_id is not None:
+        leaderboard = load_leaderboard(team_id, get_week_id())
+        if leaderboard is not None:
+            return {item['receive_user_id']: int(item['receive_nas_num']) for item in leaderboard}
 
-    format_ref_date = datetime(now.year, now.month, now.day, 0, 0, 0)
-    ref_timestamp_past_a_week = format_ref_date - diff_from_ref_day_plus_a_week
-    return Decimal(ref_timestamp_past_a_week.timestamp())
+    # no leaderboard, so aggregate the NAS records of this week
+    nas_records = load_week_nas_records(get_week_id())
+    if nas_records is None:
+        ref_timestamp = get_ref_timestamp()
+        nas_records = scan_nas_records(ref_timestamp)
 
+    return dict(Counter(item['receive_user_id'] for item in nas_records))
 
-def calc_nas_ranking_this_week():
-    ref_timestamp = get_ref_timestamp()
-    nas_records = scan_nas_records(ref_timestamp)
 
-    if nas_records == []:
-        return {}
+def ranking_order(entry):
+    # the most nas first, and the ties in the order of the user id
+    user_id, nas_num = entry
+    return -nas_num, user_id
 
-    receive_user_list = []
-    for item in nas_records:
-        receive_user_list.append(item['receive_user_name'])
 
-    ranking_source = Counter(receive_user_list)
-    receive_users, nas_counts = zip(*ranking_source.most_common())
-    return dict(zip(receive_users, nas_counts))
+def select_top_ranking(receive_nas_nums, top_k):
+    # [(rank, user_id, nas_num)] of the top k, without sorting every receiver. tied users share the rank, as 1, 2, 2, 4.
+    ranking = []
+    for position, (user_id, nas_num) in enumerate(heapq.nsmallest(top_k, receive_nas_nums.items(), key=ranking_order), 1):
+        if len(ranking) > 0 and ranking[-1][2] == nas_num:
+            ranking.append((ranking[-1][0], user_id, nas_num))
+        else:
+            ranking.append((position, user_id, nas_num))
+    return ranking
 
 
-def parse_lambda_event_str(lambda_event_obj):
-    content_body = lambda_event_obj['body'].split('&')
-    parsed_dict = {}
-    for param in content_body:
-        content_separate_index = param.find('=')
-        content_key = param[:content_separate_index]
-        content_value = param[content_separate_index+1:]
-        parsed_dict[content_key] = content_value
-    return parsed_dict
+def find_user_rank(receive_nas_nums, user_id):
+    # (rank, nas_num) of one user, in the same order as select_top_ranking. None when the user got no nas this week.
+    if user_id not in receive_nas_nums:
+        return None, 0
+    nas_num = receive_nas_nums[user_id]
+    return 1 + sum(1 for other_nas_num in receive_nas_nums.values() if other_nas_num > nas_num), nas_num
 
 
+@timed('utils.bring_slack_id_from_slack_name')
 def bring_slack_id_from_slack_name(user_name):
-    try:
-        slack_api_url = "https://slack.com/api/users.list"
-        slack_oauth_token = os.environ["SLACK_OAUTH_ACCESS_TOKEN"]
+    return USER_DIRECTORY.get_user_id(user_name)
 
-        params = {'token': slack_oauth_token}
-        user_list = requests.get(slack_api_url, params=params).json()
 
-        for user in user_list["members"]:
-            if user_name == user["name"]:
-                user_id = user['id']
-                break
-        return user_id
-    except Exception as e:
-        print(e)
-        return ''
+@timed('utils.bring_slack_name_from_slack_id')
+def bring_slack_name_from_slack_id(user_id):
+    return USER_DIRECTORY.get_user_name(user_id)
 
 
-def bring_slack_name_from_slack_id(user_id):
-    try:
-        slack_api_url = "https://slack.com/api/users.list"
-        slack_oauth_token = os.environ["SLACK_OAUTH_ACCESS_TOKEN"]
-
-        params = {'token': slack_oauth_token}
-        user_list = requests.get(slack_api_url, params=params).json()
-
-        for user in user_list["members"]:
-            if user_id == user['id']:
-                user_name = user['name']
-                break
-        return user_name
-    except Exception as e:
-        print(e)
-        return ''
+@timed('utils.bring_slack_names_from_slack_ids')
+def bring_slack_names_from_slack_ids(user_ids):
+    return USER_DIRECTORY.get_user_names(user_ids)
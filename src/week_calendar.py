@@ -0,0 +1,69 @@
+import os
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytz
+
+NAS_TIMEZONE = os.environ.get('NAS_TIMEZONE', 'Asia/Tokyo')
+# 0 is monday, 6 is sunday
+NAS_WEEK_START = int(os.environ.get('NAS_WEEK_START', 0))
+
+
+class WeekCalendar:
+    def __init__(self, timezone_name=NAS_TIMEZONE, week_start=NAS_WEEK_START):
+        self.timezone = pytz.timezone(timezone_name)
+        self.week_start = week_start
+        # most calls ask for the same week, so the last one is kept. (start, end, week_id)
+        self.cached_week = (0.0, 0.0, '')
+
+    def week_bounds(self, time_stamp=None):
+        if time_stamp is None:
+            time_stamp = time.time()
+        time_stamp = float(time_stamp)
+
+        cached_week = self.cached_week
+        if cached_week[0] <= time_stamp < cached_week[1]:
+            return cached_week
+
+        local_now = datetime.fromtimestamp(time_stamp, tz=self.timezone)
+        start_date = local_now.date() - timedelta(days=(local_now.weekday() - self.week_start) % 7)
+        # midnight of the local timezone, whatever the timezone of the host is
+        start = self.timezone.localize(datetime(start_date.year, start_date.month, start_date.day))
+        end_date = start_date + timedelta(days=7)
+        end = self.timezone.localize(datetime(end_date.year, end_date.month, end_date.day))
+
+        self.cached_week = (start.timestamp(), end.timestamp(), start_date.isoformat())
+        return self.cached_week
+
+    def week_id(self, time_stamp=None):
+        return self.week_bounds(time_stamp)[2]
+
+    def week_start_timestamp(self, time_stamp=None):
+        return Decimal(self.week_bounds(time_stamp)[0])
+
+    def last_week_bounds(self):
+        # the bounds of this week are cached, so last week is looked up from its start
+        this_week_start = self.week_bounds()[0]
+        last_week_start = datetime.fromtimestamp(this_week_start, tz=self.timezone) - timedelta(days=7)
+        start = self.timezone.localize(datetime(last_week_start.year, last_week_start.month, last_week_start.day))
+        return (start.timestamp(), this_week_start, start.date().isoformat())
+
+
+WEEK_CALENDAR = WeekCalendar()
+
+
+def get_week_id(time_stamp=None):
+    return WEEK_CALENDAR.week_id(time_stamp)
+
+
+def get_last_week_id():
+    return WEEK_CALENDAR.last_week_bounds()[2]
+
+
+def get_week_start_timestamp():
+    return WEEK_CALENDAR.week_start_timestamp()
+
+
+def get_last_week_start_timestamp():
+    return Decimal(WEEK_CALENDAR.last_week_bounds()[0])
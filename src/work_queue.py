@@ -0,0 +1,139 @@
+import fcntl
+import json
+import os
+import time
+import uuid
+
+import boto3
+
+NAS_WORK_QUEUE = os.environ.get('NAS_WORK_QUEUE', '')
+NAS_WORK_QUEUE_URL = os.environ.get('NAS_WORK_QUEUE_URL', '')
+NAS_WORK_QUEUE_PATH = os.environ.get('NAS_WORK_QUEUE_PATH', '/tmp/nas_work_queue.jsonl')
+# seconds a received message is hidden before it is received again, if the worker did not ack it
+NAS_WORK_QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get('NAS_WORK_QUEUE_VISIBILITY_TIMEOUT', 60))
+
+
+class SQSWorkQueue:
+    def __init__(self, queue_url, sqs_client=None):
+        self.queue_url = queue_url
+        self.sqs_client = sqs_client
+
+    def client(self):
+        # created on first use and kept for warm invocations
+        if self.sqs_client is None:
+            self.sqs_client = boto3.client('sqs')
+        return self.sqs_client
+
+    def enqueue(self, message, delay_seconds=0):
+        self.client().send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(message),
+            DelaySeconds=int(delay_seconds)
+        )
+        return True
+
+    def receive(self, max_messages=10):
+        # the worker Lambda is normally triggered by SQS, but the queue can also be polled.
+        # a received message comes back after the visibility timeout unless it is acked.
+        response = self.client().receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=max_messages, WaitTimeSeconds=0)
+        return [(sqs_message['ReceiptHandle'], json.loads(sqs_message['Body'])) for sqs_message in response.get('Messages', [])]
+
+    def ack(self, receipt_handle):
+        self.client().delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt_handle)
+        return True
+
+
+class LocalFileWorkQueue:
+    def __init__(self, path, visibility_timeout=NAS_WORK_QUEUE_VISIBILITY_TIMEOUT):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+
+    def enqueue(self, message, delay_seconds=0):
+        with open(self.path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(json.dumps({'id': uuid.uuid4().hex, 'visible_at': time.time() + delay_seconds, 'message': message}) + '\n')
+        return True
+
+    def receive(self):
+        # like SQS, the received entries are hidden until they are acked or the visibility timeout passes
+        now = time.time()
+        visible_entries = []
+
+        def hide_visible_entries(entries):
+            for entry in entries:
+                if entry['visible_at'] <= now:
+                    entry['visible_at'] = now + self.visibility_timeout
+                    visible_entries.append(entry)
+            return entries
+
+        self.rewrite(hide_visible_entries)
+        return [(entry['id'], entry['message']) for entry in visible_entries]
+
+    def ack(self, receipt_handle):
+        self.rewrite(lambda entries: [entry for entry in entries if entry['id'] != receipt_handle])
+        return True
+
+    def rewrite(self, update_entries):
+        if os.path.exists(self.path) is False:
+            return
+
+        with open(self.path, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            entries = update_entries([json.loads(line) for line in f if line.strip() != ''])
+
+            f.seek(0)
+            f.truncate()
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+
+
+class InProcessWorkQueue:
+    def __init__(self, visibility_timeout=NAS_WORK_QUEUE_VISIBILITY_TIMEOUT):
+        self.visibility_timeout = visibility_timeout
+        # {receipt handle: [visible_at, message]}, in the order they were enqueued
+        self.entries = {}
+
+    def enqueue(self, message, delay_seconds=0):
+        self.entries[uuid.uuid4().hex] = [time.time() + delay_seconds, message]
+        return True
+
+    def receive(self):
+        now = time.time()
+        received = []
+        for receipt_handle, entry in self.entries.items():
+            if entry[0] <= now:
+                entry[0] = now + self.visibility_timeout
+                received.append((receipt_handle, entry[1]))
+        return received
+
+    def ack(self, receipt_handle):
+        self.entries.pop(receipt_handle, None)
+        return True
+
+
+def messages_from_sqs_event(event):
+    # (messageId, message), so that the failed messages can be reported back to SQS
+    return [(record['messageId'], json.loads(record['body'])) for record in event.get('Records', [])]
+
+
+_work_queue = None
+
+
+def get_work_queue():
+    global _work_queue
+    if _work_queue is not None:
+        return _work_queue
+
+    if NAS_WORK_QUEUE == 'sqs':
+        _work_queue = SQSWorkQueue(NAS_WORK_QUEUE_URL)
+    elif NAS_WORK_QUEUE == 'local':
+        _work_queue = LocalFileWorkQueue(NAS_WORK_QUEUE_PATH)
+    elif NAS_WORK_QUEUE == 'memory':
+        _work_queue = InProcessWorkQueue()
+    # without a queue, the commands are run in the request itself
+    return _work_queue
+
+
+def set_work_queue(work_queue):
+    global _work_queue
+    _work_queue = work_queue
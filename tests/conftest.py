@@ -5,6 +5,24 @@ import pytest
 from moto import mock_dynamodb2
 
 
+@pytest.fixture(autouse=True)
+def dynamodb_handles():
+    # db.py keeps its DynamoDB handles across calls, so start every test with fresh ones
+    from dynamo import reset_dynamodb
+    reset_dynamodb()
+    yield
+    reset_dynamodb()
+
+
+@pytest.fixture(autouse=True)
+def event_dedup_cache():
+    # main.py remembers the events it has seen, so each test starts with none
+    from event_dedup import EVENT_DEDUPLICATOR
+    EVENT_DEDUPLICATOR.clear()
+    yield
+    EVENT_DEDUPLICATOR.clear()
+
+
 @pytest.fixture
 def nas_db():
     with mock_dynamodb2():
@@ -20,6 +38,10 @@ def nas_db():
                 {
                     'AttributeName': 'time_stamp',
                     'AttributeType': 'N'
+                },
+                {
+                    'AttributeName': 'week_id',
+                    'AttributeType': 'S'
                 }
             ],
             KeySchema=[
@@ -32,6 +54,28 @@ def nas_db():
                     'KeyType': 'RANGE'
                 },
             ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'week_id-index',
+                    'KeySchema': [
+                        {
+                            'AttributeName': 'week_id',
+                            'KeyType': 'HASH'
+                        },
+                        {
+                            'AttributeName': 'time_stamp',
+                            'KeyType': 'RANGE'
+                        }
+                    ],
+                    'Projection': {
+                        'ProjectionType': 'ALL'
+                    },
+                    'ProvisionedThroughput': {
+                        'ReadCapacityUnits': 15,
+                        'WriteCapacityUnits': 5,
+                    }
+                }
+            ],
             ProvisionedThroughput={
                 'ReadCapacityUnits': 15,
                 'WriteCapacityUnits': 5,
@@ -69,3 +113,157 @@ def nas_gacha_db():
 
         nas_gacha_db = dynamoDB.Table('NAS_GACHA')
         yield nas_gacha_db
+
+
+@pytest.fixture
+def nas_counter_db(nas_db):
+    dynamoDB = boto3.resource('dynamodb')
+    dynamoDB.create_table(
+        TableName='NAS_WEEKLY_COUNTER',
+        AttributeDefinitions=[
+            {
+                'AttributeName': 'user_id',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'week_id',
+                'AttributeType': 'S'
+            }
+        ],
+        KeySchema=[
+            {
+                'AttributeName': 'user_id',
+                'KeyType': 'HASH'
+            },
+            {
+                'AttributeName': 'week_id',
+                'KeyType': 'RANGE'
+            },
+        ],
+        ProvisionedThroughput={
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5,
+        }
+    )
+
+    nas_counter_db = dynamoDB.Table('NAS_WEEKLY_COUNTER')
+    yield nas_counter_db
+
+
+@pytest.fixture
+def nas_leaderboard_db(nas_db):
+    dynamoDB = boto3.resource('dynamodb')
+    dynamoDB.create_table(
+        TableName='NAS_LEADERBOARD',
+        AttributeDefinitions=[
+            {
+                'AttributeName': 'team_week',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'receive_user_id',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'receive_nas_num',
+                'AttributeType': 'N'
+            }
+        ],
+        KeySchema=[
+            {
+                'AttributeName': 'team_week',
+                'KeyType': 'HASH'
+            },
+            {
+                'AttributeName': 'receive_user_id',
+                'KeyType': 'RANGE'
+            },
+        ],
+        LocalSecondaryIndexes=[
+            {
+                'IndexName': 'receive_nas_num-index',
+                'KeySchema': [
+                    {
+                        'AttributeName': 'team_week',
+                        'KeyType': 'HASH'
+                    },
+                    {
+                        'AttributeName': 'receive_nas_num',
+                        'KeyType': 'RANGE'
+                    },
+                ],
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                }
+            }
+        ],
+        ProvisionedThroughput={
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5,
+        }
+    )
+
+    nas_leaderboard_db = dynamoDB.Table('NAS_LEADERBOARD')
+    yield nas_leaderboard_db
+
+
+@pytest.fixture
+def nas_gacha_history_db(nas_gacha_db):
+    dynamoDB = boto3.resource('dynamodb')
+    dynamoDB.create_table(
+        TableName='NAS_GACHA_HISTORY',
+        AttributeDefinitions=[
+            {
+                'AttributeName': 'user_id',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'time_stamp',
+                'AttributeType': 'N'
+            }
+        ],
+        KeySchema=[
+            {
+                'AttributeName': 'user_id',
+                'KeyType': 'HASH'
+            },
+            {
+                'AttributeName': 'time_stamp',
+                'KeyType': 'RANGE'
+            },
+        ],
+        ProvisionedThroughput={
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5,
+        }
+    )
+
+    nas_gacha_history_db = dynamoDB.Table('NAS_GACHA_HISTORY')
+    yield nas_gacha_history_db
+
+
+@pytest.fixture
+def nas_event_dedup_db(nas_db):
+    dynamoDB = boto3.resource('dynamodb')
+    dynamoDB.create_table(
+        TableName='NAS_EVENT_DEDUP',
+        AttributeDefinitions=[
+            {
+                'AttributeName': 'event_key',
+                'AttributeType': 'S'
+            }
+        ],
+        KeySchema=[
+            {
+                'AttributeName': 'event_key',
+                'KeyType': 'HASH'
+            }
+        ],
+        ProvisionedThroughput={
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5,
+        }
+    )
+
+    nas_event_dedup_db = dynamoDB.Table('NAS_EVENT_DEDUP')
+    yield nas_event_dedup_db
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import copy
+
+from benchmarks.bench_commands import BENCHMARK_COMMANDS, compare_results, run_benchmark
+
+
+def test_run_benchmark(mocker):
+    """Benchmark every command of main_func against seeded tables
+    NAS and NAS_GACHA are seeded with skewed heavy users, and each command is run for a heavy and a typical user
+    with the Slack API stubbed.
+    Each command records the wall time, the DynamoDB calls, the items read and the Slack calls.
+
+    Args:
+        sizes: the numbers of the NAS records to seed
+        user_num: the number of the users
+        week_num: the records are spread over these weeks
+        repeat: runs of each command. The median is recorded.
+
+    Return:
+        dict: the baseline. {'meta': ..., 'results': {size: {command:profile: measurement}}}
+    """
+    # the benchmark sets the environment variables it needs
+    mocker.patch.dict('os.environ')
+    benchmark = run_benchmark(sizes=[200], user_num=10, week_num=2, repeat=1)
+
+    results = benchmark['results']['200']
+    assert sorted(results) == sorted('{0}:{1}'.format(name, profile) for name, _, _ in BENCHMARK_COMMANDS
+                                     for profile in ['heavy', 'typical'])
+    assert results['/nas_st:heavy']['dynamodb_calls'] > 0
+    assert results['reaction:typical']['slack_calls'] > 0
+    assert benchmark['meta']['backend'] == 'moto'
+
+
+def test_compare_results():
+    """Find the regressions from the baseline
+    The calls and the items read must not grow. The wall time may grow up to the tolerance.
+
+    Args:
+        baseline: the baseline json
+        current: the result of this run
+        tolerance: allowed ratio of the wall time
+
+    Return:
+        list: the regressions
+    """
+    baseline = {'results': {'10000': {'/nas_st:heavy': {'wall_time_ms': 10.0, 'dynamodb_calls': 3, 'items_read': 2, 'slack_calls': 0}}}}
+    assert compare_results(baseline, baseline) == []
+
+    current = copy.deepcopy(baseline)
+    current['results']['10000']['/nas_st:heavy'].update({'wall_time_ms': 14.0, 'items_read': 10000})
+    assert compare_results(baseline, current, tolerance=1.5) == ['10000 /nas_st:heavy items_read: 2 -> 10000']
+    assert len(compare_results(baseline, current, tolerance=1.2)) == 2
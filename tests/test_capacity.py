@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from capacity import CAPACITY
+from src.capacity import CapacityBudget, CapacityTracker, CapacityUsage, count_scanned_items, parse_consumed_units
+from src.db import create_nas_record, load_send_nas_num
+
+
+def test_parse_consumed_units():
+    """Split the consumed capacity of a call into read and write units
+    The item operations return one ConsumedCapacity, the batches and the transactions return a list of them.
+    With TOTAL, only CapacityUnits is returned, so the units are charged by the kind of the operation.
+
+    Args:
+        operation: the name of the DynamoDB operation
+        parsed: the parsed response
+
+    Return:
+        tuple: (read units, write units)
+    """
+    assert parse_consumed_units('Query', {'ConsumedCapacity': {'TableName': 'NAS', 'CapacityUnits': 2.5}}) == (2.5, 0.0)
+    assert parse_consumed_units('PutItem', {'ConsumedCapacity': {'TableName': 'NAS', 'CapacityUnits': 1.0}}) == (0.0, 1.0)
+    assert parse_consumed_units('BatchWriteItem', {'ConsumedCapacity': [
+        {'TableName': 'NAS', 'CapacityUnits': 3.0},
+        {'TableName': 'NAS_WEEKLY_COUNTER', 'CapacityUnits': 1.0}
+    ]}) == (0.0, 4.0)
+    assert parse_consumed_units('TransactWriteItems', {'ConsumedCapacity': [
+        {'TableName': 'NAS_GACHA', 'CapacityUnits': 4.0, 'ReadCapacityUnits': 2.0, 'WriteCapacityUnits': 2.0}
+    ]}) == (2.0, 2.0)
+    assert parse_consumed_units('GetItem', {}) == (0.0, 0.0)
+
+
+def test_count_scanned_items():
+    """Count the items a call read and the items it returned
+    A query or a scan is charged for every item it reads, even when the filter drops it.
+
+    Args:
+        parsed: the parsed response
+
+    Return:
+        tuple: (scanned items, returned items)
+    """
+    assert count_scanned_items({'Items': [], 'Count': 2, 'ScannedCount': 40}) == (40, 2)
+    assert count_scanned_items({'Item': {'user_id': 'test_user_A_id'}}) == (1, 1)
+    assert count_scanned_items({'Responses': {'NAS': [{}, {}], 'NAS_GACHA': [{}]}}) == (3, 3)
+    assert count_scanned_items({}) == (0, 0)
+
+
+def test_capacity_budget():
+    """Check the DynamoDB usage of a command against its budget
+    A limit of None is no limit.
+
+    Args:
+        usage: the CapacityUsage of the command
+
+    Return:
+        list: the exceeded limits
+    """
+    usage = CapacityUsage()
+    usage.add(1.5, 0.0, 120, 3)
+    usage.add(0.0, 2.0, 0, 0)
+
+    assert CapacityBudget().exceeded(usage) == []
+    assert CapacityBudget(calls=2, read_units=1.5, write_units=2, scanned_items=120).exceeded(usage) == []
+    assert CapacityBudget(calls=1, read_units=4, scanned_items=100).exceeded(usage) == ['calls 2 > 1', 'scanned_items 120 > 100']
+
+
+def test_capacity_tracker():
+    """Sum the consumed capacity of a command and warn when it is over the budget
+    The usage is printed once per command, with a warning and the usage per table when it is over the budget.
+    """
+    lines = []
+    tracker = CapacityTracker(enabled=True, sink=lines.append)
+    tracker.start('/nas_st')
+    tracker.record('Query', 'NAS', {'ConsumedCapacity': {'TableName': 'NAS', 'CapacityUnits': 0.5}, 'Count': 2, 'ScannedCount': 2})
+    tracker.record('PutItem', 'NAS_EVENT_DEDUP', {'ConsumedCapacity': {'TableName': 'NAS_EVENT_DEDUP', 'CapacityUnits': 1.0}})
+    assert tracker.usage.as_dict() == {'calls': 2, 'read_units': 0.5, 'write_units': 1.0, 'scanned_items': 2, 'returned_items': 2}
+    assert tracker.tables['NAS'].read_units == 0.5
+
+    assert tracker.finish(CapacityBudget(calls=2, read_units=1, write_units=1)) == []
+    assert lines == ['capacity /nas_st: 2 calls, 0.5 RCU, 1.0 WCU, 2 scanned, 2 returned']
+
+    assert tracker.finish(CapacityBudget(write_units=0.5)) == ['write_units 1.0 > 0.5']
+    assert lines[-1] == 'WARNING capacity budget of /nas_st exceeded: write_units 1.0 > 0.5 ' \
+        '(NAS 0.5 RCU 0.0 WCU, NAS_EVENT_DEDUP 0.0 RCU 1.0 WCU)'
+
+    tracker.start('/nas_rank')
+    assert tracker.usage.calls == 0
+    assert CapacityTracker(enabled=False).finish(CapacityBudget(calls=0)) == []
+
+
+def test_consumed_capacity(nas_db, mocker):
+    """Collect the consumed capacity of every DynamoDB call
+    The calls of db.py do not ask for it themselves. The handles ask for it with a botocore hook,
+    so every call that can return ConsumedCapacity does.
+    """
+    mocker.patch.object(CAPACITY, 'usage', CapacityUsage())
+    mocker.patch.object(CAPACITY, 'tables', {})
+
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    assert load_send_nas_num('test_user_A_id', 0) == 1
+
+    assert CAPACITY.tables['NAS'].calls == 2
+    assert CAPACITY.tables['NAS'].read_units > 0
+    assert CAPACITY.tables['NAS'].write_units > 0
+    assert CAPACITY.tables['NAS'].returned_items == 1
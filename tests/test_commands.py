@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import json
+
+from src.commands import COMMANDS, Command, format_gacha_results, get_command, parse_roll_num, register, send_delayed_reply
+from src.send_message import ReplyChannel
+from src.slack_event import SlackRequest
+from src.work_queue import InProcessWorkQueue
+
+
+def test_register():
+    """Register a command handler
+    Every slash command, and the reaction event as /nas_stamp, is a handler object in the registry.
+    Each handler lists the modules it depends on, and they are imported on its first run.
+    So /nas_st and the reaction events do not pay for the gacha module.
+
+    Args:
+        command_class: Command subclass with the name of the command
+
+    Return:
+        class: the registered class
+    """
+
+    @register
+    class SampleCommand(Command):
+        name = '/sample_command'
+        dependencies = ('json',)
+
+        def handle(self, request, reply_channel):
+            reply_channel.send(request.text)
+
+    command = get_command('/sample_command')
+    assert isinstance(command, SampleCommand)
+
+    reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample')
+    command.run(SlackRequest('test_user_A_id', 'test_team_id', 'sample_channel', '/sample_command', text='sample_massage!'), reply_channel)
+    assert command.loaded is True
+    assert reply_channel.close()['text'] == 'sample_massage!'
+    del COMMANDS['/sample_command']
+
+
+def test_get_command():
+    """Get the handler of the command
+    None is returned for an unknown command.
+
+    Args:
+        name: the command. ex) /nas
+
+    Return:
+        Command: the handler
+    """
+    for name in ['/nas', '/nas_stamp', '/nas_rank', '/nas_st', '/nas_gacha', '/nas_gacha_status', '/nas_gacha_tickets',
+                 '/use_nas_gacha_ticket']:
+        assert get_command(name).name == name
+    assert get_command('/unknown') is None
+
+    assert 'gacha' not in get_command('/nas_st').dependencies
+    assert 'gacha' not in get_command('/nas_stamp').dependencies
+
+
+def test_send_delayed_reply(mocker):
+    """Send a reply after a pause without keeping the worker busy
+    The gacha result is revealed a few seconds after "デュルデュルデュルデュル...".
+    With a work queue, the reveal is enqueued as a delayed message and the worker finishes at once.
+    Without a work queue, it waits in the request as before.
+
+    Args:
+        reply_channel: the channel to reply to
+        send_message: slack send message
+        delay_seconds: seconds before the message is sent. GACHA_REVEAL_DELAY
+    """
+    session_request = mocker.patch('requests.Session.request')
+    session_request.return_value.status_code = 200
+    work_queue = InProcessWorkQueue()
+    mocker.patch('work_queue.get_work_queue', return_value=work_queue)
+
+    reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample', inline=False)
+    assert send_delayed_reply(reply_channel, 'sample_massage!', 0) is True
+    assert session_request.call_count == 0
+    assert work_queue.receive()[0][1]['text'] == 'sample_massage!'
+
+    mocker.patch('work_queue.get_work_queue', return_value=None)
+    assert send_delayed_reply(reply_channel, 'sample_massage!', 0) is True
+    assert session_request.call_args[0][1] == 'https://hooks.slack.com/commands/sample'
+
+    # the message held for the inline response is posted before the pause
+    reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample')
+    reply_channel.send('デュルデュルデュルデュル...')
+    session_request.reset_mock()
+    posted_before_sleep = []
+    mocker.patch('time.sleep', side_effect=lambda seconds: posted_before_sleep.append(session_request.call_count))
+    send_delayed_reply(reply_channel, 'sample_massage!', 3)
+    assert posted_before_sleep == [1]
+    assert json.loads(session_request.call_args[1]['data'])['text'] == 'デュルデュルデュルデュル...'
+    assert reply_channel.close()['text'] == 'sample_massage!'
+
+
+def test_parse_roll_num():
+    """Parse the number of the gacha rolls
+    /nas_gacha rolls once, /nas_gacha 5 rolls 5 times and /nas_gacha all rolls every available roll.
+
+    Args:
+        text: the text of the command
+        available_roll_num: the number of the available rolls
+
+    Return:
+        int: the number of the rolls. None if the text is not a number.
+    """
+    assert parse_roll_num('', 3) == 1
+    assert parse_roll_num('5', 3) == 5
+    assert parse_roll_num('all', 3) == 3
+    assert parse_roll_num('0', 3) is None
+    assert parse_roll_num('many', 3) is None
+
+
+def test_format_gacha_results():
+    """Summarize the results of the gacha rolls into one message
+
+    Args:
+        gacha_results: result of each roll
+        remain_nas_gacha: the number of the remaining rolls
+
+    Return:
+        str: slack message
+    """
+    assert format_gacha_results(['prize_2', '', 'prize_1', 'prize_2'], 1) == \
+        "ドン！4回の結果は3回あたりでした！\n当たった景品\nprize_1 x1\nprize_2 x2\n残りのガチャ回数は1回です"
+    assert format_gacha_results(['', ''], 0) == "ドン！2回の結果は全部はずれでした！\n残りのガチャ回数は0回です"
+
+
+def test_nas_stamp_command_not_nas_stamp(mocker):
+    """Drop the reactions that are not nas stamps
+    Most reactions are not nas stamps, so they are dropped before the Slack users and the NAS table are looked up.
+
+    Args:
+        request: the reaction request
+        reply_channel: the channel to reply to
+    """
+    session_request = mocker.patch('requests.Session.request')
+    reply_channel = ReplyChannel('sample_channel', 'test_user_A_id')
+
+    request = SlackRequest('test_user_A_id', 'test_team_id', 'sample_channel', '/nas_stamp',
+                           receive_user_id='test_user_A_id', stamp='some_stamp')
+    get_command('/nas_stamp').run(request, reply_channel)
+    assert session_request.call_count == 0
+    assert reply_channel.close() == ''
+
+
+def test_nas_rank_command(mocker):
+    """Show the top of the NAS ranking and the rank of the user
+    Only the top NAS_RANK_SIZE users are shown, so the message stays small in a large team.
+    Their names are resolved in one batch, and the user who ran the command sees their own rank and NAS.
+
+    Args:
+        request: the /nas_rank request
+        reply_channel: the channel to reply to
+    """
+    mocker.patch('src.commands.NAS_RANK_SIZE', 2)
+    mocker.patch('utils.count_receive_nas_this_week', return_value={
+        'test_user_A_id': 1, 'test_user_B_id': 3, 'test_user_C_id': 3, 'test_user_D_id': 2
+    })
+    bring_slack_names = mocker.patch('utils.bring_slack_names_from_slack_ids', return_value={
+        'test_user_B_id': 'test_user_B_name', 'test_user_C_id': ''
+    })
+    request = SlackRequest('test_user_A_id', 'test_team_id', 'sample_channel', '/nas_rank')
+
+    reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample')
+    get_command('/nas_rank').run(request, reply_channel)
+    bring_slack_names.assert_called_once_with(['test_user_B_id', 'test_user_C_id'])
+    assert reply_channel.close()['text'] == "今週のnasランキング\n順位 ユーザ名 貰ったnas数\n" \
+        "1. test_user_B_name\t3\n1. test_user_C_id\t3\nあなたは4人中4位、貰ったnas数は1です\n"
+
+    request = SlackRequest('test_user_Z_id', 'test_team_id', 'sample_channel', '/nas_rank')
+    reply_channel = ReplyChannel('sample_channel', 'test_user_Z_id', 'https://hooks.slack.com/commands/sample')
+    get_command('/nas_rank').run(request, reply_channel)
+    assert reply_channel.close()['text'].endswith("あなたは今週まだnasを貰っていません\n")
+
+
+def test_command_without_args(mocker):
+    """Reply the usage when a command needs arguments and has none
+    /nas needs the user to send to and /use_nas_gacha_ticket needs the prize,
+    so they reply how to use them instead of failing.
+
+    Args:
+        request: the request without text
+        reply_channel: the channel to reply to
+    """
+    session_request = mocker.patch('requests.Session.request')
+    for command, usage in [('/nas', '使い方: /nas @receive_user_name message'),
+                           ('/use_nas_gacha_ticket', '使い方: /use_nas_gacha_ticket prize_name')]:
+        request = SlackRequest('test_user_A_id', 'test_team_id', 'sample_channel', command, text=' ')
+        reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample')
+        get_command(command).run(request, reply_channel)
+        assert reply_channel.close()['text'] == usage
+    assert session_request.call_count == 0
@@ -2,9 +2,13 @@
 from datetime import datetime
 from decimal import Decimal
 
+import src.db
 from src.db import create_nas_record, load_send_nas_num, scan_nas_records, \
-    create_nas_gacha_record, load_latest_nas_gacha_record, scan_user_receive_nas_num
-from src.utils import get_ref_timestamp
+    create_nas_gacha_record, load_latest_nas_gacha_record, scan_user_receive_nas_num, iter_nas_records, \
+    add_weekly_send_nas_num, load_weekly_send_nas_num, rebuild_weekly_counters, \
+    add_leaderboard_nas_num, load_leaderboard, rebuild_leaderboard, load_nas_gacha_history, load_week_nas_records, backfill_week_ids
+from src.utils import get_last_week_ref_timestamp, get_ref_timestamp
+from src.week_calendar import get_week_id
 
 
 def test_load_send_nas_num(nas_db):
@@ -13,9 +17,14 @@ def test_load_send_nas_num(nas_db):
     The NAS, which can be sent every week, is reset and a ranking for the week is created.
     The user_id is created based on the slack's user_id.
 
+    Only the number of items is requested, so no attributes are sent over the wire,
+    and the query follows LastEvaluatedKey so heavy senders are not undercounted.
+    When end_timestamp is given, the records in [start_timestamp, end_timestamp) are counted.
+
     Args:
         user_id : slack user_id
-        ref_timestamp : Criteria for obtaining a timestamp greater than this
+        start_timestamp : Criteria for obtaining a timestamp greater than or equal to this
+        end_timestamp : Criteria for obtaining a timestamp less than this. Default is no limit.
 
     Returns:
         int : target user sended nas in this week
@@ -38,6 +47,12 @@ def test_load_send_nas_num(nas_db):
     assert load_send_nas_num('test_user_A', ref_timestamp) == 1
     assert load_send_nas_num('test_user_B', ref_timestamp) == 0
 
+    last_week_ref_timestamp = get_last_week_ref_timestamp()
+    nas['time_stamp'] = last_week_ref_timestamp
+    nas_db.put_item(Item=nas)
+    assert load_send_nas_num('test_user_A', last_week_ref_timestamp, ref_timestamp) == 1
+    assert load_send_nas_num('test_user_A', last_week_ref_timestamp) == 2
+
 
 def test_scan_nas_records(nas_db):
     """Use SCAN to retrieve all NAS records created prior to the specified period.
@@ -71,6 +86,46 @@ def test_scan_nas_records(nas_db):
     assert scan_nas_records(ref_timestamp)[0] == nas
 
 
+def test_iter_nas_records(mocker):
+    """Stream the NAS records with a parallel segmented scan
+    A single scan reads the whole NAS table page by page, so its latency grows with the history.
+    The table is split into total_segments segments that are scanned at the same time by a thread pool.
+    The records are yielded as soon as each page arrives.
+    The number of segments is set with the NAS_SCAN_SEGMENTS environment variable.
+    With 1 segment, it is a normal single-threaded scan.
+
+    Args:
+        ref_timestamp : Criteria for obtaining a timestamp greater than this
+        total_segments : the number of segments scanned in parallel
+
+    Return:
+        generator : nas records
+    """
+
+    class SegmentedTable():
+        # two pages per segment, and each item belongs to the segment of its id
+        def __init__(self, items):
+            self.items = items
+            self.scanned_segments = set()
+
+        def scan(self, Segment=0, TotalSegments=1, ExclusiveStartKey=None, **kwargs):
+            self.scanned_segments.add(Segment)
+            segment_items = [item for item in self.items if item['id'] % TotalSegments == Segment]
+            if ExclusiveStartKey is None:
+                return {'Items': segment_items[:1], 'LastEvaluatedKey': {'id': 'next'}}
+            return {'Items': segment_items[1:]}
+
+    items = [{'id': i} for i in range(20)]
+    table = SegmentedTable(items)
+    mocker.patch('src.db.get_table').return_value = table
+
+    nas_records = list(iter_nas_records(Decimal(0), 4))
+    assert sorted(nas_records, key=lambda x: x['id']) == items
+    assert table.scanned_segments == {0, 1, 2, 3}
+
+    assert sorted(scan_nas_records(Decimal(0), 1), key=lambda x: x['id']) == items
+
+
 def test_create_nas_record(nas_db):
     """Create a new NAS record
     When a user grants a NAS, a new record is added to the Dynamo DB.
@@ -84,6 +139,10 @@ def test_create_nas_record(nas_db):
         receive_user_name: slack user name
         nas_type: sended nas type. message or stamp
         team_id: slack team id
+        nas_num: the number of NAS to send. Default is 1.
+            Several NAS are written in one batch request, each with its own time_stamp.
+
+    Each record carries the week_id of the week it was sent, so the records of a week can be queried from week_id-index.
     """
 
     assert create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
@@ -93,6 +152,205 @@ def test_create_nas_record(nas_db):
 
     assert load_send_nas_num('test_user_B_id', ref_timestamp) == 0
 
+    assert create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id', 3)
+    assert load_send_nas_num('test_user_A_id', ref_timestamp) == 4
+    assert {nas_record['week_id'] for nas_record in scan_nas_records(ref_timestamp)} == {get_week_id()}
+
+
+def test_load_week_nas_records(nas_db):
+    """Load the NAS records of a week
+    The records of a week are one partition of week_id-index, so they are read by a query instead of a scan of the table.
+
+    Args:
+        week_id: week id. ex) 2020-05-04
+
+    Return:
+        list: NAS records of the week. None on error.
+    """
+    assert load_week_nas_records(get_week_id()) == []
+
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id', 2)
+    nas_db.put_item(Item={'tip_user_id': 'test_user_A_id', 'time_stamp': Decimal(1588518000), 'receive_user_id': 'test_user_B_id',
+                          'receive_user_name': 'test_user_B_name', 'tip_type': 'stamp', 'tip_user_name': 'test_user_A_name',
+                          'team_id': 'test_team_id', 'week_id': '2020-05-04'})
+
+    assert len(load_week_nas_records(get_week_id())) == 2
+    assert len(load_week_nas_records('2020-05-04')) == 1
+
+
+def test_backfill_week_ids(nas_db):
+    """Add week_id to the NAS records created before it was added
+    Those records are not in week_id-index until they have it.
+
+    Return:
+        int: the number of the backfilled records
+    """
+    nas_db.put_item(Item={'tip_user_id': 'test_user_A_id', 'time_stamp': Decimal(1588518000), 'receive_user_id': 'test_user_B_id',
+                          'receive_user_name': 'test_user_B_name', 'tip_type': 'stamp', 'tip_user_name': 'test_user_A_name',
+                          'team_id': 'test_team_id'})
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+
+    assert backfill_week_ids() == 1
+    assert len(load_week_nas_records('2020-05-04')) == 1
+    assert backfill_week_ids() == 0
+
+
+def test_add_weekly_send_nas_num(nas_counter_db):
+    """Add the number of sent NAS to the weekly counter
+    The number of NAS a user sent in a week is kept in NAS_WEEKLY_COUNTER,
+    keyed by the user and the week, so the weekly quota can be read with one GetItem.
+    create_nas_record() calls it every time a NAS record is written.
+    The counter is updated with an atomic ADD, so concurrent sends are not lost.
+
+    Args:
+        user_id : slack user id of the sender
+        week_id : the week bucket. The date of the monday of the week.
+        nas_num : the number of sent NAS. Default is 1.
+
+    Return:
+        bool : success or fail
+    """
+    week_id = get_week_id()
+    assert add_weekly_send_nas_num('test_user_A_id', week_id) is True
+    assert add_weekly_send_nas_num('test_user_A_id', week_id, 2) is True
+    assert nas_counter_db.get_item(Key={'user_id': 'test_user_A_id', 'week_id': week_id})['Item']['sent_nas_num'] == 3
+
+    assert create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) == 4
+
+
+def test_load_weekly_send_nas_num(nas_counter_db):
+    """Read the weekly counter of the user
+    It is a constant-time read no matter how many NAS the user has sent.
+    None is returned when there is no counter, so the caller can count the raw NAS records instead.
+
+    Args:
+        user_id : slack user id of the sender
+        week_id : the week bucket
+
+    Return:
+        int : sent nas num of the week. None if the counter does not exist.
+    """
+    week_id = get_week_id()
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) is None
+
+    add_weekly_send_nas_num('test_user_A_id', week_id)
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) == 1
+    assert load_weekly_send_nas_num('test_user_B_id', week_id) is None
+
+
+def test_rebuild_weekly_counters(nas_counter_db):
+    """Rebuild the weekly counters from the raw NAS records
+    The NAS table is the source of truth.
+    If a counter update failed, or the counters have to be created for old records,
+    the counters are recounted from the NAS records created after ref_timestamp.
+
+    Args:
+        ref_timestamp : Criteria for obtaining a timestamp greater than this. Default is all records.
+
+    Return:
+        int : the number of rebuilt counters
+    """
+    for i in range(3):
+        create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+
+    week_id = get_week_id()
+    add_weekly_send_nas_num('test_user_A_id', week_id, 10)
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) == 13
+
+    assert rebuild_weekly_counters() == 1
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) == 3
+
+
+def test_create_nas_record_counter_failed(nas_counter_db, mocker):
+    """Stop trusting the weekly counter when its update failed
+    check_can_send_nas reads the counter, so a counter that missed a send would let the user go over NAS_LIMIT.
+    The counter is marked stale instead, and the week is counted from the NAS records until rebuild_weekly_counters().
+    """
+    week_id = get_week_id()
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) == 1
+
+    mocker.patch.object(src.db, 'add_weekly_send_nas_num', return_value=False)
+    assert create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) is None
+    assert load_send_nas_num('test_user_A_id', get_ref_timestamp()) == 2
+
+    # the next sends do not clear the flag
+    mocker.stopall()
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) is None
+
+    assert rebuild_weekly_counters() == 1
+    assert load_weekly_send_nas_num('test_user_A_id', week_id) == 3
+
+
+def test_add_leaderboard_nas_num(nas_leaderboard_db):
+    """Add received NAS to the weekly leaderboard
+    The ranking of the week is kept in NAS_LEADERBOARD, one item per receiver, team and week.
+    create_nas_record() calls it every time a NAS record is written,
+    so /nas_rank does not have to aggregate all the NAS records of the week.
+
+    Args:
+        team_id : slack team id
+        week_id : the week bucket
+        receive_user_id : slack user id of the receiver
+        receive_user_name : slack user name of the receiver
+        nas_num : the number of received NAS. Default is 1.
+
+    Return:
+        bool : success or fail
+    """
+    week_id = get_week_id()
+    assert add_leaderboard_nas_num('test_team_id', week_id, 'test_user_B_id', 'test_user_B_name') is True
+    assert add_leaderboard_nas_num('test_team_id', week_id, 'test_user_B_id', 'test_user_B_name', 2) is True
+
+    leaderboard_item = nas_leaderboard_db.get_item(Key={'team_week': 'test_team_id#' + week_id, 'receive_user_id': 'test_user_B_id'})
+    assert leaderboard_item['Item']['receive_nas_num'] == 3
+    assert leaderboard_item['Item']['receive_user_name'] == 'test_user_B_name'
+
+
+def test_load_leaderboard(nas_leaderboard_db):
+    """Read the weekly leaderboard of the team
+    The receivers are returned sorted by the number of received NAS, in descending order.
+    None is returned when the leaderboard can not be read.
+
+    Args:
+        team_id : slack team id
+        week_id : the week bucket
+
+    Return:
+        list : leaderboard items
+    """
+    week_id = get_week_id()
+    assert load_leaderboard('test_team_id', week_id) == []
+
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_C_id', 'test_user_C_name', 'stamp', 'test_team_id', 2)
+
+    leaderboard = load_leaderboard('test_team_id', week_id)
+    assert [(item['receive_user_id'], item['receive_nas_num']) for item in leaderboard] == [('test_user_C_id', 2), ('test_user_B_id', 1)]
+    assert load_leaderboard('other_team_id', week_id) == []
+
+
+def test_rebuild_leaderboard(nas_leaderboard_db):
+    """Rebuild the weekly leaderboards from the raw NAS records
+    Like rebuild_weekly_counters(), the leaderboards are recounted from the NAS records created after ref_timestamp.
+
+    Args:
+        ref_timestamp : Criteria for obtaining a timestamp greater than this. Default is all records.
+
+    Return:
+        int : the number of rebuilt leaderboard items
+    """
+    for i in range(3):
+        create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    nas_leaderboard_db.delete_item(Key={'team_week': 'test_team_id#' + get_week_id(), 'receive_user_id': 'test_user_B_id'})
+    assert load_leaderboard('test_team_id', get_week_id()) == []
+
+    assert rebuild_leaderboard() == 1
+    assert load_leaderboard('test_team_id', get_week_id())[0]['receive_nas_num'] == 3
+
 
 def test_scan_user_receive_nas_num(nas_db):
     """Aggregate all the NAS the user has received so far.
@@ -122,6 +380,9 @@ def test_load_latest_nas_gacha_record(nas_gacha_db):
     Along with that, when creating a new record or wanting to know the status of the user,
     it is necessary to get the latest record.
     This function does not return the contents of the record, but gets all the latest records.
+    NAS_GACHA keeps only the current state of each user, so it is a single GetItem
+    no matter how many times the user has rolled the gacha.
+    The version is counted up every time the state is written.
 
     Args:
         gacha_user_id : The id of the user who wants to retrieve the latest record.
@@ -139,7 +400,8 @@ def test_load_latest_nas_gacha_record(nas_gacha_db):
         'time_stamp': Decimal(now.timestamp()),
         'has_nas_num': 10,
         'used_nas_num': 0,
-        'has_tickets': {}
+        'has_tickets': {},
+        'version': 1
     }
     assert load_latest_nas_gacha_record('test_user_A_id') == nas_gacha_record
 
@@ -150,7 +412,8 @@ def test_load_latest_nas_gacha_record(nas_gacha_db):
         'time_stamp': Decimal(now.timestamp()),
         'has_nas_num': 0,
         'used_nas_num': 10,
-        'has_tickets': {}
+        'has_tickets': {},
+        'version': 2
     }
     assert load_latest_nas_gacha_record('test_user_A_id') == nas_gacha_record
 
@@ -168,6 +431,35 @@ def test_create_nas_gacha_record(nas_gacha_db):
         has_nas_num: Total value of the NAS we received.
         used_nas_num: Already used nas for gacha.
         has_tickets: The list of freebies that the user has at that time.
+        expected_version: The version of the state the caller has read. 0 if there was no state.
+            If another request has updated the state in the meantime, nothing is written and False is returned.
+            Default is an unconditional write.
     """
     now = datetime.now()
     assert create_nas_gacha_record('test_user_A_id', Decimal(now.timestamp()), 10, 0, {}) is True
+
+    assert create_nas_gacha_record('test_user_B_id', Decimal(now.timestamp()), 10, 0, {}, 0) is True
+    assert create_nas_gacha_record('test_user_B_id', Decimal(now.timestamp()), 10, 10, {}, 0) is False
+    assert create_nas_gacha_record('test_user_B_id', Decimal(now.timestamp()), 10, 10, {}, 1) is True
+    assert load_latest_nas_gacha_record('test_user_B_id')['version'] == 2
+
+
+def test_load_nas_gacha_history(nas_gacha_history_db):
+    """Retrieve the latest gacha history of the user
+    Every state written by create_nas_gacha_record() is also appended to NAS_GACHA_HISTORY,
+    sorted by time_stamp. The newest records come first.
+
+    Args:
+        gacha_user_id : The id of the user who wants to retrieve the history.
+        limit : the number of records. Default is 10.
+
+    Return:
+        list : history records
+    """
+    assert load_nas_gacha_history('test_user_A_id') == []
+
+    for i in range(3):
+        create_nas_gacha_record('test_user_A_id', Decimal(i), 10, i * 10, {})
+
+    history = load_nas_gacha_history('test_user_A_id', 2)
+    assert [(record['used_nas_num'], record['version']) for record in history] == [(20, 3), (10, 2)]
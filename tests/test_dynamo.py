@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from src.dynamo import get_dynamodb_resource, get_table, override_dynamodb, reset_dynamodb
+
+
+def test_get_table(nas_db):
+    """Get a shared handle of the DynamoDB table
+    Creating a boto3 resource loads the session, the endpoint and the service model,
+    and opens a new HTTP connection pool. On Lambda that costs more than the query itself.
+    So the resource and the table handles are created once per process and reused
+    across warm invocations.
+
+    Args:
+        table_name : DynamoDB table name
+
+    Returns:
+        Table : boto3 table resource
+    """
+    reset_dynamodb()
+    assert get_dynamodb_resource() is get_dynamodb_resource()
+    assert get_table('NAS') is get_table('NAS')
+    assert get_table('NAS').table_name == 'NAS'
+
+    table = get_table('NAS')
+    reset_dynamodb()
+    assert get_table('NAS') is not table
+
+
+def test_override_dynamodb(nas_db):
+    """Inject DynamoDB handles from outside
+    Tests and local backends can replace the resource or a single table with their own handle.
+    Calling it without arguments removes the override.
+
+    Args:
+        resource : boto3 resource used instead of the shared one
+        tables : dict of table name and table handle used instead of the shared ones
+    """
+    override_dynamodb(tables={'NAS': 'local_nas_table'})
+    assert get_table('NAS') == 'local_nas_table'
+
+    override_dynamodb()
+    assert get_table('NAS') != 'local_nas_table'
+    reset_dynamodb()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import src.event_dedup
+from src.db import complete_event_key_record, create_event_key_record, delete_event_key_record
+from src.event_dedup import EventDeduplicator, get_event_key
+
+
+def test_get_event_key():
+    """Key of the event for the deduplication
+    An event of the Events API is keyed by its event_id.
+    A slash command has no id, so it is keyed by the fingerprint of its body.
+    The retry of a request has the same body, so it has the same key.
+
+    Args:
+        event: lambda event
+
+    Return:
+        str: the key of the event
+    """
+    assert get_event_key({'body': {'event_id': 'Ev01', 'event': {}}}) == 'event:Ev01'
+
+    command_event = {'body': 'command=/nas_st&trigger_id=1&response_url=https://hooks.slack.com/commands/sample'}
+    assert get_event_key(command_event).startswith('command:')
+    assert get_event_key(command_event) == get_event_key(dict(command_event))
+    assert get_event_key(command_event) != get_event_key({'body': command_event['body'].replace('trigger_id=1', 'trigger_id=2')})
+
+
+def test_create_event_key_record(nas_event_dedup_db):
+    """Claim the key of the event with a conditional put
+    Only the first put of the key succeeds until the key expires.
+    DynamoDB deletes the expired items late, so an expired key can be claimed again.
+
+    Args:
+        event_key: the key of the event
+        expire_at: the unix time the key expires. It is the TTL attribute of NAS_EVENT_DEDUP.
+        now: the unix time now
+
+    Return:
+        bool: True when claimed. False when the key is already claimed. None on error.
+    """
+    assert create_event_key_record('event:Ev01', 2000, 1000) is True
+    assert create_event_key_record('event:Ev01', 2500, 1500) is False
+    item = nas_event_dedup_db.get_item(Key={'event_key': 'event:Ev01'})['Item']
+    assert item['expire_at'] == 2000
+    assert item['event_status'] == 'pending'
+
+    assert create_event_key_record('event:Ev01', 3000, 2001) is True
+
+
+def test_complete_event_key_record(nas_event_dedup_db):
+    """Mark the key of the event done, or delete it
+    The key is pending while the command runs.
+    It is marked done with the full TTL after the command has run, and deleted when the command failed.
+
+    Args:
+        event_key: the key of the event
+        expire_at: the unix time the done key expires
+
+    Return:
+        bool: True when updated. False on error.
+    """
+    create_event_key_record('event:Ev01', 2000, 1000)
+    assert complete_event_key_record('event:Ev01', 5000) is True
+    item = nas_event_dedup_db.get_item(Key={'event_key': 'event:Ev01'})['Item']
+    assert item['expire_at'] == 5000
+    assert item['event_status'] == 'done'
+
+    assert delete_event_key_record('event:Ev01') is True
+    assert 'Item' not in nas_event_dedup_db.get_item(Key={'event_key': 'event:Ev01'})
+    assert create_event_key_record('event:Ev01', 2000, 1000) is True
+
+
+def test_event_deduplicator(nas_event_dedup_db, mocker):
+    """Reject the events that have been processed
+    The keys seen by this container are kept in memory, so their duplicates are rejected without DynamoDB.
+    The other containers share the keys through NAS_EVENT_DEDUP.
+    When the table can not be reached, the event is processed rather than lost.
+
+    Args:
+        event_key: the key of the event
+
+    Return:
+        bool: True when the event should be processed
+    """
+    deduplicator = EventDeduplicator(ttl=3600, cache_size=2)
+    assert deduplicator.claim('event:Ev01') is True
+
+    put_item = mocker.spy(nas_event_dedup_db.__class__, 'put_item')
+    assert deduplicator.claim('event:Ev01') is False
+    assert put_item.call_count == 0
+
+    # another container
+    assert EventDeduplicator(ttl=3600).claim('event:Ev01') is False
+
+    deduplicator.claim('event:Ev02')
+    deduplicator.claim('event:Ev03')
+    assert list(deduplicator.recent_event_keys) == ['event:Ev02', 'event:Ev03']
+
+    mocker.patch.object(src.event_dedup, 'create_event_key_record', return_value=None)
+    assert deduplicator.claim('event:Ev04') is True
+    assert 'event:Ev04' not in deduplicator.recent_event_keys
+
+
+def test_event_deduplicator_release(nas_event_dedup_db):
+    """Forget the key of an event whose command failed
+    The claimed key is pending and expires after the pending TTL, so a worker that died does not block the event for long.
+    complete() keeps the key for the full TTL. release() deletes it, so the redelivery of the event runs the command again.
+
+    Args:
+        event_key: the key of the event
+    """
+    deduplicator = EventDeduplicator(ttl=3600, pending_ttl=60)
+    assert deduplicator.claim('event:Ev01') is True
+    expire_at = deduplicator.recent_event_keys['event:Ev01']
+    assert deduplicator.claim('event:Ev01') is False
+
+    deduplicator.release('event:Ev01')
+    assert 'event:Ev01' not in deduplicator.recent_event_keys
+    assert EventDeduplicator(ttl=3600).claim('event:Ev01') is True
+
+    assert deduplicator.claim('event:Ev02') is True
+    deduplicator.complete('event:Ev02')
+    assert deduplicator.recent_event_keys['event:Ev02'] > expire_at + 3000
+    assert nas_event_dedup_db.get_item(Key={'event_key': 'event:Ev02'})['Item']['event_status'] == 'done'
+    assert EventDeduplicator(ttl=3600).claim('event:Ev02') is False
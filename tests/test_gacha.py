@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
-from src.gacha import select_prize, roll_a_gacha
+from collections import Counter
+
+import pytest
+
+from src.gacha import AliasSampler, Prize, compile_prize_sampler, load_prize_table, select_prize, roll_a_gacha
 
 
 def test_select_prize():
     """Functions for determining gacha prizes
     If you win the gacha, one of the prizes will be selected at random from the set prizes.
-    The giveaway is defined in the function.
-    I'd really like to cut it out somewhere, but it's too delicate to move it, so I'm writing it here.
+    The prizes and their weights are defined in prize_config.ini.
 
     Return:
         str: hit prize name
@@ -18,7 +21,7 @@ def test_select_prize():
 def test_roll_a_gacha():
     """Gacha spinning function
     Turn the gacha based on a predetermined probability.
-    If the prize is won, the prize is determined by the select_prize() function.
+    The miss is one more outcome of the prize table, so a roll is a single draw of the sampler.
     It's just a matter of turning the gacha. Record writing, etc. is done by another function.
 
     Return:
@@ -26,3 +29,70 @@ def test_roll_a_gacha():
     """
     prizes_and_empty = ['prize_1', 'prize_2', 'prize_3', 'prize_4', 'prize_5', '']
     assert roll_a_gacha() in prizes_and_empty
+
+
+def test_load_prize_table(tmp_path):
+    """Load the prize table
+    Each section of the config is a prize with its weight and rarity tier.
+
+    Args:
+        path: path of the prize config. PRIZE_CONFIG_PATH
+
+    Return:
+        list: Prize of each section
+    """
+    prize_config_path = tmp_path / 'prize_config.ini'
+    prize_config_path.write_text('[prize_1]\nweight = 3\nrarity = N\n\n[prize_2]\nweight = 1\n')
+
+    prizes = load_prize_table(str(prize_config_path))
+    assert [(prize.name, prize.weight, prize.rarity) for prize in prizes] == [('prize_1', 3.0, 'N'), ('prize_2', 1.0, '')]
+
+    with pytest.raises(FileNotFoundError):
+        load_prize_table(str(tmp_path / 'not_exist.ini'))
+
+
+def test_alias_sampler():
+    """Weighted sampler with the alias method
+    The table is built once, then each draw is one random number, one column and one comparison.
+
+    Args:
+        outcomes: list of the outcomes
+        weights: weight of each outcome
+
+    Return:
+        the drawn outcome
+    """
+    sampler = AliasSampler(['a', 'b', 'c', 'd'], [1, 2, 3, 4])
+
+    # sweep the random number evenly, so the frequency of each outcome is exactly its weight
+    draws = 10000
+    counts = Counter(sampler.sample(lambda: (i + 0.5) / draws) for i in range(draws))
+    assert counts == {'a': 1000, 'b': 2000, 'c': 3000, 'd': 4000}
+
+    assert AliasSampler(['a', 'b'], [0, 1]).sample(lambda: 0.0) == 'b'
+
+    with pytest.raises(ValueError):
+        AliasSampler([], [])
+    with pytest.raises(ValueError):
+        AliasSampler(['a'], [0])
+
+
+def test_compile_prize_sampler():
+    """Compile the prize table into a sampler
+    The miss is added to the table with the weight that keeps the win rate.
+
+    Args:
+        prizes: list of Prize
+        win_rate: GACHA_WIN_RATE
+
+    Return:
+        AliasSampler: the sampler of a roll
+    """
+    prizes = [Prize('prize_1', 1, 'SR'), Prize('prize_2', 3, 'N')]
+
+    draws = 10000
+    counts = Counter(compile_prize_sampler(prizes, 0.2).sample(lambda: (i + 0.5) / draws) for i in range(draws))
+    assert counts == {'': 8000, 'prize_1': 500, 'prize_2': 1500}
+
+    assert compile_prize_sampler(prizes, 0).outcomes == ['']
+    assert '' not in compile_prize_sampler(prizes, 1).outcomes
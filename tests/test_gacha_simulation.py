@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+import numpy as np
+
+from src.gacha import Prize, compile_prize_sampler
+from src.gacha_simulation import calc_nas_bonuses, calc_nas_gacha_rolls_of_users, sample_outcome_indexes, simulate_economy, \
+    sweep_parameters
+from src.nas import calc_nas_bonus, calc_nas_gacha_rolls
+
+
+def test_sample_outcome_indexes():
+    """Draw many rolls at once from the alias table of the gacha
+    The draws use the same table as roll_a_gacha, so the frequency of each outcome follows the prize table.
+
+    Args:
+        sampler: AliasSampler compiled by compile_prize_sampler
+        rng: numpy Generator
+        size: the number of the draws
+
+    Return:
+        numpy.ndarray: index of the outcome of each draw
+    """
+    sampler = compile_prize_sampler([Prize('prize_1', 1, 'SR'), Prize('prize_2', 3, 'N')], 0.2)
+    outcome_indexes = sample_outcome_indexes(sampler, np.random.default_rng(0), 100000)
+    counts = Counter(sampler.outcomes[i] for i in outcome_indexes)
+    assert abs(counts[''] / 100000 - 0.8) < 0.01
+    assert abs(counts['prize_1'] / 100000 - 0.05) < 0.01
+    assert abs(counts['prize_2'] / 100000 - 0.15) < 0.01
+
+
+def test_calc_rules_of_users():
+    """Apply the rules of Nas to the arrays of all the users
+    calc_nas_bonuses and calc_nas_gacha_rolls_of_users give the same numbers as calc_nas_bonus and calc_nas_gacha_rolls of nas.py.
+
+    Args:
+        last_week_send_nas: the nas each user sent last week
+        all_receive_nas: the nas each user received
+        used_nas: the nas each user used for the gacha
+        free_rolls: 1 when the free roll of the user is left
+
+    Return:
+        numpy.ndarray: the bonus or the rolls of each user
+    """
+    last_week_send_nas = np.array([0, 1, 5, 6, 15])
+    assert calc_nas_bonuses(last_week_send_nas).tolist() == [calc_nas_bonus(num) for num in last_week_send_nas.tolist()]
+
+    all_receive_nas = np.array([0, 10, 35, 35, 5])
+    used_nas = np.array([0, 0, 0, 20, 20])
+    free_rolls = np.array([1, 0, 1, 0, 0])
+    assert calc_nas_gacha_rolls_of_users(all_receive_nas, used_nas, free_rolls, 10).tolist() == [
+        calc_nas_gacha_rolls(*user, 10) for user in zip(all_receive_nas.tolist(), used_nas.tolist(), free_rolls.tolist())
+    ]
+
+
+def test_simulate_economy():
+    """Simulate the gacha economy of many users over many weeks
+    Each week, every user sends a share of the allowance, including the bonus from last week, to the other users,
+    and rolls all the available rolls by the rules of Nas.
+    The same seed gives the same report.
+
+    Args:
+        user_num: the number of the users
+        week_num: the number of the weeks
+        nas_limit: NAS_LIMIT
+        nas_gacha_cost: NAS_GACHA_COST
+        gacha_win_rate: GACHA_WIN_RATE
+        prizes: list of Prize
+        seed: seed of the random numbers
+
+    Return:
+        dict: issued tickets, rolls per user and bonus inflation
+    """
+    report = simulate_economy(user_num=200, week_num=10, nas_limit=30, nas_gacha_cost=10, gacha_win_rate=0.1, seed=1)
+    assert report == simulate_economy(user_num=200, week_num=10, nas_limit=30, nas_gacha_cost=10, gacha_win_rate=0.1, seed=1)
+
+    assert len(report['weekly']) == 10
+    assert sum(week['tickets'] for week in report['weekly']) == sum(report['issued_tickets'].values())
+    # every nas sent is received by someone, and the rolls can not use more than that plus the free roll
+    sent_nas = sum(week['sent_nas'] for week in report['weekly'])
+    assert sum(week['rolls'] for week in report['weekly']) <= 200 + sent_nas // 10
+    assert report['rolls_per_user']['mean'] >= 1
+    assert report['bonus_inflation'] >= 1
+
+    report = simulate_economy(user_num=200, week_num=10, gacha_win_rate=0, seed=1)
+    assert sum(report['issued_tickets'].values()) == 0
+
+
+def test_sweep_parameters():
+    """Simulate every combination of the parameters
+
+    Args:
+        parameter_grid: list of the values of each parameter
+
+    Return:
+        list: report of each combination
+    """
+    reports = sweep_parameters({'nas_limit': [20, 30], 'gacha_win_rate': [0.1, 0.5]}, user_num=100, week_num=4, seed=0)
+    assert [(report['nas_limit'], report['gacha_win_rate']) for report in reports] == [(20, 0.1), (30, 0.1), (20, 0.5), (30, 0.5)]
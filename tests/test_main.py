@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import json
+
+from src import main
+from src.work_queue import InProcessWorkQueue
+
+
+def create_slash_command_event(command, text=''):
+    return {
+        'body': 'token=SAMPLE_TOKEN&team_id=test_team_id&channel_id=sample_channel&user_id=test_user_A_id&user_name=test_user_A_name'
+                '&command={0}&text={1}&response_url=https://hooks.slack.com/commands/sample'.format(command, text),
+        'params': {'header': {}}
+    }
+
+
+def test_lambda_handler(mocker):
+    """Entry point of API Gateway
+    Slack retries the request when the response takes more than 3 seconds.
+    When a work queue is configured with NAS_WORK_QUEUE, the event is only validated and enqueued,
+    and the response is returned at once.
+    Without a work queue, the command is run in the request itself,
+    and the replies ready within SLACK_ACK_WINDOW seconds of the start of the request are returned inline.
+    The event is normalized into a SlackRequest once. Only the worker normalizes the raw event from the queue again.
+    Retries from Slack are ignored.
+
+    Return:
+        dict or str: the body of the response
+    """
+    main_func = mocker.patch.object(main, 'main_func', return_value='')
+    work_queue = InProcessWorkQueue()
+    mocker.patch.object(main, 'get_work_queue', return_value=work_queue)
+
+    event = create_slash_command_event('/nas_st')
+    assert main.lambda_handler(event, None) == ''
+    assert main_func.call_count == 0
+    assert [message for receipt_handle, message in work_queue.receive()] == [{'type': 'event', 'event': event}]
+
+    retry_event = create_slash_command_event('/nas_st')
+    retry_event['params']['header']['X-Slack-Retry-Num'] = '1'
+    assert main.lambda_handler(retry_event, None) == ''
+    assert work_queue.receive() == []
+
+    # the ack window is measured from the start of the request, not from the start of the command
+    mocker.patch.object(main, 'get_work_queue', return_value=None)
+    mocker.patch('time.monotonic', return_value=100.0)
+    main.lambda_handler(event, None)
+    assert main_func.call_count == 1
+    assert main_func.call_args[1]['deadline'] == 100.0 + main.SLACK_ACK_WINDOW
+
+    # the event is normalized once, and the request is passed to main_func
+    normalize_event = mocker.spy(main, 'normalize_event')
+    main.lambda_handler(event, None)
+    assert normalize_event.call_count == 1
+    assert main_func.call_args[1]['request'] == normalize_event.spy_return
+
+
+def test_drain_work_queue(mocker):
+    """Run the commands in the work queue
+    The worker runs the enqueued events.
+    The ack has already been returned, so the replies are not inline.
+    A message is deleted from the queue only after it is processed.
+    When the worker fails, the message is left in the queue and run again after the visibility timeout.
+
+    Args:
+        work_queue: the queue to drain
+
+    Return:
+        int: the number of processed messages
+    """
+    main_func = mocker.patch.object(main, 'main_func', return_value='')
+    work_queue = InProcessWorkQueue(visibility_timeout=0)
+    event = create_slash_command_event('/nas_st')
+    work_queue.enqueue({'type': 'event', 'event': event})
+
+    assert main.drain_work_queue(work_queue) == 1
+    main_func.assert_called_once_with(event, None, inline=False)
+    assert work_queue.entries == {}
+
+    main_func.side_effect = Exception('sample error')
+    work_queue.enqueue({'type': 'event', 'event': event})
+    assert main.drain_work_queue(work_queue) == 0
+    assert len(work_queue.entries) == 1
+
+    main_func.side_effect = None
+    assert main.drain_work_queue(work_queue) == 1
+    assert work_queue.entries == {}
+
+
+def test_worker_handler(mocker):
+    """Entry point of the worker Lambda triggered by the work queue
+    A failed message does not stop the others of the batch.
+    Only the failed messages are reported to SQS, with ReportBatchItemFailures, so the others are not received again.
+
+    Return:
+        dict: batchItemFailures
+    """
+    main_func = mocker.patch.object(main, 'main_func', side_effect=[Exception('sample error'), ''])
+    event = {'Records': [
+        {'messageId': 'message_1', 'body': json.dumps({'type': 'event', 'event': create_slash_command_event('/nas_st')})},
+        {'messageId': 'message_2', 'body': json.dumps({'type': 'event', 'event': create_slash_command_event('/nas_rank')})}
+    ]}
+
+    assert main.worker_handler(event, None) == {'batchItemFailures': [{'itemIdentifier': 'message_1'}]}
+    assert main_func.call_count == 2
+
+
+def test_main_func(nas_db, mocker):
+    """Run the command of the event
+    The event is parsed into a request, and the command registered for it is run.
+    The reply to the user is returned as the body of the response when it is ready within the ack window.
+
+    Args:
+        inline: False when the ack has already been returned
+        deadline: time.monotonic() the ack window ends
+        request: the SlackRequest already normalized from the event. None to normalize the event here.
+
+    Return:
+        dict or str: the body of the response
+    """
+    session_request = mocker.patch('requests.Session.request')
+
+    response_body = main.main_func(create_slash_command_event('/nas_st'), None)
+    assert response_body == {'response_type': 'ephemeral', 'text': '今週の残りnas数: 30\n先週からのボーナス: 0\nあなたの残りnasは30です.'}
+    assert session_request.call_count == 0
+
+    assert main.main_func(create_slash_command_event('/unknown'), None) == ''
+
+    # the request normalized by lambda_handler is not normalized again
+    event = create_slash_command_event('/nas_st', 'again')
+    request = main.normalize_event(event)
+    normalize_event = mocker.spy(main, 'normalize_event')
+    assert main.main_func(event, None, request=request)['text'].startswith('今週の残りnas数')
+    assert normalize_event.call_count == 0
+
+
+def test_main_func_duplicate_event(nas_event_dedup_db, mocker):
+    """Run the command of an event only once
+    A slow first attempt, a duplicate delivery or a replayed queue message has the same event_id or body.
+    The duplicate is rejected before any query or Slack call.
+
+    Return:
+        dict or str: the body of the response
+    """
+    event = create_slash_command_event('/nas_st')
+    assert main.main_func(event, None) != ''
+
+    handle = mocker.spy(main.get_command('/nas_st'), 'handle')
+    assert main.main_func(event, None) == ''
+    assert main.main_func(dict(event), None, inline=False) == ''
+    assert handle.call_count == 0
+
+
+def test_main_func_capacity_budget(nas_event_dedup_db, mocker):
+    """Keep the DynamoDB usage of a command within its budget
+    The consumed capacity of the calls of the command is summed and checked against the budget of the command.
+    Over the budget is only a warning in production, so the budgets are asserted here.
+    """
+    from capacity import CAPACITY
+
+    mocker.patch('requests.Session.request')
+    for command in ['/nas_st', '/nas_rank', '/nas_gacha_tickets']:
+        main.main_func(create_slash_command_event(command), None)
+        assert CAPACITY.command == command
+        assert CAPACITY.usage.calls > 0
+        assert main.get_command(command).budget.exceeded(CAPACITY.usage) == []
+
+    mocker.patch.object(main.get_command('/nas_st'), 'budget', main.get_command('/nas_st').budget._replace(calls=1))
+    finish = mocker.spy(CAPACITY, 'finish')
+    main.main_func(create_slash_command_event('/nas_st', 'again'), None)
+    assert finish.spy_return == ['calls {0} > 1'.format(CAPACITY.usage.calls)]
+
+
+def test_main_func_redelivery(nas_event_dedup_db, mocker):
+    """Run the command again when it failed
+    The key of the event is released when the command raises, so the redelivery of the event is not dropped as a duplicate.
+    After the command has run, the redelivery is a duplicate.
+    """
+    command = main.get_command('/nas_st')
+    run = mocker.patch.object(command, 'run', side_effect=[Exception('sample error'), None, None])
+    work_queue = InProcessWorkQueue(visibility_timeout=0)
+    event = create_slash_command_event('/nas_st')
+    work_queue.enqueue({'type': 'event', 'event': event})
+
+    assert main.drain_work_queue(work_queue) == 0
+    assert main.drain_work_queue(work_queue) == 1
+    assert run.call_count == 2
+
+    assert main.main_func(event, None) == ''
+    assert run.call_count == 2
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import json
+from decimal import Decimal
+
+import pytest
+
+import src.metrics
+from metrics import METRICS
+from src.db import create_nas_record, load_send_nas_num
+from src.metrics import MetricsRecorder, timed
+
+
+def test_metrics_recorder(capsys):
+    """Aggregate the spans of a request and print them as metric lines
+    Each span has the call count, the total and max latency and the error count.
+    The lines are in the CloudWatch embedded metric format, with the command and the span as the dimensions.
+    """
+    recorder = MetricsRecorder(enabled=True, namespace='nas')
+    recorder.start('/nas_st')
+    recorder.record('db.load_send_nas_num', 0.002)
+    recorder.record('db.load_send_nas_num', 0.004, True)
+    with pytest.raises(ValueError):
+        with recorder.span('command'):
+            raise ValueError
+
+    metric_lines = recorder.flush()
+    assert [json.loads(line) for line in capsys.readouterr().out.splitlines()] == [json.loads(line) for line in metric_lines]
+
+    command_metric, db_metric = [json.loads(line) for line in metric_lines]
+    assert command_metric['span'] == 'command'
+    assert command_metric['errors'] == 1
+    assert db_metric['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'nas'
+    assert db_metric['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['command', 'span']]
+    assert (db_metric['command'], db_metric['count'], db_metric['latency'], db_metric['max_latency'], db_metric['errors']) == \
+        ('/nas_st', 2, 6.0, 4.0, 1)
+    assert db_metric['items_read'] == 0
+
+    assert recorder.flush() == []
+    assert MetricsRecorder(enabled=False).flush() == []
+
+
+def test_timed(mocker):
+    """Time the calls of a function
+    When the metrics are disabled, the call costs only one attribute check and nothing is recorded.
+
+    Args:
+        name: the name of the span
+    """
+    @timed('sample.sample_func')
+    def sample_func(fail=False):
+        if fail:
+            raise ValueError
+        return 'sample'
+
+    mocker.patch.object(src.metrics.METRICS, 'spans', {})
+    assert sample_func() == 'sample'
+    assert src.metrics.METRICS.spans == {}
+
+    mocker.patch.object(src.metrics.METRICS, 'enabled', True)
+    assert sample_func() == 'sample'
+    with pytest.raises(ValueError):
+        sample_func(fail=True)
+    assert src.metrics.METRICS.spans['sample.sample_func'][0] == 2
+    assert src.metrics.METRICS.spans['sample.sample_func'][3] == 1
+
+
+def test_dynamodb_metrics(nas_db, mocker):
+    """Time every DynamoDB call by its operation
+    The handles are created with the botocore event hooks when the metrics are enabled.
+    So a slow command shows both the db function and the DynamoDB operations it called.
+    """
+    mocker.patch.object(METRICS, 'enabled', True)
+    mocker.patch.object(METRICS, 'spans', {})
+
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    assert METRICS.spans['db.create_nas_record'][0] == 1
+    assert METRICS.spans['dynamodb.PutItem'][0] == 1
+    assert METRICS.spans['dynamodb.PutItem'][3] == 0
+    # NAS_WEEKLY_COUNTER and NAS_LEADERBOARD do not exist here, and the failed counter is marked stale
+    assert METRICS.spans['dynamodb.UpdateItem'][3] == 3
+
+    # the items read by a query are counted
+    load_send_nas_num('test_user_A_id', Decimal(0))
+    assert METRICS.spans['dynamodb.Query'][4] == 1
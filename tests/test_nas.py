@@ -4,7 +4,9 @@ import boto3
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+import src.nas
 from src.nas import Nas
+from src.week_calendar import get_week_id
 
 NAS_GACHA_COST = int(os.environ['NAS_GACHA_COST'])
 
@@ -48,6 +50,7 @@ class TestNas():
             'team_id': 'test_team_id'
         }
         nas_db.put_item(Item=nas_now)
+        nas_obj.refresh()
         assert nas_obj.nas_bonus() == 0
 
         last_week_time = datetime.now() - timedelta(days=7)
@@ -61,6 +64,7 @@ class TestNas():
             'team_id': 'test_team_id'
         }
         nas_db.put_item(Item=nas_past)
+        nas_obj.refresh()
         assert nas_obj.nas_bonus() == 1
 
     def test_sended_nas_num(self, nas_db):
@@ -84,8 +88,46 @@ class TestNas():
             'team_id': 'test_team_id'
         }
         nas_db.put_item(Item=nas)
+        nas_obj.refresh()
         assert nas_obj.sended_nas_num() == 1
 
+    def test_sended_nas_num_from_counter(self, nas_counter_db):
+        """Read the number of NAS sent this week from the weekly counter
+        When the weekly counter exists, it is used instead of counting the NAS records,
+        so the cost does not grow with the number of NAS the user has sent.
+        """
+        nas_obj = Nas('test_user_A_id', 'test_user_A_name', 'test_team_id')
+        assert nas_obj.nas_message('test_user_B_id', 'test_user_B_name') is True
+        assert nas_obj.sended_nas_num() == 1
+
+        nas_counter_db.put_item(Item={'user_id': 'test_user_A_id', 'week_id': get_week_id(), 'sent_nas_num': 5})
+        nas_obj.refresh()
+        assert nas_obj.sended_nas_num() == 5
+        assert nas_obj.nas_status() == 25
+
+    def test_snapshot(self, nas_counter_db, mocker):
+        """Load the state of the user once per request
+        One command asks for the sent NAS, the bonus and the remaining NAS several times.
+        The Nas object is created per request, so each state is loaded only once and kept in the snapshot.
+        After the NAS is written, the snapshot is updated in place instead of being loaded again.
+        refresh() drops the snapshot when the state has been changed by someone else.
+        """
+        load_weekly_send_nas_num = mocker.spy(src.nas, 'load_weekly_send_nas_num')
+        nas_obj = Nas('test_user_A_id', 'test_user_A_name', 'test_team_id')
+
+        assert nas_obj.check_can_send_nas() is True
+        assert nas_obj.sended_nas_num() == 0
+        assert nas_obj.nas_bonus() == 0
+        assert nas_obj.nas_status() == 30
+        assert nas_obj.nas_message('test_user_B_id', 'test_user_B_name') is True
+        assert nas_obj.sended_nas_num() == 1
+        assert nas_obj.nas_status() == 29
+        assert load_weekly_send_nas_num.call_count == 2
+
+        nas_obj.refresh()
+        assert nas_obj.sended_nas_num() == 1
+        assert load_weekly_send_nas_num.call_count == 3
+
     def test_nas_status(self, nas_db):
         """Check the number of NAS you have left
         The number of NAS you can send in a week is determined by the number of NAS you can send in a week.
@@ -109,6 +151,7 @@ class TestNas():
             'team_id': 'test_team_id'
         }
         nas_db.put_item(Item=nas_now)
+        nas_obj.refresh()
         assert nas_obj.nas_status() == 29
 
         last_week_time = datetime.now() - timedelta(days=7)
@@ -122,6 +165,7 @@ class TestNas():
             'team_id': 'test_team_id'
         }
         nas_db.put_item(Item=nas_past)
+        nas_obj.refresh()
         assert nas_obj.nas_status() == 30
 
     def test_chack_self_portrait(self):
@@ -164,9 +208,10 @@ class TestNas():
             }
             nas_db.put_item(Item=nas_now)
 
+        nas_obj.refresh()
         assert nas_obj.check_can_send_nas() is False
 
-    def test_nas_stamp(self):
+    def test_nas_stamp(self, nas_db):
         """Sending nas with a Slack stamp
         One of the main ways to send NAS.
         By stamping a specific Slack stamp, you can send a NAS to the stamped user.
@@ -180,11 +225,14 @@ class TestNas():
             receive_user_name : The slack user_name of the destination
             stamp_name : A user sended stamp name
 
+        A stamp worth several NAS is written in one batch request, and every unit is persisted.
+
         Return:
             bool : is the stamp sent successfully. success is True. Fail is False.
         """
         nas_obj = Nas('test_user_A_id', 'test_user_A_name', 'test_team_id')
         assert nas_obj.nas_stamp('test_user_B_id', 'test_user_B_name', 'eggplant') is True
+        assert nas_obj.sended_nas_num() == 1
 
         assert nas_obj.nas_stamp('test_user_B_id', 'test_user_B_name', 'some_stamp') is False
 
@@ -264,6 +312,7 @@ class TestNas():
             'has_tickets': {}
         }
         nas_gacha_db.put_item(Item=nas_gacha_item)
+        nas_obj_A.refresh()
         assert nas_obj_A.check_can_run_gacha() is False
 
         now = datetime.now()
@@ -277,6 +326,7 @@ class TestNas():
             'team_id': 'test_team_id'
         }
         nas_db.put_item(Item=nas_item)
+        nas_obj_A.refresh()
         assert nas_obj_A.check_can_run_gacha() is False
 
         for i in range(10):
@@ -291,6 +341,7 @@ class TestNas():
                 'team_id': 'test_team_id'
             }
             nas_db.put_item(Item=nas_item)
+        nas_obj_A.refresh()
         assert nas_obj_A.check_can_run_gacha() is True
 
     def test_nas_gacha_status(self, nas_gacha_db):
@@ -346,6 +397,7 @@ class TestNas():
             'has_tickets': {}
         }
         nas_gacha_db.put_item(Item=nas_gacha_item)
+        nas_obj_A.refresh()
         assert nas_obj_A.nas_gacha_status() == 0
 
         for i in range(10):
@@ -360,7 +412,14 @@ class TestNas():
                 'team_id': 'test_team_id'
             }
             nas_db.put_item(Item=nas_item)
+        nas_obj_A.refresh()
+        # the same as count_nas_gacha_rolls(), the used nas plus the cost must be less than the received nas
+        assert nas_obj_A.nas_gacha_status() == 0
+
+        nas_db.put_item(Item=dict(nas_item, time_stamp=Decimal(datetime.now().timestamp())))
+        nas_obj_A.refresh()
         assert nas_obj_A.nas_gacha_status() == 1
+        assert nas_obj_A.nas_gacha_status() == nas_obj_A.count_nas_gacha_rolls()
 
     def test_calc_until_next_time_nas_num(self, nas_gacha_db):
         """Calculate how many NAS you need to receive before you roll the NAS gacha
@@ -417,7 +476,8 @@ class TestNas():
             'has_tickets': {}
         }
         nas_gacha_db.put_item(Item=nas_gacha_item)
-        assert nas_obj_A.calc_until_next_time_nas_num() == NAS_GACHA_COST
+        nas_obj_A.refresh()
+        assert nas_obj_A.calc_until_next_time_nas_num() == NAS_GACHA_COST + 1
 
         for i in range(NAS_GACHA_COST):
             now = datetime.now()
@@ -431,6 +491,11 @@ class TestNas():
                 'team_id': 'test_team_id'
             }
             nas_db.put_item(Item=nas_item)
+        nas_obj_A.refresh()
+        assert nas_obj_A.calc_until_next_time_nas_num() == 1
+
+        nas_db.put_item(Item=dict(nas_item, time_stamp=Decimal(datetime.now().timestamp())))
+        nas_obj_A.refresh()
         assert nas_obj_A.calc_until_next_time_nas_num() == 0
 
     def test_nas_gacha(self, nas_gacha_db):
@@ -446,6 +511,58 @@ class TestNas():
         nas_obj_A = Nas('test_user_A_id', 'test_user_A_name', 'test_team_id')
         assert nas_obj_A.nas_gacha() in ['prize_1', 'prize_2', 'prize_3', 'prize_4', 'prize_5', '']
 
+    def test_count_nas_gacha_rolls(self, nas_gacha_db, mocker):
+        """Count the gacha rolls available one after another
+        The first roll is free, and each of the next rolls costs 10 NAS.
+        A roll is available while the used NAS plus the cost is less than the received NAS, the same as check_can_run_gacha.
+
+        Return:
+            int : the number of the available rolls
+        """
+        mocker.patch.object(src.nas, 'scan_user_receive_nas_num', return_value=35)
+        nas_obj_A = Nas('test_user_A_id', 'test_user_A_name', 'test_team_id')
+        assert nas_obj_A.count_nas_gacha_rolls() == 4
+
+        nas_gacha_item = {
+            'user_id': 'test_user_A_id',
+            'time_stamp': Decimal(datetime.now().timestamp()),
+            'has_nas_num': 35,
+            'used_nas_num': 20,
+            'has_tickets': {}
+        }
+        nas_gacha_db.put_item(Item=nas_gacha_item)
+        nas_obj_A.refresh()
+        assert nas_obj_A.count_nas_gacha_rolls() == 1
+
+    def test_nas_gacha_rolls(self, nas_gacha_db, mocker):
+        """Roll the gacha many times with one write
+        Every roll is computed against the state loaded once, and the total cost is checked before rolling.
+        The tickets won by all the rolls are saved by one conditional write.
+
+        Args:
+            roll_num: the number of the rolls
+
+        Return:
+            list : result of each roll. None if the rolls are not available or the write failed.
+        """
+        mocker.patch.object(src.nas, 'scan_user_receive_nas_num', return_value=35)
+        mocker.patch('gacha.roll_gachas', return_value=['prize_1', '', 'prize_1', 'prize_2'])
+        create_nas_gacha_record = mocker.spy(src.nas, 'create_nas_gacha_record')
+        nas_obj_A = Nas('test_user_A_id', 'test_user_A_name', 'test_team_id')
+
+        assert nas_obj_A.nas_gacha_rolls(5) is None
+        assert nas_obj_A.nas_gacha_rolls(0) is None
+
+        assert nas_obj_A.nas_gacha_rolls(4) == ['prize_1', '', 'prize_1', 'prize_2']
+        nas_gacha_item = nas_gacha_db.get_item(Key={'user_id': 'test_user_A_id'})['Item']
+        assert nas_gacha_item['used_nas_num'] == 30
+        assert nas_gacha_item['has_tickets'] == {'prize_1': 2, 'prize_2': 1}
+        assert nas_gacha_item['version'] == 1
+        assert create_nas_gacha_record.call_count == 1
+
+        assert nas_obj_A.count_nas_gacha_rolls() == 0
+        assert nas_obj_A.nas_gacha_rolls(1) is None
+
     def test_check_nas_gacha_tickets(self, nas_gacha_db):
         """Check the gacha prizes you've won
         Check the list of giveaways you've won by rolling the Gacha.
@@ -466,6 +583,7 @@ class TestNas():
             'has_tickets': {'prize_1': 1}
         }
         nas_gacha_db.put_item(Item=nas_gacha_item)
+        nas_obj.refresh()
         assert nas_obj.check_nas_gacha_tickets() == {'prize_1': 1}
 
     def test_use_nas_gacha_tickets(self, nas_gacha_db):
@@ -492,6 +610,38 @@ class TestNas():
             'has_tickets': {'prize_1': 1}
         }
         nas_gacha_db.put_item(Item=nas_gacha_item)
+        nas_obj.refresh()
         assert nas_obj.use_nas_gacha_tickets('prize_1') is True
 
         assert nas_obj.use_nas_gacha_tickets('prize_1') is False
+
+
+def test_calc_nas_bonus():
+    """The bonus is 20% of the NAS sent last week, rounded up
+    The rules are written with operators only, so that the simulator can apply them to NumPy arrays.
+
+    Args:
+        last_week_send_nas_num: the NAS sent last week
+
+    Return:
+        the bonus
+    """
+    assert [src.nas.calc_nas_bonus(num) for num in [0, 1, 5, 6, 15]] == [0, 1, 1, 2, 3]
+
+
+def test_calc_nas_gacha_rolls():
+    """The number of the gacha rolls available one after another
+
+    Args:
+        all_receive_nas_num: the NAS received so far
+        used_nas_num: the NAS used for the gacha
+        free_roll_num: 1 before the first roll
+        nas_gacha_cost: NAS_GACHA_COST
+
+    Return:
+        the number of the rolls
+    """
+    assert src.nas.calc_nas_gacha_rolls(0, 0, 1, 10) == 1
+    assert src.nas.calc_nas_gacha_rolls(10, 0, 0, 10) == 0
+    assert src.nas.calc_nas_gacha_rolls(35, 0, 1, 10) == 4
+    assert src.nas.calc_nas_gacha_rolls(35, 20, 0, 10) == 1
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
-from src.send_message import post_public_message_to_slack, post_private_message_to_slack
+import time
+
+from src.send_message import post_public_message_to_slack, post_private_message_to_slack, post_message_to_response_url, \
+    ReplyChannel
 
 
 def test_post_public_message_to_slack(mocker):
@@ -22,7 +25,7 @@ def test_post_public_message_to_slack(mocker):
     responseMock.status_code = 200
     responseMock.text = 'success'
 
-    mocker.patch('requests.post').return_value = responseMock
+    mocker.patch('requests.Session.request').return_value = responseMock
     assert post_public_message_to_slack('sample_massage!', 'sample_channel') is True
 
 
@@ -46,11 +49,96 @@ def test_post_private_message_to_slack(mocker):
     responseMock.status_code = 200
     responseMock.text = 'success'
 
-    mocker.patch('requests.post').return_value = responseMock
+    mocker.patch('requests.Session.request').return_value = responseMock
     assert post_private_message_to_slack('sample_massage!', 'sample_channel', 'test_user_A_id') is True
 
     responseMock.status_code = 404
     responseMock.text = 'error'
 
-    mocker.patch('requests.post').return_value = responseMock
+    mocker.patch('requests.Session.request').return_value = responseMock
     assert post_private_message_to_slack('sample_massage!', 'sample_channel', 'test_user_A_id') is False
+
+
+def test_post_message_to_response_url(mocker):
+    """Send an ephemeral reply to the response_url of a slash command
+    Slack gives every slash command a response_url.
+    Posting to it does not use a Web API call and its rate limit budget.
+
+    Args:
+        send_message: slack send message
+        response_url: response_url of the slash command
+
+    Return:
+        bool: send success is True. send failer is False.
+    """
+    responseMock = mocker.Mock()
+    responseMock.status_code = 200
+
+    session_request = mocker.patch('requests.Session.request')
+    session_request.return_value = responseMock
+    assert post_message_to_response_url('sample_massage!', 'https://hooks.slack.com/commands/sample') is True
+    assert session_request.call_args[0][1] == 'https://hooks.slack.com/commands/sample'
+
+    # the bot token must not be sent outside Slack
+    assert post_message_to_response_url('sample_massage!', 'https://example.com/commands/sample') is False
+    assert session_request.call_count == 1
+
+
+class TestReplyChannel():
+    """The channel to reply to the user who ran the command
+    A reply that is ready within the ack window is returned inline as the body of the response to the slash command.
+    After the ack window, it is posted to the response_url.
+    Only when there is no response_url, or posting to it failed, chat.postEphemeral is used.
+
+    Attributes:
+        slack_channel_name: channel id of the command
+        dist_user_id: user id of the user who ran the command
+        response_url: response_url of the slash command. '' if there is none.
+        inline: False if the reply can not be returned as the response body. ex) Events API
+        ack_window: seconds to keep replying inline. SLACK_ACK_WINDOW
+        deadline: time.monotonic() the ack window ends, measured from the start of the request. None starts the window now.
+    """
+
+    def test_send(self, mocker):
+        """Send a reply
+        Within the ack window, the messages are held and returned together by close().
+
+        Args:
+            send_message: slack send message
+
+        Return:
+            bool: send success is True. send failer is False.
+        """
+        session_request = mocker.patch('requests.Session.request')
+        reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample')
+
+        assert reply_channel.send('sample_massage_1') is True
+        assert reply_channel.send('sample_massage_2') is True
+        assert reply_channel.close() == {'response_type': 'ephemeral', 'text': 'sample_massage_1\nsample_massage_2'}
+        assert session_request.call_count == 0
+
+    def test_send_after_ack_window(self, mocker):
+        """Send a reply after the ack window
+        The held messages and the new one are posted to the response_url, in order.
+        Without response_url, chat.postEphemeral is used.
+        """
+        responseMock = mocker.Mock()
+        responseMock.status_code = 200
+        session_request = mocker.patch('requests.Session.request')
+        session_request.return_value = responseMock
+
+        reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample', ack_window=0)
+        assert reply_channel.send('sample_massage!') is True
+        assert reply_channel.close() == ''
+        assert session_request.call_args[0][1] == 'https://hooks.slack.com/commands/sample'
+
+        reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', inline=False)
+        assert reply_channel.send('sample_massage!') is True
+        assert session_request.call_args[0][1] == 'https://slack.com/api/chat.postEphemeral'
+
+        # the request started before the command, and its ack window has already passed
+        reply_channel = ReplyChannel('sample_channel', 'test_user_A_id', 'https://hooks.slack.com/commands/sample',
+                                     deadline=time.monotonic() - 0.1)
+        assert reply_channel.can_reply_inline() is False
+        assert reply_channel.send('sample_massage!') is True
+        assert session_request.call_args[0][1] == 'https://hooks.slack.com/commands/sample'
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from src.slack_client import SlackClient, get_slack_client
+
+
+class TestSlackClient():
+    """Shared transport for every call to the Slack Web API
+    Most commands send two or three messages in a row.
+    A requests.Session keeps the connection to slack.com alive, so only the first message pays for the TCP and TLS handshake.
+    The auth headers are built once, every call has a connect and read timeout,
+    and the latency of each API method is accounted.
+
+    Attributes:
+        bot_token: SLACK_BOT_USER_ACCESS_TOKEN
+        oauth_token: SLACK_OAUTH_ACCESS_TOKEN
+        timeout: (connect timeout, read timeout). SLACK_CONNECT_TIMEOUT and SLACK_READ_TIMEOUT
+    """
+
+    def test_post(self, mocker):
+        """Call a Web API method with a JSON body
+
+        Args:
+            method: Web API method name. ex) chat.postMessage
+            data: request body
+
+        Return:
+            Response: the response of the api
+        """
+        session_request = mocker.patch('requests.Session.request')
+        slack_client = SlackClient('sample_bot_token', 'sample_oauth_token', (1, 3))
+        slack_client.post('chat.postMessage', {'channel': 'sample_channel', 'text': 'sample_message'})
+
+        args, kwargs = session_request.call_args
+        assert args == ('POST', 'https://slack.com/api/chat.postMessage')
+        assert kwargs['timeout'] == (1, 3)
+        assert kwargs['headers']['Authorization'] == 'Bearer sample_bot_token'
+        assert json.loads(kwargs['data']) == {'channel': 'sample_channel', 'text': 'sample_message', 'token': 'sample_oauth_token'}
+
+    def test_get(self, mocker):
+        """Call a Web API method with query parameters
+
+        Args:
+            method: Web API method name. ex) users.list
+            params: query parameters
+
+        Return:
+            Response: the response of the api
+        """
+        session_request = mocker.patch('requests.Session.request')
+        SlackClient('sample_bot_token', 'sample_oauth_token').get('users.list', {'limit': 200})
+
+        args, kwargs = session_request.call_args
+        assert args == ('GET', 'https://slack.com/api/users.list')
+        assert kwargs['params'] == {'limit': 200, 'token': 'sample_oauth_token'}
+
+    def test_post_to_response_url(self, mocker):
+        """Post a reply to the response_url of a slash command
+        The response_url needs no auth, so the bot token is not sent.
+        The response_url comes from the request body, so a url outside hooks.slack.com is refused.
+
+        Args:
+            response_url: response_url of the slash command
+            data: request body
+
+        Return:
+            Response: the response of the response_url
+        """
+        session_request = mocker.patch('requests.Session.request')
+        slack_client = SlackClient('sample_bot_token', 'sample_oauth_token')
+        slack_client.post_to_response_url('https://hooks.slack.com/commands/sample', {'text': 'sample_message'})
+
+        args, kwargs = session_request.call_args
+        assert args == ('POST', 'https://hooks.slack.com/commands/sample')
+        assert 'Authorization' not in kwargs['headers']
+        assert json.loads(kwargs['data']) == {'text': 'sample_message'}
+
+        with pytest.raises(ValueError):
+            slack_client.post_to_response_url('https://example.com/hooks.slack.com/', {'text': 'sample_message'})
+        assert session_request.call_count == 1
+
+    def test_pop_latencies(self, mocker):
+        """Get the latency of the calls since the last time
+        Returns the number of calls, the total seconds and the max seconds of each api method,
+        and starts counting again.
+
+        Return:
+            dict: {method: (count, total seconds, max seconds)}
+        """
+        mocker.patch('requests.Session.request')
+        slack_client = SlackClient('sample_bot_token', 'sample_oauth_token')
+        slack_client.post('chat.postMessage', {})
+        slack_client.post('chat.postMessage', {})
+
+        latencies = slack_client.pop_latencies()
+        assert list(latencies.keys()) == ['chat.postMessage']
+        assert latencies['chat.postMessage'][0] == 2
+        assert slack_client.pop_latencies() == {}
+
+
+def test_get_slack_client():
+    """Get the Slack client shared by the process
+    It is created once with the tokens in the environment variables and reused across warm invocations.
+
+    Return:
+        SlackClient: shared client
+    """
+    assert get_slack_client() is get_slack_client()
+    assert get_slack_client().oauth_token == 'sample_oauth_token'
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.slack_event import SlackRequest, normalize_event
+
+
+def create_reaction_event(reaction='eggplant', event_type='reaction_added', item_user='test_user_B_id'):
+    return {
+        'body': {
+            'type': 'event_callback',
+            'team_id': 'test_team_id',
+            'event_id': 'Ev01',
+            'event': {
+                'type': event_type,
+                'user': 'test_user_A_id',
+                'reaction': reaction,
+                'item_user': item_user,
+                'item': {'type': 'message', 'channel': 'sample_channel'}
+            }
+        }
+    }
+
+
+def test_normalize_slash_command():
+    """Normalize a slash command
+    The form encoded body is decoded in one pass, so the text of the command is what the user typed.
+
+    Args:
+        event: lambda event. The body is the form encoded string.
+
+    Return:
+        SlackRequest: the request. None if it is not a command.
+    """
+    event = {
+        'body': 'token=SAMPLE_TOKEN&team_id=test_team_id&channel_id=sample_channel&user_id=test_user_A_id&user_name=test_user_A_name'
+                '&command=%2Fnas&text=%40test_user_B_name+thank+you%21&response_url=https%3A%2F%2Fhooks.slack.com%2Fcommands%2Fsample'
+    }
+    request = normalize_event(event)
+    assert (request.user_id, request.user_name, request.team_id, request.channel_id) == \
+        ('test_user_A_id', 'test_user_A_name', 'test_team_id', 'sample_channel')
+    assert request.command == '/nas'
+    assert request.text == '@test_user_B_name thank you!'
+    assert request.args == ('@test_user_B_name', 'thank', 'you!')
+    assert request.response_url == 'https://hooks.slack.com/commands/sample'
+    assert (request.receive_user_id, request.stamp) == ('', '')
+
+    assert normalize_event({'body': 'token=SAMPLE_TOKEN&user_id=test_user_A_id'}) is None
+
+    # the body is decoded only once, so + and % typed by the user are kept
+    request = normalize_event({'body': 'user_id=test_user_A_id&command=%2Fnas&text=%40test_user_B_name+C%2B%2B+is+100%2525+fun'})
+    assert request.text == '@test_user_B_name C++ is 100%25 fun'
+    assert normalize_event({'body': 'user_id=test_user_A_id&command=%2Fnas&text='}).args == ()
+
+
+def test_normalize_event_callback():
+    """Normalize an event of the Events API
+    A reaction with a nas stamp is the /nas_stamp command from the user who reacted to the user who wrote the message.
+    The other events, the other reactions and the reactions to a file are rejected before any I/O.
+
+    Args:
+        event: lambda event. The body is the json of the event.
+
+    Return:
+        SlackRequest: the request. None if no command handles the event.
+    """
+    request = normalize_event(create_reaction_event())
+    assert (request.user_id, request.receive_user_id, request.team_id, request.channel_id) == \
+        ('test_user_A_id', 'test_user_B_id', 'test_team_id', 'sample_channel')
+    assert (request.command, request.stamp, request.response_url) == ('/nas_stamp', 'eggplant', '')
+
+    assert normalize_event(create_reaction_event(reaction='thumbsup')) is None
+    assert normalize_event(create_reaction_event(event_type='reaction_removed')) is None
+    assert normalize_event(create_reaction_event(item_user='')) is None
+    assert normalize_event({'body': {'type': 'url_verification', 'challenge': 'sample'}}) is None
+    assert normalize_event({'body': None}) is None
+
+
+def test_slack_request():
+    """The request every command sees
+    It has slots only, so a typo in an attribute fails at once.
+    """
+    request = SlackRequest('test_user_A_id', 'test_team_id', 'sample_channel', '/nas_st')
+    with pytest.raises(AttributeError):
+        request.user = 'test_user_B_id'
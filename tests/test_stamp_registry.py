@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.stamp_registry import MessageTemplate, compile_message_template, compile_stamp_registry, get_stamp
+
+
+def test_compile_message_template():
+    """Parse a message of stamp_config.ini into a template
+    The message refers to the users of the request as ${user_info:nas_user_name}.
+    It is parsed once, and rendered per request with the values of the request, so no shared state is changed.
+
+    Args:
+        message: the message in stamp_config.ini
+
+    Return:
+        MessageTemplate: literal text and user_info keys in turn
+    """
+    template = compile_message_template('${user_info:nas_user_name}さんが${user_info:receive_user_name}さんに$$1のnas')
+    assert template == MessageTemplate(('', 'nas_user_name', 'さんが', 'receive_user_name', 'さんに$1のnas'))
+    assert template.render({'nas_user_name': 'A', 'receive_user_name': 'B'}) == 'AさんがBさんに$1のnas'
+
+    assert compile_message_template('スタンプからnasを送ったよ！').render({}) == 'スタンプからnasを送ったよ！'
+
+    with pytest.raises(ValueError):
+        compile_message_template('${eggplant:nas_num}')
+
+
+def test_compile_stamp_registry(tmp_path):
+    """Compile stamp_config.ini into the stamp registry
+    Each section except user_info is a stamp. The registry and the stamps can not be changed.
+
+    Args:
+        path: path of stamp_config.ini
+
+    Return:
+        mappingproxy: the stamps by the name
+    """
+    stamp_config_path = tmp_path / 'stamp_config.ini'
+    stamp_config_path.write_text('[user_info]\nnas_user_name =\n\n[eggplant]\nnas_num = 3\nconfirm_message = ok\n'
+                                 'send_message = from ${user_info:nas_user_name}\nis_private = 0\n')
+
+    stamps = compile_stamp_registry(str(stamp_config_path))
+    assert list(stamps) == ['eggplant']
+    assert stamps['eggplant'].nas_num == 3
+    assert stamps['eggplant'].is_private is False
+    assert stamps['eggplant'].send_message.render({'nas_user_name': 'A'}) == 'from A'
+
+    with pytest.raises(TypeError):
+        stamps['tomato'] = stamps['eggplant']
+    with pytest.raises(AttributeError):
+        stamps['eggplant'].nas_num = 10
+
+
+def test_get_stamp():
+    """Look up the stamp of a reaction
+    None is returned when the reaction is not a nas stamp.
+
+    Args:
+        stamp_name: the name of the reaction
+
+    Return:
+        Stamp: the stamp
+    """
+    assert get_stamp('eggplant').nas_num == 1
+    assert get_stamp('some_stamp') is None
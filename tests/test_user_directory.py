@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+from src.user_directory import UserDirectory, fetch_slack_members
+
+
+def create_users_list_response(mocker, members, next_cursor=''):
+    response_mock = mocker.Mock()
+    response_mock.json.return_value = {
+        'ok': True,
+        'members': [{'id': user_id, 'name': user_name, 'real_name': user_name} for user_id, user_name in members],
+        'response_metadata': {'next_cursor': next_cursor}
+    }
+    return response_mock
+
+
+def test_fetch_slack_members(mocker):
+    """Download all the members of the workspace
+    users.list returns the members page by page.
+    Follow next_cursor until the last page, so large workspaces are handled.
+
+    Return:
+        list : dict of id and name of every member
+    """
+    session_request = mocker.patch('requests.Session.request', side_effect=[
+        create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name')], 'cursor_1'),
+        create_users_list_response(mocker, [('test_user_B_id', 'test_user_B_name')])
+    ])
+
+    assert fetch_slack_members() == [
+        {'id': 'test_user_A_id', 'name': 'test_user_A_name'},
+        {'id': 'test_user_B_id', 'name': 'test_user_B_name'}
+    ]
+    assert session_request.call_args_list[1][1]['params']['cursor'] == 'cursor_1'
+
+
+class TestUserDirectory():
+    """Index of the Slack users for resolving names and ids
+    Every reaction event needs the names of the users, and /nas needs the id of the destination.
+    Downloading the whole user list each time is slow,
+    so the members are kept in two hash indexes, name to id and id to name.
+    The indexes are kept in memory across warm invocations until the TTL expires,
+    and a snapshot is saved in /tmp so a restarted container starts warm.
+    When a user is not found, the list is downloaded again, at most once per min_refresh_interval.
+
+    Attributes:
+        ttl: seconds until the indexes are downloaded again. SLACK_USER_DIRECTORY_TTL
+        snapshot_path: the path of the snapshot file. SLACK_USER_DIRECTORY_PATH
+        min_refresh_interval: the minimum seconds between downloads. SLACK_USER_DIRECTORY_MIN_REFRESH_INTERVAL
+    """
+
+    def test_get_user_id(self, mocker, tmp_path):
+        """Get the slack user id from the slack user name
+        The user list is downloaded only once, and the next lookups are done in memory.
+
+        Args:
+            user_name : slack user name
+
+        Return:
+            str : slack user id. '' if the user does not exist.
+        """
+        session_request = mocker.patch('requests.Session.request')
+        session_request.return_value = create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name')])
+        user_directory = UserDirectory(snapshot_path=str(tmp_path / 'users.json'))
+
+        assert user_directory.get_user_id('test_user_A_name') == 'test_user_A_id'
+        assert user_directory.get_user_id('test_user_A_name') == 'test_user_A_id'
+        assert user_directory.get_user_id('test_user_Z_name') == ''
+        assert session_request.call_count == 1
+
+    def test_get_user_name(self, mocker, tmp_path):
+        """Get the slack user name from the slack user id
+        When the user is not found, the user list is downloaded again to find new members.
+
+        Args:
+            user_id : slack user id
+
+        Return:
+            str : slack user name. '' if the user does not exist.
+        """
+        session_request = mocker.patch('requests.Session.request', side_effect=[
+            create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name')]),
+            create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name'), ('test_user_B_id', 'test_user_B_name')])
+        ])
+        user_directory = UserDirectory(snapshot_path=str(tmp_path / 'users.json'), min_refresh_interval=0)
+
+        assert user_directory.get_user_name('test_user_A_id') == 'test_user_A_name'
+        assert user_directory.get_user_name('test_user_B_id') == 'test_user_B_name'
+        assert session_request.call_count == 2
+
+    def test_get_user_names(self, mocker, tmp_path):
+        """Get the slack user names of many ids at once
+        The user list is downloaded again at most once for all the unknown ids, not once per id.
+
+        Args:
+            user_ids : slack user ids
+
+        Return:
+            dict : slack user name of each id. '' if the user does not exist.
+        """
+        session_request = mocker.patch('requests.Session.request', side_effect=[
+            create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name')]),
+            create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name'), ('test_user_B_id', 'test_user_B_name')])
+        ])
+        user_directory = UserDirectory(snapshot_path=str(tmp_path / 'users.json'), min_refresh_interval=0)
+
+        assert user_directory.get_user_names(['test_user_A_id', 'test_user_B_id', 'test_user_Y_id', 'test_user_Z_id']) == {
+            'test_user_A_id': 'test_user_A_name',
+            'test_user_B_id': 'test_user_B_name',
+            'test_user_Y_id': '',
+            'test_user_Z_id': ''
+        }
+        assert session_request.call_count == 2
+
+    def test_load_snapshot(self, mocker, tmp_path):
+        """Start with the snapshot saved by another container
+        The snapshot in /tmp is used while it is within the TTL, so no HTTP call is needed.
+        """
+        snapshot_path = tmp_path / 'users.json'
+        snapshot_path.write_text(json.dumps({
+            'loaded_at': time.time(),
+            'members': [{'id': 'test_user_A_id', 'name': 'test_user_A_name'}]
+        }))
+        session_request = mocker.patch('requests.Session.request')
+
+        user_directory = UserDirectory(snapshot_path=str(snapshot_path))
+        assert user_directory.get_user_id('test_user_A_name') == 'test_user_A_id'
+        assert session_request.call_count == 0
+
+    def test_save_snapshot(self, mocker, tmp_path):
+        """Save the downloaded indexes to the snapshot file
+        The next container can read it with load_snapshot().
+        """
+        mocker.patch('requests.Session.request').return_value = create_users_list_response(mocker, [('test_user_A_id', 'test_user_A_name')])
+        snapshot_path = tmp_path / 'users.json'
+
+        UserDirectory(snapshot_path=str(snapshot_path)).get_user_id('test_user_A_name')
+        snapshot = json.loads(snapshot_path.read_text())
+        assert snapshot['members'] == [{'id': 'test_user_A_id', 'name': 'test_user_A_name'}]
@@ -4,8 +4,10 @@ from datetime import datetime
 from decimal import Decimal
 import json
 
+from src.db import create_nas_record
 from src.utils import get_last_week_ref_timestamp, get_ref_timestamp,\
-    calc_nas_ranking_this_week, bring_slack_id_from_slack_name, bring_slack_name_from_slack_id
+    count_receive_nas_this_week, select_top_ranking, find_user_rank, bring_slack_id_from_slack_name, bring_slack_name_from_slack_id
+from src.week_calendar import get_week_id
 
 
 def test_get_ref_timestamp():
@@ -45,17 +47,17 @@ def test_get_last_week_ref_timestamp():
     assert ref_timestamp_1 == ref_timestamp_2
 
 
-def test_calc_nas_ranking_this_week(nas_db):
-    """Create a NAS ranking from a NAS record
-    Get the ranking of those who received NAS from NAS records scanned from dynamo db.
-    scan_nas_records() is used for the scan of dynamo db.
+def test_count_receive_nas_this_week(nas_db):
+    """Count the NAS each user received this week
+    The NAS records of this week are grouped by the id of the receiver, so a user who renamed keeps one total.
+    The records carry their week_id, so they are read from one partition of week_id-index by load_week_nas_records().
 
     Returns:
-        dict : nas ranking data
+        dict : received nas number of each receive user id
     """
 
     estimate_nas_ranking = {}
-    assert calc_nas_ranking_this_week() == {}
+    assert count_receive_nas_this_week() == {}
 
     for i in range(3):
         now = datetime.now()
@@ -66,13 +68,14 @@ def test_calc_nas_ranking_this_week(nas_db):
             'receive_user_name': 'test_user_B_name',
             'tip_type': 'stamp',
             'tip_user_name': 'test_user_A_name',
-            'team_id': 'test_team_id'
+            'team_id': 'test_team_id',
+            'week_id': get_week_id()
         }
         nas_db.put_item(Item=nas)
     estimate_nas_ranking = {
-        'test_user_B_name': 3
+        'test_user_B_id': 3
     }
-    assert calc_nas_ranking_this_week() == estimate_nas_ranking
+    assert count_receive_nas_this_week() == estimate_nas_ranking
 
     for i in range(2):
         now = datetime.now()
@@ -80,17 +83,78 @@ def test_calc_nas_ranking_this_week(nas_db):
             'tip_user_id': 'test_user_A_id',
             'time_stamp': Decimal(now.timestamp()),
             'receive_user_id': 'test_user_C_id',
-            'receive_user_name': 'test_user_C_name',
+            'receive_user_name': 'test_user_C_name' if i == 0 else 'test_user_C_new_name',
             'tip_type': 'stamp',
             'tip_user_name': 'test_user_A_name',
-            'team_id': 'test_team_id'
+            'team_id': 'test_team_id',
+            'week_id': get_week_id()
         }
         nas_db.put_item(Item=nas)
     estimate_nas_ranking = {
-        'test_user_B_name': 3,
-        'test_user_C_name': 2
+        'test_user_B_id': 3,
+        'test_user_C_id': 2
     }
-    assert calc_nas_ranking_this_week() == estimate_nas_ranking
+    assert count_receive_nas_this_week() == estimate_nas_ranking
+
+
+def test_count_receive_nas_this_week_from_leaderboard(nas_leaderboard_db):
+    """Read the received NAS of the team from the weekly leaderboard
+    When team_id is given, the precomputed leaderboard of the team is read instead of scanning the NAS records.
+    So the latency does not depend on how many NAS were sent this week.
+
+    Args:
+        team_id : slack team id
+
+    Returns:
+        dict : received nas number of each receive user id
+    """
+    assert count_receive_nas_this_week('test_team_id') == {}
+
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_B_id', 'test_user_B_name', 'stamp', 'test_team_id')
+    create_nas_record('test_user_A_id', 'test_user_A_name', 'test_user_C_id', 'test_user_C_name', 'stamp', 'test_team_id', 3)
+    assert count_receive_nas_this_week('test_team_id') == {'test_user_C_id': 3, 'test_user_B_id': 1}
+
+
+def test_select_top_ranking():
+    """Select the top K of the NAS ranking
+    Only the displayed users are selected with a heap, instead of sorting every receiver of the team.
+    Users with the same number of NAS share the rank, and are ordered by their user id so the ranking is the same every time.
+
+    Args:
+        receive_nas_nums : received nas number of each receive user id
+        top_k : the number of users to select
+
+    Returns:
+        list : (rank, user id, nas number) in the order of the ranking
+    """
+    receive_nas_nums = {'test_user_D_id': 2, 'test_user_B_id': 5, 'test_user_C_id': 2, 'test_user_A_id': 1, 'test_user_E_id': 2}
+    assert select_top_ranking(receive_nas_nums, 4) == [
+        (1, 'test_user_B_id', 5),
+        (2, 'test_user_C_id', 2),
+        (2, 'test_user_D_id', 2),
+        (2, 'test_user_E_id', 2)
+    ]
+    assert select_top_ranking(receive_nas_nums, 10)[-1] == (5, 'test_user_A_id', 1)
+    assert select_top_ranking({}, 10) == []
+
+
+def test_find_user_rank():
+    """Find the rank of one user in the NAS ranking
+    The user who runs /nas_rank sees their own rank even when it is not in the top K.
+    The rank is the same as in select_top_ranking().
+
+    Args:
+        receive_nas_nums : received nas number of each receive user id
+        user_id : slack user id
+
+    Returns:
+        tuple : (rank, nas number). The rank is None if the user received no NAS this week.
+    """
+    receive_nas_nums = {'test_user_B_id': 5, 'test_user_C_id': 2, 'test_user_D_id': 2, 'test_user_A_id': 1}
+    assert find_user_rank(receive_nas_nums, 'test_user_B_id') == (1, 5)
+    assert find_user_rank(receive_nas_nums, 'test_user_D_id') == (2, 2)
+    assert find_user_rank(receive_nas_nums, 'test_user_A_id') == (4, 1)
+    assert find_user_rank(receive_nas_nums, 'test_user_Z_id') == (None, 0)
 
 
 def test_bring_slack_id_from_slack_name(mocker):
@@ -106,7 +170,7 @@ def test_bring_slack_id_from_slack_name(mocker):
     responseMock.status_code = 200
     responseMock.text = json.dumps({'test_user_B_id': 'test_user_B_name'})
 
-    mocker.patch('requests.get').return_value = responseMock
+    mocker.patch('requests.Session.request').return_value = responseMock
     assert bring_slack_id_from_slack_name('test_user_Z_id') == ''
 
 
@@ -123,5 +187,5 @@ def test_bring_slack_name_from_slack_id(mocker):
     responseMock.status_code = 200
     responseMock.text = json.dumps({'test_user_B_id': 'test_user_B_name'})
 
-    mocker.patch('requests.get').return_value = responseMock
+    mocker.patch('requests.Session.request').return_value = responseMock
     assert bring_slack_name_from_slack_id('test_user_Z_id') == ''
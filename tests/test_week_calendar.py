@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytz
+
+from src.week_calendar import WeekCalendar, get_last_week_id, get_last_week_start_timestamp, get_week_id, get_week_start_timestamp
+
+
+def test_get_week_id():
+    """Get the id of the week bucket
+    Weekly aggregates such as the sent NAS counter are keyed by the week.
+    The id is the date of the monday that starts the week, in Japan time.
+    Without arguments the current week is returned.
+
+    Args:
+        time_stamp : the timestamp of a NAS record. Default is now.
+
+    Returns:
+        str : week id. ex) 2020-05-04
+    """
+    timezone = pytz.timezone('Asia/Tokyo')
+    monday = timezone.localize(datetime(2020, 5, 4, 0, 0, 0))
+
+    assert get_week_id(Decimal(monday.timestamp())) == '2020-05-04'
+    assert get_week_id(Decimal((monday + timedelta(days=6, hours=23)).timestamp())) == '2020-05-04'
+    assert get_week_id(Decimal((monday - timedelta(seconds=1)).timestamp())) == '2020-04-27'
+
+
+def test_get_last_week_id():
+    """Get the id of last week
+    Used to read last week's counter for the NAS bonus.
+
+    Returns:
+        str : week id of last week
+    """
+    this_week = datetime.strptime(get_week_id(), '%Y-%m-%d')
+    assert get_last_week_id() == (this_week - timedelta(days=7)).strftime('%Y-%m-%d')
+
+
+def test_week_calendar():
+    """Calendar of the weeks
+    The weeks start at midnight of the week start day in the configured timezone, whatever the timezone of the host is.
+    The bounds of the last week asked are cached, so the boundaries are not computed again for each call in the week.
+
+    Args:
+        timezone_name: NAS_TIMEZONE. Default is Asia/Tokyo.
+        week_start: NAS_WEEK_START. 0 is monday and 6 is sunday. Default is 0.
+    """
+    timezone = pytz.timezone('America/New_York')
+    sunday = timezone.localize(datetime(2020, 5, 3, 0, 0, 0))
+    calendar = WeekCalendar('America/New_York', 6)
+
+    start, end, week_id = calendar.week_bounds(Decimal((sunday + timedelta(days=3)).timestamp()))
+    assert (start, end, week_id) == (sunday.timestamp(), timezone.localize(datetime(2020, 5, 10, 0, 0, 0)).timestamp(), '2020-05-03')
+    assert calendar.week_bounds(sunday.timestamp()) is calendar.week_bounds(end - 1)
+    assert calendar.week_id(end) == '2020-05-10'
+    assert calendar.week_id(start - 1) == '2020-04-26'
+
+
+def test_get_week_start_timestamp():
+    """Get the timestamps at the start of this week and last week
+
+    Returns:
+        Decimal : timestamp of the start of the week
+    """
+    timezone = pytz.timezone('Asia/Tokyo')
+    this_week = timezone.localize(datetime.strptime(get_week_id(), '%Y-%m-%d'))
+    assert get_week_start_timestamp() == Decimal(this_week.timestamp())
+    assert get_last_week_start_timestamp() == Decimal((this_week - timedelta(days=7)).timestamp())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+
+import boto3
+from moto import mock_sqs
+
+from src.work_queue import InProcessWorkQueue, LocalFileWorkQueue, SQSWorkQueue, messages_from_sqs_event
+
+
+def test_sqs_work_queue():
+    """Work queue backed by Amazon SQS
+    lambda_handler enqueues the Slack event and returns at once,
+    and the worker Lambda triggered by the queue runs the command.
+    Messages can be delayed up to 15 minutes with delay_seconds.
+    A received message is deleted by ack() after it is processed.
+    Until then it is hidden, and it comes back after the visibility timeout of the queue.
+
+    Attributes:
+        queue_url: NAS_WORK_QUEUE_URL
+    """
+    with mock_sqs():
+        os.environ['AWS_DEFAULT_REGION'] = 'ap-northeast-1'
+        sqs_client = boto3.client('sqs')
+        queue_url = sqs_client.create_queue(QueueName='nas_work_queue', Attributes={'VisibilityTimeout': '0'})['QueueUrl']
+        work_queue = SQSWorkQueue(queue_url)
+
+        assert work_queue.enqueue({'type': 'event', 'event': {'body': 'sample'}}) is True
+        [(receipt_handle, message)] = work_queue.receive()
+        assert message == {'type': 'event', 'event': {'body': 'sample'}}
+
+        # not acked, so received again
+        [(receipt_handle, message)] = work_queue.receive()
+        assert work_queue.ack(receipt_handle) is True
+        assert work_queue.receive() == []
+
+
+def test_local_file_work_queue(tmp_path):
+    """Work queue backed by a local file
+    Used for testing and running locally without SQS.
+    The messages are appended to a JSON lines file, and receive() takes the messages whose delay has passed.
+    Like SQS, a received message stays in the file until ack(),
+    and it is received again after the visibility timeout.
+
+    Attributes:
+        path: NAS_WORK_QUEUE_PATH
+        visibility_timeout: NAS_WORK_QUEUE_VISIBILITY_TIMEOUT
+    """
+    work_queue = LocalFileWorkQueue(str(tmp_path / 'nas_work_queue.jsonl'), visibility_timeout=0)
+    assert work_queue.receive() == []
+
+    work_queue.enqueue({'type': 'event', 'event': 1})
+    work_queue.enqueue({'type': 'event', 'event': 2}, delay_seconds=60)
+    [(receipt_handle, message)] = work_queue.receive()
+    assert message == {'type': 'event', 'event': 1}
+    assert work_queue.receive() == [(receipt_handle, {'type': 'event', 'event': 1})]
+
+    # hidden from the other workers until the visibility timeout passes
+    assert LocalFileWorkQueue(work_queue.path, visibility_timeout=60).receive() == [(receipt_handle, {'type': 'event', 'event': 1})]
+    assert work_queue.receive() == []
+    assert work_queue.ack(receipt_handle) is True
+    assert work_queue.receive() == []
+    assert len(open(work_queue.path).readlines()) == 1
+
+
+def test_in_process_work_queue():
+    """Work queue kept in memory
+    Messages enqueued in the process are received in the same process, and kept until they are acked.
+    """
+    work_queue = InProcessWorkQueue(visibility_timeout=0)
+    work_queue.enqueue({'type': 'event', 'event': 1})
+    work_queue.enqueue({'type': 'event', 'event': 2}, delay_seconds=60)
+    [(receipt_handle, message)] = work_queue.receive()
+    assert message == {'type': 'event', 'event': 1}
+    assert work_queue.receive() == [(receipt_handle, message)]
+
+    work_queue.ack(receipt_handle)
+    assert work_queue.receive() == []
+    assert len(work_queue.entries) == 1
+
+
+def test_messages_from_sqs_event():
+    """Get the messages from the event of a Lambda triggered by SQS
+
+    Args:
+        event: the Lambda event
+
+    Return:
+        list: (messageId, message)
+    """
+    event = {'Records': [
+        {'messageId': 'message_1', 'body': '{"type": "event", "event": 1}'},
+        {'messageId': 'message_2', 'body': '{"type": "event", "event": 2}'}
+    ]}
+    assert messages_from_sqs_event(event) == [('message_1', {'type': 'event', 'event': 1}), ('message_2', {'type': 'event', 'event': 2})]